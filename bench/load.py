@@ -0,0 +1,252 @@
+"""
+Eşzamanlı kullanıcı yük testi: karışık panel trafiği (dashboard, kârlılık,
+sipariş arama, fatura PDF, maliyet kaydı) + istenirse arkada uzun export.
+
+Varsayılan: mock Trendyol ve uvicorn alt process olarak kalkar (temiz DB):
+    python bench/load.py --users 16 --duration 60 --export-users 1 --lines 50000
+Var olan bir sunucuya karşı (mock'a bağlı olmalı):
+    python bench/load.py --url http://127.0.0.1:8000 --user u --password p
+
+Çıktı: uç nokta başına istek, hata oranı, throughput ve p50/p95/p99/max (ms).
+"""
+import argparse, bisect, json, os, random, re, socket, subprocess, sys, tempfile, threading, time
+from datetime import date, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (ad, ağırlık) — ağırlıklar bir ekip günündeki tıklama dağılımına kaba yaklaşım
+SCENARIOS = [
+    ("dashboard", 30),
+    ("profit", 20),
+    ("orders_search", 20),
+    ("invoice_pdf", 15),
+    ("cost_upsert", 15),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_http(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    t_end = time.time() + timeout
+    while time.time() < t_end:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args[1:3]} çıktı (kod {proc.returncode})")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} ayağa kalkmadı")
+
+
+def start_stack(a, procs: list) -> str:
+    """mock_trendyol + uvicorn alt process'lerini procs'a ekler, app url'ini döner."""
+    mock_port, app_port = free_port(), free_port()
+    procs.append(subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "mock_trendyol.py"), "--port", str(mock_port),
+         "--lines", str(a.lines), "--days", str(a.days), "--latency-ms", str(a.latency_ms)],
+        stdout=subprocess.DEVNULL,
+    ))
+    wait_http(f"http://127.0.0.1:{mock_port}/__stats", procs[-1])
+    tmp = tempfile.mkdtemp(prefix="load_")
+    env = dict(
+        os.environ,
+        TRENDYOL_BASE_URL=f"http://127.0.0.1:{mock_port}",
+        TRENDYOL_API_KEY="load", TRENDYOL_API_SECRET="load", TRENDYOL_SELLER_ID="1",
+        TRENDYOL_RPS=os.getenv("TRENDYOL_RPS", "0"),
+        SYNC_INTERVAL_SECONDS=os.getenv("SYNC_INTERVAL_SECONDS", "0"),
+        PANEL_USER=a.user, PANEL_PASS=a.password,
+        DB_PATH=os.path.join(tmp, "data.db"), JOB_DIR=os.path.join(tmp, "jobs"),
+    )
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--workers", str(a.workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    ))
+    url = f"http://127.0.0.1:{app_port}"
+    wait_http(f"{url}/health", procs[-1])
+    return url
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, dict] = {}
+
+    def add(self, name: str, ms: float, error: str = ""):
+        with self.lock:
+            if error:
+                e = self.errors.setdefault(name, {})
+                e[error] = e.get(error, 0) + 1
+            else:
+                bisect.insort(self.samples.setdefault(name, []), ms)
+
+    def report(self, elapsed: float) -> list[dict]:
+        out = []
+        for name in sorted(set(self.samples) | set(self.errors)):
+            xs = self.samples.get(name, [])
+            errs = sum(self.errors.get(name, {}).values())
+            total = len(xs) + errs
+
+            def pct(p):
+                return xs[min(len(xs) - 1, int(p / 100 * len(xs)))] if xs else float("nan")
+
+            out.append({
+                "endpoint": name, "requests": total, "errors": errs,
+                "error_rate": round(errs / total, 4) if total else 0.0,
+                "rps": round(total / elapsed, 2),
+                "p50_ms": round(pct(50), 1), "p95_ms": round(pct(95), 1),
+                "p99_ms": round(pct(99), 1), "max_ms": round(xs[-1], 1) if xs else float("nan"),
+                "error_kinds": self.errors.get(name, {}),
+            })
+        return out
+
+
+class Traffic:
+    def __init__(self, url: str, auth: tuple, rec: Recorder, a):
+        self.url, self.auth, self.rec, self.a = url, auth, rec, a
+        today = date.today()
+        self.week = f"start={(today - timedelta(days=6)).isoformat()}&end={today.isoformat()}"
+        self.month = f"start={(today - timedelta(days=30)).isoformat()}&end={today.isoformat()}"
+        self.quarter = f"start={(today - timedelta(days=a.days)).isoformat()}&end={today.isoformat()}"
+        self.invoice_ids: list[int] = []
+
+    def call(self, s: requests.Session, name: str, method: str, path: str, **kw):
+        t0 = time.perf_counter()
+        try:
+            r = s.request(method, self.url + path, auth=self.auth, timeout=self.a.timeout,
+                          allow_redirects=False, **kw)
+            _ = r.content
+            err = "" if r.status_code < 400 else f"HTTP {r.status_code}"
+        except requests.RequestException as e:
+            r, err = None, type(e).__name__
+        self.rec.add(name, (time.perf_counter() - t0) * 1000, err)
+        return r
+
+    def setup(self):
+        """Fatura PDF senaryosu için birkaç taslak aç (mock sipariş numaraları 10000000+)."""
+        s = requests.Session()
+        for i in range(self.a.invoices):
+            self.call(s, "setup_invoice_draft", "POST", "/invoice/draft", data={"orderNumber": str(10_000_000 + i)})
+        r = s.get(self.url + "/app/invoices", auth=self.auth, timeout=self.a.timeout)
+        self.invoice_ids = sorted({int(x) for x in re.findall(r"/invoice/(\d+)/pdf", r.text)})
+
+    # ---- senaryolar ----
+    def dashboard(self, s, rnd):
+        # /app iskeleti + sayfanın JS ile çektiği haftalık özet
+        self.call(s, "GET /app", "GET", "/app")
+        self.call(s, "GET /report (7g)", "GET", f"/report?{self.week}")
+
+    def profit(self, s, rnd):
+        group = rnd.choice(("sku", "order"))
+        self.call(s, "GET /app/profit", "GET", f"/app/profit?{self.month}&group={group}")
+
+    def orders_search(self, s, rnd):
+        q = str(10_000_000 + rnd.randrange(0, 2000))
+        self.call(s, "GET /app/orders?q", "GET", f"/app/orders?q={q}&days=14")
+
+    def invoice_pdf(self, s, rnd):
+        if not self.invoice_ids:
+            return self.dashboard(s, rnd)
+        self.call(s, "GET /invoice/{id}/pdf", "GET", f"/invoice/{rnd.choice(self.invoice_ids)}/pdf")
+
+    def cost_upsert(self, s, rnd):
+        sku = f"SKU-{rnd.randrange(12):03d}"
+        self.call(s, "POST /costs/upsert", "POST", "/costs/upsert",
+                  data={"merchant_sku": sku, "cost": f"{rnd.uniform(40, 600):.2f}"})
+
+    def user(self, idx: int, stop: threading.Event):
+        rnd = random.Random(self.a.seed + idx)
+        s = requests.Session()
+        names = [n for n, _ in SCENARIOS]
+        weights = [w for _, w in SCENARIOS]
+        while not stop.is_set():
+            getattr(self, rnd.choices(names, weights)[0])(s, rnd)
+            if self.a.think_ms:
+                stop.wait(rnd.expovariate(1000.0 / self.a.think_ms))
+
+    def exporter(self, idx: int, stop: threading.Event):
+        s = requests.Session()
+        while not stop.is_set():
+            self.call(s, "GET /report/excel (export)", "GET", f"/report/excel?{self.quarter}")
+
+
+def print_table(rows: list[dict], elapsed: float):
+    print(f"\n{'uç nokta':<28}{'istek':>7}{'hata%':>7}{'rps':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for r in rows:
+        print(f"{r['endpoint']:<28}{r['requests']:>7}{r['error_rate'] * 100:>6.1f}%{r['rps']:>7.2f}"
+              f"{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}{r['max_ms']:>9.0f}")
+        for kind, n in r["error_kinds"].items():
+            print(f"{'':<6}{kind}: {n}")
+    total = sum(r["requests"] for r in rows if not r["endpoint"].startswith("setup"))
+    print(f"\ntoplam {total} istek / {elapsed:.1f} sn = {total / elapsed:.2f} rps")
+
+
+def main_():
+    ap = argparse.ArgumentParser(description="Panel yük testi")
+    ap.add_argument("--url", default="", help="var olan sunucu; boşsa mock + uvicorn başlatılır")
+    ap.add_argument("--user", default="load")
+    ap.add_argument("--password", default="load")
+    ap.add_argument("--users", type=int, default=8, help="eşzamanlı panel kullanıcısı")
+    ap.add_argument("--export-users", type=int, default=0, help="sürekli /report/excel çeken kullanıcı")
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--ramp", type=float, default=2.0, help="kullanıcıları bu sürede kademeli başlat (sn)")
+    ap.add_argument("--think-ms", type=float, default=200.0, help="istekler arası ortalama bekleme")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--invoices", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker sayısı (kendi başlattığında)")
+    ap.add_argument("--lines", type=int, default=20_000, help="mock sipariş satırı")
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="mock upstream gecikmesi")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", default="")
+    a = ap.parse_args()
+
+    procs = []
+    try:
+        url = a.url.rstrip("/")
+        if not url:
+            url = start_stack(a, procs)
+        rec = Recorder()
+        traffic = Traffic(url, (a.user, a.password), rec, a)
+        traffic.setup()
+
+        stop = threading.Event()
+        threads = [threading.Thread(target=traffic.exporter, args=(i, stop), daemon=True) for i in range(a.export_users)]
+        threads += [threading.Thread(target=traffic.user, args=(i, stop), daemon=True) for i in range(a.users)]
+        print(f"{url}: {a.users} kullanıcı + {a.export_users} export, {a.duration:g} sn ...")
+        t0 = time.perf_counter()
+        for i, t in enumerate(threads):
+            t.start()
+            if a.ramp and len(threads) > 1:
+                time.sleep(a.ramp / len(threads))
+        time.sleep(max(0.0, a.duration - (time.perf_counter() - t0)))
+        stop.set()
+        for t in threads:
+            t.join(timeout=a.timeout)
+        elapsed = time.perf_counter() - t0
+
+        rows = rec.report(elapsed)
+        print_table(rows, elapsed)
+        if a.json:
+            with open(a.json, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(a), "elapsed_s": round(elapsed, 2), "endpoints": rows}, f, ensure_ascii=False, indent=2)
+            print(f"-> {a.json}")
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+if __name__ == "__main__":
+    main_()
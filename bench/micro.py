@@ -0,0 +1,155 @@
+"""
+Sıcak yardımcı fonksiyonlar için mikro benchmark + regresyon eşiği.
+
+    python bench/micro.py                    # ölç, baseline varsa karşılaştır
+    python bench/micro.py --save             # sonucu baseline olarak yaz
+    python bench/micro.py --threshold 0.3    # %30'dan fazla yavaşlama = hata (exit 1)
+    python bench/micro.py --only parse       # sadece adı eşleşenler
+
+Baseline makineye özeldir (bench/micro_baseline.json); aynı makinede
+değişiklik öncesi --save, sonrası düz çalıştırma ile karşılaştırılır.
+Süre: her vaka için timeit autorange, --repeat tekrarın en iyisi (çağrı başına µs).
+"""
+import argparse, json, os, sys, tempfile, timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_trendyol import OrderBook
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+
+
+def fixtures() -> dict:
+    book = OrderBook(lines=1000, days=30, seed=7, anchor_ms=1_700_000_000_000)
+    # i % 15 == 0 -> 3 satırlı sipariş; discountDetails'li satırı olan ilk sipariş
+    multi = book.order(15)
+    plain_line = {
+        "productName": "Pamuklu Tişört", "merchantSku": "SKU-000", "quantity": 1,
+        "price": 249.90, "commission": 37.49, "salesCampaignId": 2, "discountDetails": [],
+    }
+    heavy_line = dict(plain_line, lineSellerDiscount=None, discountDetails=[
+        {"lineItemPrice": 11.9, "lineItemSellerDiscount": 0.5, "lineItemTyDiscount": 0.25} for _ in range(20)
+    ])
+    # fiyat alanı yok: get_sale_price birim fiyat * adet yoluna düşer
+    unit_line = {"productName": "Kot Pantolon", "quantity": 3, "unitPrice": 599.0, "commissionAmount": 90.0}
+    discounted = next(l for i in range(200) for l in book.order(i)["lines"] if len(l["discountDetails"]) >= 3)
+
+    def invoice(order: dict, repeat: int = 1):
+        lines = [
+            {"name": l["productName"], "quantity": l["quantity"], "unit_price": l["price"] / l["quantity"],
+             "line_total": l["price"], "vat_rate": 10.0}
+            for l in order["lines"] * repeat
+        ]
+        subtotal = sum(l["line_total"] for l in lines)
+        addr = order["invoiceAddress"]
+        inv = {
+            "invoice_uuid": "00000000-0000-0000-0000-000000000000", "issue_date": "2024-01-01",
+            "order_number": order["orderNumber"], "customer_name": addr["fullName"],
+            "customer_vkn_tckn": addr["taxNumber"], "customer_address": addr["fullAddress"],
+            "customer_city": addr["city"], "customer_district": addr["district"], "currency": "TRY",
+            "subtotal": subtotal, "vat_rate": 10.0, "vat_amount": subtotal * 0.1, "total": subtotal * 1.1,
+        }
+        return inv, lines
+
+    return {
+        "plain_line": plain_line,
+        "heavy_line": heavy_line,
+        "unit_line": unit_line,
+        "discounted_line": discounted,
+        "multi_order": multi,
+        "sparse_order": {"orderNumber": "1", "customerFirstName": "Ayşe", "customerLastName": "Yılmaz"},
+        "invoice_small": invoice(multi),
+        "invoice_large": invoice(multi, repeat=20),  # 60 satır, PDF'te sayfa geçişi
+    }
+
+
+def cases(main, fx: dict) -> list[tuple[str, callable]]:
+    def pdf(inv, lines):
+        def run():
+            os.unlink(main.build_pdf(inv, lines))
+        return run
+
+    multi_lines = fx["multi_order"]["lines"]
+    return [
+        ("pick[hit-first]", lambda: main.pick(fx["plain_line"], ["price", "amount", "lineGrossAmount"])),
+        ("pick[miss]", lambda: main.pick(fx["plain_line"], ["lineGrossAmount", "totalPrice", "totalAmount"])),
+        ("get_sale_price[price]", lambda: main.get_sale_price(fx["plain_line"])),
+        ("get_sale_price[unit*qty]", lambda: main.get_sale_price(fx["unit_line"])),
+        ("parse_discounts[none]", lambda: main.parse_discounts(fx["plain_line"])),
+        ("parse_discounts[details]", lambda: main.parse_discounts(fx["discounted_line"])),
+        ("parse_discounts[heavy20]", lambda: main.parse_discounts(fx["heavy_line"])),
+        ("calc_profit_for_line[plain]", lambda: main.calc_profit_for_line(fx["plain_line"])),
+        ("calc_profit_for_line[heavy20]", lambda: main.calc_profit_for_line(fx["heavy_line"])),
+        ("calc_profit_for_line[order x3]", lambda: [main.calc_profit_for_line(l) for l in multi_lines]),
+        ("extract_customer[full]", lambda: main.extract_customer_from_order(fx["multi_order"])),
+        ("extract_customer[fallback]", lambda: main.extract_customer_from_order(fx["sparse_order"])),
+        ("build_basic_ubl_xml[3 satır]", lambda: main.build_basic_ubl_xml(*fx["invoice_small"])),
+        ("build_basic_ubl_xml[60 satır]", lambda: main.build_basic_ubl_xml(*fx["invoice_large"])),
+        ("build_pdf[3 satır]", pdf(*fx["invoice_small"])),
+        ("build_pdf[60 satır]", pdf(*fx["invoice_large"])),
+    ]
+
+
+def measure(fn, repeat: int) -> float:
+    """Çağrı başına en iyi süre (µs)."""
+    t = timeit.Timer(fn)
+    number, _ = t.autorange()
+    return min(t.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main_():
+    ap = argparse.ArgumentParser(description="Sıcak yardımcılar için mikro benchmark")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.20")),
+                    help="baseline'a göre izin verilen yavaşlama oranı (0.20 = %%20)")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save", action="store_true", help="sonuçları baseline olarak kaydet")
+    ap.add_argument("--only", default="")
+    a = ap.parse_args()
+
+    os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_"), "data.db"))
+    import main
+
+    baseline = {}
+    if os.path.exists(a.baseline) and not a.save:
+        with open(a.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results, regressions = {}, []
+    print(f"{'vaka':<34}{'µs/çağrı':>12}{'baseline':>12}{'fark':>9}")
+    for name, fn in cases(main, fixtures()):
+        if a.only and a.only not in name:
+            continue
+        us = measure(fn, a.repeat)
+        results[name] = round(us, 3)
+        base = baseline.get(name)
+        if base:
+            delta = us / base - 1
+            flag = "  <-- REGRESYON" if delta > a.threshold else ""
+            if flag:
+                regressions.append((name, delta))
+            print(f"{name:<34}{us:>12.2f}{base:>12.2f}{delta:>+8.0%}{flag}")
+        else:
+            print(f"{name:<34}{us:>12.2f}{'-':>12}{'':>9}")
+
+    if a.save:
+        merged = {}
+        if os.path.exists(a.baseline):
+            with open(a.baseline, encoding="utf-8") as f:
+                merged = json.load(f).get("results", {})
+        merged.update(results)
+        with open(a.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": merged}, f, ensure_ascii=False, indent=2)
+        print(f"\nbaseline kaydedildi -> {a.baseline}")
+        return
+
+    if regressions:
+        print(f"\n{len(regressions)} vaka eşiği (%{a.threshold * 100:.0f}) aştı:")
+        for name, delta in regressions:
+            print(f"  {name}: {delta:+.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,138 @@
+"""
+Uçtan uca ölçek benchmark'ı: mock Trendyol (mock_trendyol.py) üzerinde
+/report, /report/lines, /report/excel, /app/profit, /app/campaigns ve
+find_order_by_number'ı farklı veri hacimlerinde koşturur.
+
+    python bench/scaling.py --scales 1000,10000,100000 --repeat 3
+    python bench/scaling.py --scales 1000000 --latency-ms 80 --json out.json
+
+Her hedef için: gecikme (median / max, sn), tepe bellek (tracemalloc, MB,
+ayrı bir turda ölçülür) ve upstream çağrı sayısı (istek / sayfa / 429).
+"""
+import argparse, json, logging, os, statistics, sys, tempfile, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_trendyol import MockTrendyol
+
+AUTH = ("bench", "bench")
+
+
+def setup_env(mock: MockTrendyol):
+    # main import edilmeden önce: ayarlar modül seviyesinde okunuyor
+    os.environ["TRENDYOL_BASE_URL"] = mock.base_url
+    os.environ.setdefault("TRENDYOL_API_KEY", "bench")
+    os.environ.setdefault("TRENDYOL_API_SECRET", "bench")
+    os.environ.setdefault("TRENDYOL_SELLER_ID", "1")
+    os.environ.setdefault("TRENDYOL_RPS", "0")  # uygulama maliyetini ölç, kota beklemesini değil
+    os.environ.setdefault("SYNC_INTERVAL_SECONDS", "0")  # arka plan senkronu ölçümü kirletmesin
+    # tekrarlar paylaşılan önbellekten dönmesin: her tur gerçek tarama + hesap
+    os.environ.setdefault("ORDERS_CACHE_TTL", "0")
+    os.environ.setdefault("REPORT_CACHE_TTL", "0")
+    os.environ["PANEL_USER"], os.environ["PANEL_PASS"] = AUTH
+    os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_"), "data.db"))
+    os.environ.setdefault("JOB_DIR", os.path.join(os.path.dirname(os.environ["DB_PATH"]), "jobs"))
+
+
+def targets(main, client, days: int, book):
+    end = main.date.today()
+    start = end - main.timedelta(days=days)
+    rng = f"start={start.isoformat()}&end={end.isoformat()}"
+    # son siparişin numarası: hızlı yol (orderNumber filtresi) bulur
+    recent = book.order_number(0)
+    # olmayan numara: 365 günlük derin taramaya düşer
+    missing = "99999999999"
+
+    def get(path):
+        def run():
+            r = client.get(path, auth=AUTH)
+            if r.status_code != 200:
+                raise RuntimeError(f"{path}: HTTP {r.status_code} {r.text[:200]}")
+            return len(r.content)
+        return run
+
+    return [
+        ("/report", get(f"/report?{rng}")),
+        ("/report/lines", get(f"/report/lines?{rng}")),
+        ("/report/excel", get(f"/report/excel?{rng}")),
+        ("/app/profit", get(f"/app/profit?{rng}")),
+        ("/app/campaigns", get(f"/app/campaigns?{rng}")),
+        ("find_order (hızlı)", lambda: main.find_order_by_number(recent, deep=False)),
+        ("find_order (derin, yok)", lambda: main.find_order_by_number(missing, deep=True)),
+    ]
+
+
+def measure(fn, mock: MockTrendyol, repeat: int, memory: bool) -> dict:
+    times = []
+    mock.reset()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    calls = mock.stats()
+    out = {
+        "median_s": round(statistics.median(times), 4),
+        "max_s": round(max(times), 4),
+        "upstream_requests": calls["requests"] // repeat,
+        "upstream_pages": calls["pages"] // repeat,
+        "upstream_throttled": calls["throttled"] // repeat,
+    }
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            out["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        finally:
+            tracemalloc.stop()
+    return out
+
+
+def main_():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--scales", default="1000,10000,100000", help="virgülle ayrılmış satır sayıları")
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--only", default="", help="sadece adı bu metni içeren hedefler")
+    ap.add_argument("--no-memory", action="store_true", help="tracemalloc turunu atla")
+    ap.add_argument("--json", default="", help="sonuçları JSON dosyasına yaz")
+    a = ap.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    mock = MockTrendyol(latency_ms=a.latency_ms, rate_429=a.rate_429).start()
+    setup_env(mock)
+    import main
+    from fastapi.testclient import TestClient
+
+    results = []
+    with TestClient(main.app) as client:
+        for scale in [int(x) for x in a.scales.split(",") if x.strip()]:
+            mock.configure(lines=scale, days=a.days)
+            main.WATERMARK_STATE["orders_checked"].clear()
+            st = mock.stats()
+            print(f"\n== {scale} satır ({st['book_orders']} sipariş, {a.days} gün) ==")
+            print(f"{'hedef':<26}{'median s':>10}{'max s':>10}{'peak MB':>10}{'istek':>8}{'sayfa':>8}{'429':>6}")
+            for name, fn in targets(main, client, a.days, mock.book):
+                if a.only and a.only not in name:
+                    continue
+                try:
+                    r = measure(fn, mock, a.repeat, not a.no_memory)
+                except Exception as e:
+                    print(f"{name:<26}HATA: {e}")
+                    results.append({"scale": scale, "target": name, "error": str(e)})
+                    continue
+                results.append({"scale": scale, "target": name, **r})
+                print(f"{name:<26}{r['median_s']:>10.3f}{r['max_s']:>10.3f}{r.get('peak_mb', float('nan')):>10.1f}"
+                      f"{r['upstream_requests']:>8}{r['upstream_pages']:>8}{r['upstream_throttled']:>6}")
+    mock.stop()
+
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(a), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n-> {a.json}")
+
+
+if __name__ == "__main__":
+    main_()
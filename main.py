@@ -1,48 +1,767 @@
-from fastapi import Request, FastAPI, Depends, HTTPException, status, Query, Form
+from fastapi import Request, Response, FastAPI, Depends, HTTPException, status, Query, Form
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, PlainTextResponse
-import os, base64, requests, tempfile, sqlite3, uuid
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, PlainTextResponse, StreamingResponse
+from starlette.requests import HTTPConnection
+import os, io, base64, requests, httpx, tempfile, sqlite3, uuid, logging, traceback
+import csv, json, heapq, threading, time, hashlib, zlib, sys, asyncio, html, secrets, contextvars, collections, functools
+from contextlib import contextmanager
+from email.utils import format_datetime, parsedate_to_datetime
 from datetime import datetime, date, timedelta
 from openpyxl import Workbook
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from typing import Optional
+from urllib.parse import quote, urlencode
 from xml.etree.ElementTree import Element, SubElement, tostring
 
+try:
+    import brotli  # opsiyonel: kuruluysa "br" de sunulur
+except ImportError:
+    brotli = None
+
 app = FastAPI(title="Trendyol Kar/Zarar + e-Arşiv Taslak (Sağlam)")
 
 logger = logging.getLogger("app")
 logging.basicConfig(level=logging.INFO)
 
-LAST_ERROR = {"text": ""}
-
 @app.middleware("http")
 async def catch_exceptions(request: Request, call_next):
     try:
         return await call_next(request)
     except Exception:
         tb = traceback.format_exc()
-        msg = f"ERROR on {request.method} {request.url}\n\n{tb}"
-        LAST_ERROR["text"] = msg
-        logger.error(msg)
+        record_error(f"ERROR on {request.method} {request.url}\n\n{tb}")
         return PlainTextResponse("Internal Server Error\n\n" + tb, status_code=500)
 
 @app.get("/debug/last-error", response_class=PlainTextResponse)
 def debug_last_error():
-    return LAST_ERROR["text"] or "No error captured yet. Open /app to reproduce."
+    text = CACHE.get("last_error")
+    return text.decode() if text else "No error captured yet. Open /app to reproduce."
+
+
+# =========================
+# SIKIŞTIRMA (gzip / br)
+# =========================
+# /report/lines JSON'u ve büyük /app tabloları (Tailwind class'ları, tekrar eden
+# anahtarlar) çok iyi sıkışıyor. Pure ASGI middleware: eşik altını ve zaten
+# sıkışık içerikleri (xlsx/pdf) olduğu gibi geçirir; stream edilen HTML'de her
+# chunk flush edilir ki tarayıcı satırları beklemeden görsün.
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESSIBLE_TYPES = ("text/html", "text/plain", "text/csv", "application/json", "application/xml", "application/javascript")
+
+def _pick_encoding(accept: str) -> str:
+    prefs = {}
+    for part in (accept or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            prefs[name.strip().lower()] = q
+    for enc in (("br",) if brotli is not None else ()) + ("gzip",):
+        if prefs.get(enc, prefs.get("*", 0.0)) > 0:
+            return enc
+    return ""
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=min(COMPRESS_LEVEL, 11))
+        else:
+            self._c = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush()
+
+def _with_vary(headers: list) -> list:
+    """Vary'ye Accept-Encoding ekler (varsa mevcut değerlerle birleştirir, tekrar etmez)."""
+    out, values = [], []
+    for k, v in headers:
+        if k.lower() == b"vary":
+            values += [x.strip() for x in v.split(b",") if x.strip()]
+        else:
+            out.append((k, v))
+    if not any(x.lower() in (b"accept-encoding", b"*") for x in values):
+        values.append(b"Accept-Encoding")
+    return out + [(b"vary", b", ".join(values))]
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        encoding = _pick_encoding(headers.get("accept-encoding", ""))
+        state = {"start": None, "buf": b"", "encoder": None, "passthrough": False}
+
+        async def send_start(compress: bool):
+            # sıkıştırılabilir tipte cevap, sıkıştırılsın ya da sıkıştırılmasın Accept-Encoding'e
+            # göre değişebilir: eşik altı / Accept-Encoding'siz istemciye giden de Vary taşır,
+            # yoksa paylaşılan önbellek düz gövdeyi gzip isteyen istemciye de verir
+            msg = {**state["start"], "headers": _with_vary(state["start"].get("headers") or [])}
+            if compress:
+                hdrs = [(k, v) for k, v in msg["headers"] if k.lower() not in (b"content-length", b"etag")]
+                for k, v in msg["headers"]:
+                    if k.lower() == b"etag" and not v.startswith(b"W/"):
+                        # temsil değişti: güçlü ETag zayıflatılır (If-None-Match W/ öneki tolere ediliyor)
+                        hdrs.append((b"etag", b"W/" + v))
+                    elif k.lower() == b"etag":
+                        hdrs.append((k, v))
+                hdrs.append((b"content-encoding", encoding.encode()))
+                msg = {**msg, "headers": hdrs}
+            await send(msg)
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                resp_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message.get("headers") or []}
+                ctype = resp_headers.get("content-type", "").split(";")[0].strip().lower()
+                if (message["status"] in (204, 304) or "content-encoding" in resp_headers
+                        or not ctype.startswith(COMPRESSIBLE_TYPES)):
+                    state["passthrough"] = True
+                    await send(message)
+                elif not encoding:
+                    state["passthrough"] = True
+                    await send_start(False)
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            enc = state["encoder"]
+            if enc is None:
+                state["buf"] += body
+                if more and len(state["buf"]) < self.minimum_size:
+                    return  # eşiğe ulaşana kadar biriktir
+                if not more and len(state["buf"]) < self.minimum_size:
+                    await send_start(False)
+                    return await send({"type": "http.response.body", "body": state["buf"], "more_body": False})
+                enc = state["encoder"] = _Encoder(encoding)
+                await send_start(True)
+                body, state["buf"] = state["buf"], b""
+            data = enc.chunk(body) if more else enc.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, wrapped_send)
+
+app.add_middleware(CompressionMiddleware)
+
+
+# =========================
+# METRİKLER (/metrics, Prometheus text formatı)
+# =========================
+# Hangi endpoint / Trendyol sayfası / SQL sorgusu zaman yiyor görmek için.
+# Bağımlılık eklememek için küçük bir kayıt defteri: counter, gauge, histogram.
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+METRICS_LOCK = threading.Lock()
+METRICS: dict = {}
+PROCESS_STARTED = time.time()
+
+class _Metric:
+    def __init__(self, name: str, help_text: str, kind: str, buckets: tuple = ()):
+        self.name, self.help, self.kind, self.buckets = name, help_text, kind, buckets
+        self.values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def add(self, value: float, labels: dict):
+        key = self._key(labels)
+        with METRICS_LOCK:
+            if self.kind == "histogram":
+                h = self.values.get(key)
+                if h is None:
+                    h = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+                for i, b in enumerate(self.buckets):
+                    if value <= b:
+                        h[i] += 1
+                h[-2] += value
+                h[-1] += 1
+            elif self.kind == "gauge":
+                self.values[key] = value
+            else:
+                self.values[key] = self.values.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with METRICS_LOCK:
+            items = list(self.values.items())
+        for labels, v in sorted(items):
+            if self.kind == "histogram":
+                for i, b in enumerate(self.buckets):
+                    out.append(f"{self.name}_bucket{fmt(labels, [('le', repr(float(b)))])} {v[i]}")
+                out.append(f"{self.name}_bucket{fmt(labels, [('le', '+Inf')])} {v[-1]}")
+                out.append(f"{self.name}_sum{fmt(labels)} {v[-2]:.6f}")
+                out.append(f"{self.name}_count{fmt(labels)} {v[-1]}")
+            else:
+                out.append(f"{self.name}{fmt(labels)} {v}")
+        return out
+
+def _metric(name: str, help_text: str, kind: str, buckets: tuple = ()) -> _Metric:
+    m = METRICS.get(name)
+    if m is None:
+        m = METRICS[name] = _Metric(name, help_text, kind, buckets)
+    return m
+
+def metric_inc(name: str, value: float = 1.0, **labels):
+    METRICS[name].add(value, labels)
+
+def metric_observe(name: str, value: float, **labels):
+    METRICS[name].add(value, labels)
+
+def metric_set(name: str, value: float, **labels):
+    METRICS[name].add(value, labels)
+
+_metric("http_request_duration_seconds", "HTTP istek süresi (route template + status).", "histogram", HTTP_BUCKETS)
+_metric("http_requests_in_flight", "Şu an işlenen HTTP istekleri.", "gauge")
+_metric("trendyol_request_duration_seconds", "Trendyol API sayfa isteği süresi.", "histogram", HTTP_BUCKETS)
+_metric("trendyol_response_bytes_total", "Trendyol API'den okunan byte.", "counter")
+_metric("trendyol_pages_total", "Başarıyla çekilen Trendyol sayfası.", "counter")
+_metric("trendyol_retries_total", "Trendyol isteği tekrar denemeleri (429/5xx/bağlantı).", "counter")
+_metric("trendyol_errors_total", "Trendyol isteği hataları (status=HTTP kodu veya 'conn').", "counter")
+_metric("cache_requests_total", "Önbellek sorguları (cache=etag|shared, result=hit|miss).", "counter")
+_metric("db_query_duration_seconds", "SQLite sorgu süresi (op=SELECT/INSERT/...).", "histogram", DB_BUCKETS)
+_metric("threadpool_threads_busy", "Sync endpoint threadpool'unda dolu thread.", "gauge")
+_metric("threadpool_threads_total", "Sync endpoint threadpool kapasitesi.", "gauge")
+_metric("jobs_queue_depth", "Kuyrukta bekleyen arka plan işi.", "gauge")
+_metric("process_uptime_seconds", "Process çalışma süresi.", "gauge")
+
+class MetricsMiddleware:
+    """Süre, response'un son byte'ı gidene kadar ölçülür (stream edilen sayfalar dahil)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        state = {"status": 500, "done": False}
+        in_flight = METRICS["http_requests_in_flight"]
+        in_flight.add(in_flight.values.get((), 0) + 1, {})
+
+        def finish():
+            if state["done"]:
+                return
+            state["done"] = True
+            in_flight.add(in_flight.values.get((), 1) - 1, {})
+            route = scope.get("route")
+            metric_observe("http_request_duration_seconds", time.perf_counter() - t0,
+                           route=getattr(route, "path", "unmatched"), method=scope.get("method", ""),
+                           status=state["status"])
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            finish()
+
+app.add_middleware(MetricsMiddleware)
+
+
+# =========================
+# KABUL KONTROLÜ (route sınıfı başına eşzamanlılık)
+# =========================
+# On kullanıcı aynı anda 365 günlük tarama başlatınca hem Trendyol'a yükleniyor
+# hem RAM'i bitiriyordu. Her route bir sınıfa düşer; sınıfın aynı anda çalışan
+# istek limiti, sınırlı bir bekleme kuyruğu ve en uzun bekleme süresi var.
+# Kuyruk doluysa 429, beklerken süre dolarsa 503 (ikisi de Retry-After ile).
+# health sınıfı limitsiz: yük altında izleme / debug ucu kapanmasın.
+ADMISSION_ROUTES = (
+    ("/health", "health"), ("/metrics", "health"), ("/debug/", "health"),
+    ("/events", "stream"),  # uzun ömürlü SSE: kapıdan geçmez, EVENTS_MAX_CLIENTS ile sınırlı
+    ("/report/excel", "export"),
+    ("/report", "heavy"), ("/app/profit", "heavy"), ("/app/payouts", "heavy"),
+    ("/app/campaigns", "heavy"), ("/app/returns", "heavy"), ("/app/orders", "heavy"),
+)
+
+def _class_map(env: str, default: str) -> dict:
+    out = {}
+    for part in os.getenv(env, default).split(","):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip():
+            out[k.strip()] = float(v)
+    return out
+
+ADMISSION_LIMITS = _class_map("ADMISSION_LIMITS", "heavy=4,export=2,light=32")
+ADMISSION_QUEUE = _class_map("ADMISSION_QUEUE", "heavy=16,export=4,light=64")
+ADMISSION_WAIT = _class_map("ADMISSION_WAIT", "heavy=15,export=5,light=10")
+
+_metric("admission_active", "Route sınıfında şu an çalışan istek.", "gauge")
+_metric("admission_waiting", "Route sınıfında kuyrukta bekleyen istek.", "gauge")
+_metric("admission_rejected_total", "Kabul edilmeyen istekler (reason=queue_full|timeout).", "counter")
+_metric("admission_wait_seconds", "Kuyrukta bekleme süresi.", "histogram", HTTP_BUCKETS)
+
+def route_class(path: str) -> str:
+    for prefix, cls in ADMISSION_ROUTES:
+        if path == prefix or path.startswith(prefix if prefix.endswith("/") else prefix + "/"):
+            return cls
+    return "light"
+
+class AdmissionGate:
+    """Event loop üzerinde çalışan FIFO semafor; kilide gerek yok (tek thread)."""
+
+    def __init__(self, name: str, limit: int, queue: int, wait: float):
+        self.name, self.limit, self.queue, self.wait = name, limit, queue, wait
+        self.active = 0
+        self.waiters = collections.deque()
+
+    def _publish(self):
+        metric_set("admission_active", self.active, cls=self.name)
+        metric_set("admission_waiting", len(self.waiters), cls=self.name)
+
+    async def acquire(self) -> Optional[str]:
+        """None: kabul; aksi halde red sebebi (queue_full | timeout)."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self._publish()
+            return None
+        if len(self.waiters) >= self.queue:
+            return "queue_full"
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        self._publish()
+        t0 = time.perf_counter()
+        try:
+            # release() slotu doğrudan bu future'a devreder (active artırılmış olarak)
+            await asyncio.wait_for(fut, self.wait)
+            return None
+        except asyncio.TimeoutError:
+            return "timeout"
+        except asyncio.CancelledError:
+            # istemci koptu; slot tam o sırada devredildiyse geri ver
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        finally:
+            if fut in self.waiters:
+                self.waiters.remove(fut)
+            metric_observe("admission_wait_seconds", time.perf_counter() - t0, cls=self.name)
+            self._publish()
+
+    def release(self):
+        while self.waiters:
+            fut = self.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    def retry_after(self) -> int:
+        return max(1, int(self.wait))
+
+ADMISSION_GATES = {
+    cls: AdmissionGate(cls, int(ADMISSION_LIMITS[cls]), int(ADMISSION_QUEUE.get(cls, 0)), ADMISSION_WAIT.get(cls, 10.0))
+    for cls in ADMISSION_LIMITS
+}
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        gate = ADMISSION_GATES.get(route_class(scope.get("path", ""))) if scope["type"] == "http" else None
+        if gate is None:
+            return await self.app(scope, receive, send)
+        reason = await gate.acquire()
+        if reason:
+            metric_inc("admission_rejected_total", cls=gate.name, reason=reason)
+            code = 429 if reason == "queue_full" else 503
+            body = json.dumps({"detail": "Sunucu şu an yoğun, lütfen biraz sonra tekrar deneyin."}, ensure_ascii=False).encode()
+            await send({"type": "http.response.start", "status": code, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(gate.retry_after()).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+app.add_middleware(AdmissionMiddleware)
+
+
+# =========================
+# PROFİLER (örneklemeli)
+# =========================
+# "/app/profit 40 sn sürüyor ama nerede?" sorusu için. Bir thread her
+# PROFILE_INTERVAL_MS'de tüm thread'lerin stack'ini okur (sys._current_frames),
+# boşta bekleyenleri atar, flamegraph.pl / speedscope uyumlu "collapsed" formatta
+# sayar. Kapalıyken maliyeti: query string'de "__profile" aranması, o kadar.
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "120"))
+_IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+                ("threading.py", "_wait_for_tstate_lock")}
+
+class StackSampler:
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.counts: dict = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                f = frame
+                while f is not None:
+                    c = f.f_code
+                    stack.append(f"{c.co_name} ({os.path.basename(c.co_filename)}:{c.co_firstlineno})")
+                    f = f.f_back
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(f"[{names.get(tid, tid)}]")
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join(timeout=2)
+        return self.counts
+
+def collapsed_stacks(counts: dict) -> str:
+    return "\n".join(f"{k} {v}" for k, v in sorted(counts.items(), key=lambda kv: -kv[1])) + "\n"
+
+def flame_html(counts: dict, title: str, samples: int, interval_ms: float) -> str:
+    # Basit icicle grafiği: kök üstte, genişlik = örnek oranı. Fareyle üstüne gelince detay.
+    root = {"n": 0, "c": {}}
+    for stack, n in counts.items():
+        node = root
+        node["n"] += n
+        for fr in stack.split(";"):
+            node = node["c"].setdefault(fr, {"n": 0, "c": {}})
+            node["n"] += n
+    total = root["n"] or 1
+    out = []
+
+    def walk(name, node, depth):
+        pct = 100.0 * node["n"] / total
+        if pct < 0.2:
+            return
+        hue = 20 + (hash(name.split(" (")[-1]) % 40)
+        out.append(
+            f'<div style="margin-left:{depth * 0.6}rem;width:{pct:.2f}%;background:hsl({hue},85%,70%)" '
+            f'class="text-[11px] truncate border-b border-white px-1" '
+            f'title="{html.escape(name)} — {node["n"]} örnek ({pct:.1f}%)">{html.escape(name)} <b>{pct:.1f}%</b></div>'
+        )
+        for child_name, child in sorted(node["c"].items(), key=lambda kv: -kv[1]["n"]):
+            walk(child_name, child, depth + 1)
+
+    for name, node in sorted(root["c"].items(), key=lambda kv: -kv[1]["n"]):
+        walk(name, node, 0)
+    body = "".join(out) or "<div class='text-slate-500'>Örnek yok (istek çok kısa ya da tüm thread'ler boştaydı).</div>"
+    return (
+        f"<!doctype html><html><head><meta charset='utf-8'><script src='https://cdn.tailwindcss.com'></script>"
+        f"<title>Profil: {html.escape(title)}</title></head><body class='p-4 bg-slate-50'>"
+        f"<div class='font-extrabold text-lg'>Profil: {html.escape(title)}</div>"
+        f"<div class='text-xs text-slate-500 mb-3'>{samples} tur × {interval_ms} ms, {total} stack örneği. "
+        f"Collapsed format için format=collapsed.</div>{body}</body></html>"
+    )
+
+def _basic_auth_ok(headers: dict) -> bool:
+    user, password = os.getenv("PANEL_USER"), os.getenv("PANEL_PASS")
+    value = headers.get("authorization", "")
+    if not user or not password or not value.lower().startswith("basic "):
+        return False
+    try:
+        got_user, _, got_pass = base64.b64decode(value[6:]).decode().partition(":")
+    except Exception:
+        return False
+    return secrets.compare_digest(got_user, user) and secrets.compare_digest(got_pass, password)
+
+class ProfileMiddleware:
+    """?__profile=1 (collapsed) veya ?__profile=html: isteği profilleyip response yerine raporu döner."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or b"__profile" not in scope.get("query_string", b""):
+            return await self.app(scope, receive, send)
+        from urllib.parse import parse_qs
+        mode = (parse_qs(scope["query_string"].decode("latin-1")).get("__profile") or [""])[0]
+        if not mode:
+            return await self.app(scope, receive, send)
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        if not _basic_auth_ok(headers):
+            resp = PlainTextResponse("Profil için panel yetkisi gerekli", status_code=401,
+                                     headers={"WWW-Authenticate": "Basic"})
+            return await resp(scope, receive, send)
+
+        status_box = {"status": 0}
+
+        async def discard(message):
+            if message["type"] == "http.response.start":
+                status_box["status"] = message["status"]
+
+        sampler = StackSampler().start()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            counts = sampler.stop()
+        took = time.perf_counter() - t0
+        title = f"{scope.get('method')} {scope.get('path')} → {status_box['status']} ({took:.2f} sn)"
+        if mode == "html":
+            resp = HTMLResponse(flame_html(counts, title, sampler.samples, PROFILE_INTERVAL_MS))
+        else:
+            resp = PlainTextResponse(f"# {title}\n" + collapsed_stacks(counts))
+        await resp(scope, receive, send)
+
+app.add_middleware(ProfileMiddleware)
+
+
+# =========================
+# TRACING (span'ler)
+# =========================
+# Bir dashboard yüklemesi: Trendyol sayfaları → calc_profit_for_line → aggregation
+# → HTML. Her istek bir kök span; içinde iç içe span'ler (süre + attribute).
+# Biten trace'ler bellekte halka tampona (/debug/traces) ve TRACE_FILE verilmişse
+# JSON-lines dosyasına yazılır. Yavaş bir istek sonradan adım adım açıklanabilsin.
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "200"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))
+TRACES = collections.deque(maxlen=TRACE_BUFFER)
+TRACE_FILE_LOCK = threading.Lock()
+_CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "trace")
+
+    def __init__(self, name: str, attrs: dict, trace: dict):
+        self.name, self.attrs, self.trace = name, attrs, trace
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key: str, value: float = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self, t0: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - t0) * 1000, 2),
+            "duration_ms": round((end - self.start) * 1000, 2),
+            "attrs": self.attrs,
+            "children": [c.to_dict(t0) for c in self.children],
+        }
+
+def current_span() -> Optional[Span]:
+    return _CURRENT_SPAN.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """İç içe span. Aktif trace yoksa (ör. script'ten çağrı) sadece no-op Span döner."""
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield Span(name, attrs, {})
+        return
+    trace = parent.trace
+    s = Span(name, attrs, trace)
+    trace["spans"] = trace.get("spans", 0) + 1
+    if trace["spans"] <= TRACE_MAX_SPANS:
+        parent.children.append(s)
+    _CURRENT_SPAN.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.set(error=type(e).__name__)
+        raise
+    finally:
+        s.end = time.perf_counter()
+        # token.reset kullanılmıyor: stream generator'ları her next()'te ayrı context kopyasında koşuyor
+        _CURRENT_SPAN.set(parent)
+
+def span_set(**attrs):
+    s = _CURRENT_SPAN.get()
+    if s is not None:
+        s.set(**attrs)
+
+def traced(name: str):
+    """Fonksiyonu span içinde çalıştırır; içeride span_set(...) ile attribute eklenir."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def start_trace(name: str, **attrs) -> Span:
+    trace = {"id": uuid.uuid4().hex[:16], "started_at": datetime.now().isoformat(timespec="milliseconds")}
+    root = Span(name, attrs, trace)
+    trace["root"] = root
+    _CURRENT_SPAN.set(root)
+    return root
+
+def finish_trace(root: Span):
+    root.end = time.perf_counter()
+    trace = root.trace
+    record = {
+        "trace_id": trace["id"],
+        "started_at": trace["started_at"],
+        "spans": trace.get("spans", 0) + 1,
+        **root.to_dict(root.start),
+    }
+    TRACES.append(record)
+    if TRACE_FILE:
+        try:
+            with TRACE_FILE_LOCK, open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.info("trace file write failed: %s", e)
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path", "").startswith(("/debug/traces", "/metrics", "/health", "/events")):
+            return await self.app(scope, receive, send)
+        root = start_trace(f"{scope.get('method')} {scope.get('path')}", query=scope.get("query_string", b"").decode("latin-1"))
+        state = {"done": False}
+
+        def finish():
+            if not state["done"]:
+                state["done"] = True
+                route = scope.get("route")
+                root.set(route=getattr(route, "path", "unmatched"))
+                finish_trace(root)
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                root.set(status=message["status"])
+            elif message["type"] == "http.response.body":
+                root.add("bytes", len(message.get("body", b"")))
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            finish()
+
+app.add_middleware(TracingMiddleware)
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            metric_observe("db_query_duration_seconds", time.perf_counter() - t0, op=sql.lstrip().split(None, 1)[0].upper())
+
+    def executemany(self, sql, seq):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            metric_observe("db_query_duration_seconds", time.perf_counter() - t0, op=sql.lstrip().split(None, 1)[0].upper())
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    try:
+        import anyio.to_thread
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        metric_set("threadpool_threads_busy", limiter.borrowed_tokens)
+        metric_set("threadpool_threads_total", limiter.total_tokens)
+    except Exception:
+        pass
+    metric_set("jobs_queue_depth", len(JOB_QUEUE))
+    metric_set("upstream_tokens", UPSTREAM.snapshot()["tokens"])
+    metric_set("process_uptime_seconds", round(time.time() - PROCESS_STARTED, 1))
+    try:
+        entries, size = await run_in_threadpool(CACHE.stats)
+        metric_set("cache_entries", entries)
+        metric_set("cache_bytes", size)
+    except Exception:
+        pass
+    lines = []
+    for m in list(METRICS.values()):
+        lines.extend(m.render())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 
 @app.on_event("startup")
 async def _startup_init():
     # DB init should not crash the whole service in Render
     try:
-        init_db()
-        logger.info("DB init OK")
+        for sid in seller_ids():
+            with seller_scope(sid):
+                init_db()
+        logger.info("DB init OK (%s satıcı)", len(SELLERS))
     except Exception:
         tb = traceback.format_exc()
-        msg = f"Startup DB init failed\n\n{tb}"
-        LAST_ERROR["text"] = msg
-        logger.error(msg)
+        record_error(f"Startup DB init failed\n\n{tb}")
+        return
+    start_job_workers()
+    start_sync_workers()
+
 security = HTTPBasic()
 
 # =========================
@@ -50,10 +769,30 @@ security = HTTPBasic()
 # =========================
 INVOICE_RATE = float(os.getenv("INVOICE_RATE", "0.10"))
 PAGE_SIZE = int(os.getenv("TRENDYOL_PAGE_SIZE", "200"))
+# cari hesap (settlements) API'si: sayfa 500/1000, aralık en fazla 15 gün, tür başına ayrı sorgu
+SETTLEMENT_PAGE_SIZE = int(os.getenv("SETTLEMENT_PAGE_SIZE", "500"))
+SETTLEMENT_TYPES = [t.strip() for t in os.getenv("SETTLEMENT_TYPES", "Sale,Return").split(",") if t.strip()]
+TRENDYOL_MAX_RETRIES = int(os.getenv("TRENDYOL_MAX_RETRIES", "3"))
+# async rapor yollarında aynı anda çekilen sayfa sayısı (tarama başına)
+TRENDYOL_CONCURRENCY = int(os.getenv("TRENDYOL_CONCURRENCY", "4"))
+# Tüm upstream çağrıları için ortak kota (saniyede istek / anlık patlama); 0 = sınırsız
+TRENDYOL_RPS = float(os.getenv("TRENDYOL_RPS", "5"))
+TRENDYOL_BURST = float(os.getenv("TRENDYOL_BURST", "10"))
+# Yerel mock / staging için (ör. http://127.0.0.1:8900, bkz. mock_trendyol.py)
+TRENDYOL_BASE_URL = os.getenv("TRENDYOL_BASE_URL", "https://api.trendyol.com").rstrip("/")
+# İstek başına süre bütçesi (sn): dolunca o ana kadarki veri "yarım" işaretiyle döner
+REPORT_BUDGET_SECONDS = float(os.getenv("REPORT_BUDGET_SECONDS", "25"))
+PAGE_BUDGET_SECONDS = float(os.getenv("PAGE_BUDGET_SECONDS", "20"))
 
 # Render güvenli yazma yolu: env yoksa otomatik /tmp kullan
 DB_PATH = os.getenv("DB_PATH", "/tmp/data.db")
 
+# Arka plan işleri (uzun rapor / export / derin sipariş arama)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "50"))
+JOB_DIR = os.getenv("JOB_DIR", os.path.join(tempfile.gettempdir(), "trendyol_jobs"))
+JOB_TTL_HOURS = int(os.getenv("JOB_TTL_HOURS", "24"))
+
 # Satıcı bilgileri (Portal için)
 SELLER_TITLE = os.getenv("SELLER_TITLE", "UNVANINIZ")
 SELLER_VKN = os.getenv("SELLER_VKN", "0000000000")
@@ -63,6 +802,102 @@ SELLER_CITY = os.getenv("SELLER_CITY", "IL")
 SELLER_DISTRICT = os.getenv("SELLER_DISTRICT", "ILCE")
 SELLER_EMAIL = os.getenv("SELLER_EMAIL", "mail@ornek.com")
 
+# =========================
+# SATICILAR (çoklu mağaza)
+# =========================
+# Tek kurulum birden çok Trendyol hesabını yönetir. TRENDYOL_SELLERS JSON listesi:
+#   [{"id": "123", "api_key": "...", "api_secret": "...", "title": "Mağaza A", "vkn": "..."}, ...]
+# Eski tekil env (TRENDYOL_SELLER_ID/API_KEY/API_SECRET) listede yoksa ilk satıcı olarak eklenir.
+# Her satıcının verisi (maliyet, fatura, iş, sipariş deposu) kendi SQLite dosyasındadır;
+# eski tekil satıcı DB_PATH'i kullanmaya devam eder. Aktif satıcı istek başına
+# CURRENT_SELLER'dadır (?seller=, X-Seller-Id ya da seller cookie'si).
+SELLER_INFO_KEYS = ("title", "vkn", "tax_office", "address", "city", "district", "email")
+
+def _load_sellers() -> dict:
+    sellers = {}
+    raw = os.getenv("TRENDYOL_SELLERS", "").strip()
+    for s in json.loads(raw) if raw else []:
+        sid = str(s.get("id") or "").strip()
+        if sid:
+            sellers[sid] = {"id": sid, **{k: str(v) for k, v in s.items() if k != "id" and v is not None}}
+    legacy = (os.getenv("TRENDYOL_SELLER_ID") or "").strip()
+    if legacy and legacy not in sellers:
+        sellers = {legacy: {
+            "id": legacy,
+            "api_key": os.getenv("TRENDYOL_API_KEY", ""),
+            "api_secret": os.getenv("TRENDYOL_API_SECRET", ""),
+        }, **sellers}
+    return sellers
+
+SELLERS = _load_sellers()
+DEFAULT_SELLER = next(iter(SELLERS), "")
+LEGACY_SELLER = (os.getenv("TRENDYOL_SELLER_ID") or "").strip() or DEFAULT_SELLER
+CURRENT_SELLER: contextvars.ContextVar = contextvars.ContextVar("current_seller", default="")
+
+def seller_ids() -> list[str]:
+    # satıcı tanımlı değilse tek "boş" satıcı: DB yine DB_PATH'te açılır
+    return list(SELLERS) or [""]
+
+def current_seller_id() -> str:
+    return CURRENT_SELLER.get() or DEFAULT_SELLER
+
+@contextmanager
+def seller_scope(seller_id: str):
+    token = CURRENT_SELLER.set(seller_id)
+    try:
+        yield
+    finally:
+        CURRENT_SELLER.reset(token)
+
+def seller_db_path(seller_id: str) -> str:
+    if not seller_id or seller_id == LEGACY_SELLER:
+        return DB_PATH
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}.{seller_id}{ext or '.db'}"
+
+def seller_info(seller_id: str | None = None) -> dict:
+    """Fatura / Portal bilgileri: satıcıya özel alan yoksa SELLER_* env'i."""
+    s = SELLERS.get(seller_id or current_seller_id(), {})
+    defaults = {
+        "title": SELLER_TITLE, "vkn": SELLER_VKN, "tax_office": SELLER_TAX_OFFICE, "address": SELLER_ADDRESS,
+        "city": SELLER_CITY, "district": SELLER_DISTRICT, "email": SELLER_EMAIL,
+    }
+    return {k: s.get(k) or defaults[k] for k in SELLER_INFO_KEYS}
+
+class SellerMiddleware:
+    """Aktif satıcıyı seçer; ?seller= ile gelince cookie'ye yazar ki sayfalar arası korunsun."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        conn = HTTPConnection(scope)
+        asked = conn.query_params.get("seller") or conn.headers.get("x-seller-id") or ""
+        sid = asked or conn.cookies.get("seller") or ""
+        if sid not in SELLERS:
+            if asked:
+                body = json.dumps({"detail": f"Bilinmeyen satıcı: {asked}"}, ensure_ascii=False).encode()
+                await send({"type": "http.response.start", "status": 404, "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ]})
+                await send({"type": "http.response.body", "body": body})
+                return
+            sid = DEFAULT_SELLER  # eski / silinmiş satıcı cookie'si
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                cookie = f"seller={sid}; Path=/; SameSite=Lax; HttpOnly".encode()
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie)]}
+            await send(message)
+
+        with seller_scope(sid):
+            await self.app(scope, receive, send_with_cookie if conn.query_params.get("seller") else send)
+
+app.add_middleware(SellerMiddleware)
+
 # =========================
 # AUTH
 # =========================
@@ -82,8 +917,9 @@ def panel_auth(credentials: HTTPBasicCredentials = Depends(security)):
 # =========================
 # DB
 # =========================
-def db():
-    conn = sqlite3.connect(DB_PATH)
+def db(check_same_thread: bool = True):
+    # aktif satıcının dosyası: bir satıcının sorgusu diğerinin verisine hiç dokunmaz
+    conn = sqlite3.connect(seller_db_path(current_seller_id()), factory=TimedConnection, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -135,7 +971,188 @@ def init_db():
         )
     """)
 
+    # SKU başına fiyat parametreleri (boş alan = varsayılan / siparişlerden gözlenen)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sku_pricing (
+            merchant_sku TEXT PRIMARY KEY,
+            commission_rate REAL,
+            target_margin REAL,
+            sale_price REAL,
+            updated_at TEXT
+        )
+    """)
+
+    # uzun süren rapor/export işleri (HTTP isteğini bekletmesin diye)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 5,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result_path TEXT,
+            result_name TEXT,
+            media_type TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, priority, created_at)
+    """)
+
+    # veri filigranı: ETag / Last-Modified buradan türetilir
+    # orders -> görülen en yeni lastModifiedDate (ms), costs/invoices -> değişiklik sayacı
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+    # sipariş deposu: senkron worker'ı doldurur (paket = Trendyol'un "order" kaydı)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            package_id TEXT PRIMARY KEY,
+            order_number TEXT NOT NULL,
+            order_date INTEGER NOT NULL,
+            last_modified INTEGER NOT NULL,
+            status TEXT,
+            payload TEXT NOT NULL,
+            synced_at TEXT NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_number ON orders(order_number)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS order_lines (
+            package_id TEXT NOT NULL,
+            line_no INTEGER NOT NULL,
+            line_id TEXT,
+            order_number TEXT NOT NULL,
+            order_date INTEGER NOT NULL,
+            merchant_sku TEXT,
+            product_name TEXT,
+            quantity REAL,
+            sale REAL,
+            commission REAL,
+            seller_discount REAL,
+            ty_discount REAL,
+            campaign TEXT,
+            status TEXT,
+            PRIMARY KEY(package_id, line_no)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_lines_date ON order_lines(order_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_lines_sku ON order_lines(merchant_sku, order_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_lines_number ON order_lines(order_number)")
+    # what-if grup toplamları: GROUP BY sırasında, kapsayan (tablo satırına inmeden, sıralamasız)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_order_lines_group ON order_lines("
+        "merchant_sku, campaign, status, order_date, quantity, sale, commission, seller_discount)"
+    )
+    # iade talepleri (claims API, talep kalemi başına) + iptal satırları (sipariş senkronundan)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS claims (
+            claim_item_id TEXT PRIMARY KEY,
+            claim_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            package_id TEXT,
+            line_id TEXT,
+            order_number TEXT NOT NULL,
+            order_date INTEGER,
+            claim_date INTEGER NOT NULL,
+            last_modified INTEGER NOT NULL,
+            merchant_sku TEXT,
+            product_name TEXT,
+            amount REAL,
+            status TEXT,
+            reason TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_claims_date ON claims(claim_date, kind)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_claims_claim ON claims(claim_id)")
+    # cari hesap hareketleri (settlements API): değişmez kayıtlar, id ile tekil
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS settlements (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            transaction_date INTEGER NOT NULL,
+            order_number TEXT,
+            package_id TEXT,
+            barcode TEXT,
+            credit REAL,
+            debt REAL,
+            commission REAL,
+            seller_revenue REAL,
+            payment_date INTEGER,
+            payment_order_id TEXT,
+            description TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_settlements_date ON settlements(transaction_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_settlements_order ON settlements(order_number, type)")
+    # SKU başına gözlenen toplamlar: store_orders satır yazarken artımlı günceller
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sku_stats (
+            merchant_sku TEXT PRIMARY KEY,
+            lines INTEGER NOT NULL DEFAULT 0,
+            quantity REAL NOT NULL DEFAULT 0,
+            sale REAL NOT NULL DEFAULT 0,
+            commission REAL NOT NULL DEFAULT 0,
+            seller_discount REAL NOT NULL DEFAULT 0,
+            ty_discount REAL NOT NULL DEFAULT 0,
+            last_order_date INTEGER,
+            updated_at TEXT
+        )
+    """)
+    # tablo sonradan eklendiyse var olan depodan bir kez doldur
+    if cur.execute("SELECT 1 FROM order_lines LIMIT 1").fetchone() and not cur.execute("SELECT 1 FROM sku_stats LIMIT 1").fetchone():
+        apply_sku_stats(conn, cur.execute(f"SELECT {SKU_STATS_SOURCE} FROM order_lines").fetchall())
+    # gün x SKU x kampanya toplamları (dönem karşılaştırma); orders: paketin ilk satırına yazılır
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_agg (
+            day TEXT NOT NULL,
+            merchant_sku TEXT NOT NULL,
+            campaign TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            lines INTEGER NOT NULL DEFAULT 0,
+            quantity REAL NOT NULL DEFAULT 0,
+            sale REAL NOT NULL DEFAULT 0,
+            commission REAL NOT NULL DEFAULT 0,
+            seller_discount REAL NOT NULL DEFAULT 0,
+            ty_discount REAL NOT NULL DEFAULT 0,
+            invoice_base REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY(day, merchant_sku, campaign)
+        )
+    """)
+    if cur.execute("SELECT 1 FROM order_lines LIMIT 1").fetchone() and not cur.execute("SELECT 1 FROM daily_agg LIMIT 1").fetchone():
+        apply_daily_agg(conn, cur.execute(f"SELECT {DAILY_AGG_SOURCE} FROM order_lines").fetchall())
+    # canlı panel olayları (SSE): senkron yazdığı verinin farkını aynı transaction'da buraya ekler
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
     conn.commit()
+    conn.close()
 
 
 def get_cost_map() -> dict:
@@ -156,7 +1173,9 @@ def upsert_cost(merchant_sku: str, cost: float):
         "ON CONFLICT(merchant_sku) DO UPDATE SET cost=excluded.cost, updated_at=excluded.updated_at",
         (merchant_sku, float(cost), datetime.now().isoformat(timespec="seconds")),
     )
+    bump_data_version(conn, "costs")
     conn.commit()
+    conn.close()
 
 def delete_cost(merchant_sku: str):
     merchant_sku = (merchant_sku or "").strip()
@@ -165,12 +1184,227 @@ def delete_cost(merchant_sku: str):
     conn = db()
     cur = conn.cursor()
     cur.execute("DELETE FROM sku_costs WHERE merchant_sku=?", (merchant_sku,))
+    if cur.rowcount:
+        bump_data_version(conn, "costs")
+    conn.commit()
+
+    conn.close()
+
+def upsert_sku_pricing(merchant_sku: str, commission_rate: Optional[float], target_margin: Optional[float],
+                       sale_price: Optional[float]):
+    """None alanlar varsayılana döner; üçü de None ise kayıt silinir."""
+    merchant_sku = (merchant_sku or "").strip()
+    if not merchant_sku:
+        raise ValueError("merchant_sku boş olamaz")
+    conn = db()
+    if commission_rate is None and target_margin is None and sale_price is None:
+        conn.execute("DELETE FROM sku_pricing WHERE merchant_sku=?", (merchant_sku,))
+    else:
+        conn.execute(
+            "INSERT OR REPLACE INTO sku_pricing(merchant_sku, commission_rate, target_margin, sale_price, updated_at) "
+            "VALUES(?,?,?,?,?)",
+            (merchant_sku, commission_rate, target_margin, sale_price, datetime.now().isoformat(timespec="seconds")),
+        )
     conn.commit()
+    conn.close()
 
+def bump_data_version(conn, name: str, value: int | None = None):
+    """value yoksa sayaç +1; value varsa (orders filigranı) sadece büyükse yazılır. Commit çağırana ait."""
+    now = datetime.now().isoformat(timespec="seconds")
+    if value is None:
+        conn.execute(
+            "INSERT INTO data_versions(name, version, updated_at) VALUES(?,1,?) "
+            "ON CONFLICT(name) DO UPDATE SET version=version+1, updated_at=excluded.updated_at",
+            (name, now),
+        )
+    else:
+        conn.execute(
+            "INSERT INTO data_versions(name, version, updated_at) VALUES(?,?,?) "
+            "ON CONFLICT(name) DO UPDATE SET version=excluded.version, updated_at=excluded.updated_at "
+            "WHERE excluded.version > data_versions.version",
+            (name, int(value), now),
+        )
+
+def get_data_versions() -> dict:
+    conn = db()
+    rows = conn.execute("SELECT name, version, updated_at FROM data_versions").fetchall()
     conn.close()
+    return {r["name"]: (int(r["version"]), r["updated_at"]) for r in rows}
 
 # init_db()  # moved to startup
 
+# =========================
+# PAYLAŞILAN ÖNBELLEK (SQLite WAL, worker'lar arası)
+# =========================
+# Birden çok uvicorn/gunicorn worker'ında her süreç aynı taramayı ayrı ayrı
+# Trendyol'dan çekiyor, son hata (/debug/last-error) da süreç başına kalıyordu.
+# Aynı makinedeki worker'lar WAL modundaki tek bir SQLite dosyasını paylaşır:
+# TTL'li anahtar/değer (zlib), toplam boyut CACHE_MAX_MB'ı aşınca en eski
+# erişilenler silinir. JSON değerler süreç içinde çözülmüş halde de tutulur
+# (L1, stamp ile doğrulanır). add() atomik "yoksa yaz": worker'lar arası kilit.
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(DB_PATH) or ".", "cache.db"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "256"))
+CACHE_L1_ENTRIES = int(os.getenv("CACHE_L1_ENTRIES", "8"))
+# /report cevapları ve Excel çıktıları (anahtar: veri ETag'i) ne kadar tutulur
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "300"))
+ETAG_FAILED_TTL = float(os.getenv("ETAG_FAILED_TTL", "86400"))
+
+_metric("cache_evictions_total", "Boyut sınırı yüzünden silinen önbellek kayıtları.", "counter")
+_metric("cache_bytes", "Paylaşılan önbellekteki (sıkıştırılmış) toplam boyut.", "gauge")
+_metric("cache_entries", "Paylaşılan önbellekteki kayıt sayısı.", "gauge")
+
+class SharedCache:
+    def __init__(self, path: str, max_bytes: int, l1_entries: int = 8):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.l1_entries = l1_entries
+        self.local = threading.local()
+        self.l1: "collections.OrderedDict[str, tuple[float, object]]" = collections.OrderedDict()
+        self.l1_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        # thread başına bağlantı; autocommit, tek ifadeler zaten atomik
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache(
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                stamp REAL NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+            self.local.conn = conn
+        return conn
+
+    def _stamp(self, key: str) -> Optional[float]:
+        row = self._conn().execute("SELECT stamp FROM cache WHERE key=? AND expires>?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value FROM cache WHERE key=? AND expires>?", (key, now)).fetchone()
+        metric_inc("cache_requests_total", cache="shared", result="hit" if row else "miss")
+        if row is None:
+            return None
+        conn.execute("UPDATE cache SET accessed=? WHERE key=?", (now, key))
+        return zlib.decompress(row[0])
+
+    def set(self, key: str, value: bytes, ttl: float) -> float:
+        blob = zlib.compress(value, 1)
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache(key, value, stamp, expires, accessed, size) VALUES(?,?,?,?,?,?)",
+                     (key, blob, now, now + ttl, now, len(blob)))
+        self._evict(conn, now)
+        return now
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Anahtar yoksa (ya da süresi dolmuşsa) yazar, True döner; varsa dokunmaz."""
+        blob = zlib.compress(value, 1)
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE key=? AND expires<=?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO cache(key, value, stamp, expires, accessed, size) VALUES(?,?,?,?,?,?)",
+                (key, blob, now, now + ttl, now, len(blob)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def renew(self, key: str, value: bytes, ttl: float) -> bool:
+        """Anahtar hâlâ value ise (lease sahibi bizsek) süresini uzatır; True döner."""
+        now = time.time()
+        cur = self._conn().execute("UPDATE cache SET expires=? WHERE key=? AND value=? AND expires>?",
+                                   (now + ttl, key, zlib.compress(value, 1), now))
+        return cur.rowcount == 1
+
+    def release(self, key: str, value: bytes):
+        """Anahtar hâlâ value ise siler: süresi dolup başka sürece geçmiş lease'e dokunmaz."""
+        self._conn().execute("DELETE FROM cache WHERE key=? AND value=?", (key, zlib.compress(value, 1)))
+
+    def stats(self) -> tuple[int, int]:
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return row[0], row[1]
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache WHERE key=?", (key,))
+        with self.l1_lock:
+            self.l1.pop(key, None)
+
+    def get_json(self, key: str):
+        stamp = self._stamp(key)
+        if stamp is None:
+            metric_inc("cache_requests_total", cache="shared", result="miss")
+            return None
+        with self.l1_lock:
+            hit = self.l1.get(key)
+            if hit is not None and hit[0] == stamp:
+                self.l1.move_to_end(key)
+                metric_inc("cache_requests_total", cache="shared", result="hit")
+                return hit[1]
+        raw = self.get(key)
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._remember(key, stamp, value)
+        return value
+
+    def set_json(self, key: str, value, ttl: float):
+        stamp = self.set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode(), ttl)
+        self._remember(key, stamp, value)
+
+    def _remember(self, key: str, stamp: float, value):
+        with self.l1_lock:
+            self.l1[key] = (stamp, value)
+            self.l1.move_to_end(key)
+            while len(self.l1) > self.l1_entries:
+                self.l1.popitem(last=False)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM cache WHERE expires<=?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = 0
+            for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM cache WHERE key=?", (key,))
+                total -= size
+                evicted += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        metric_inc("cache_evictions_total", evicted)
+
+CACHE = SharedCache(CACHE_PATH, int(CACHE_MAX_MB * 1024 * 1024), CACHE_L1_ENTRIES)
+
+def record_error(msg: str):
+    """Son hatayı loglar ve tüm worker'ların göreceği /debug/last-error'a yazar."""
+    logger.error(msg)
+    try:
+        CACHE.set("last_error", msg.encode(), ttl=7 * 86400)
+    except Exception as e:
+        logger.warning("last_error could not be cached: %s", e)
+
+
 # =========================
 # HELPERS
 # =========================
@@ -229,38 +1463,342 @@ def get_campaign_label(line: dict) -> str:
         return f"salesCampaignId:{scid}"
     return ""
 
+def claim_kind(status: str) -> str:
+    """Satır / talep durumu -> "return" | "cancel" | "".
+    "İade".lower() "i̇ade" (noktalı i + birleşik nokta) verir; İ/ı önce düz i'ye indirilir."""
+    st = (status or "").replace("İ", "i").replace("ı", "i").lower()
+    if "iade" in st or "return" in st:
+        return "return"
+    if "iptal" in st or "cancel" in st:
+        return "cancel"
+    return ""
+
+# =========================
+# TRENDYOL HIZ SINIRI (token bucket + öncelik şeritleri)
+# =========================
+# Etkileşimli aramalar, dashboard raporları ve arka plan işleri fetch_orders'ı
+# birbirinden habersiz çağırıyordu; satıcı kotası aşılınca hepsi birden
+# 429 yiyordu. Bütün upstream istekleri (sync + async) tek bir token
+# bucket'tan geçer. Şerit contextvar'dan okunur: bekleyen daha öncelikli
+# şerit varsa alttakiler token almaz. Trendyol 429 + Retry-After dönerse
+# bucket o süre boyunca durur, sonra önce etkileşimli şerit devam eder.
+UPSTREAM_LANES = ("interactive", "report", "bulk")
+UPSTREAM_LANE = contextvars.ContextVar("upstream_lane", default="report")
+
+_metric("upstream_queue_depth", "Trendyol token'ı bekleyen istek (lane=interactive|report|bulk).", "gauge")
+_metric("upstream_tokens", "Token bucket'ta kalan istek hakkı.", "gauge")
+_metric("upstream_wait_seconds", "Trendyol token'ı için bekleme süresi.", "histogram", HTTP_BUCKETS)
+
+@contextmanager
+def upstream_lane(lane: str):
+    token = UPSTREAM_LANE.set(lane)
+    try:
+        yield
+    finally:
+        UPSTREAM_LANE.reset(token)
+
+class UpstreamScheduler:
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = dict.fromkeys(UPSTREAM_LANES, 0)
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now < self.paused_until:
+            self.updated = now
+            return
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _try_take(self, lane: str) -> float:
+        """0: token alındı; aksi halde tekrar denemeden önce beklenecek süre."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        ahead = any(self.waiting[l] for l in UPSTREAM_LANES[:UPSTREAM_LANES.index(lane)])
+        if not wait and not ahead and self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        wait = max(wait, (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0)
+        # öncelikli şerit bekliyorsa bir token süresi daha geride kal
+        return wait + (1 / self.rate if ahead else 0.0) + 0.001
+
+    def _enter(self, lane: str):
+        with self.lock:
+            self.waiting[lane] += 1
+            metric_set("upstream_queue_depth", self.waiting[lane], lane=lane)
+
+    def _leave(self, lane: str, t0: float):
+        with self.lock:
+            self.waiting[lane] -= 1
+            metric_set("upstream_queue_depth", self.waiting[lane], lane=lane)
+            metric_set("upstream_tokens", round(self.tokens, 2))
+        metric_observe("upstream_wait_seconds", time.monotonic() - t0, lane=lane)
+
+    def acquire(self):
+        if not self.rate:
+            return
+        lane = UPSTREAM_LANE.get()
+        t0 = time.monotonic()
+        self._enter(lane)
+        try:
+            while True:
+                with self.lock:
+                    delay = self._try_take(lane)
+                if not delay:
+                    return
+                time.sleep(delay)
+        finally:
+            self._leave(lane, t0)
+
+    async def acquire_async(self):
+        if not self.rate:
+            return
+        lane = UPSTREAM_LANE.get()
+        t0 = time.monotonic()
+        self._enter(lane)
+        try:
+            while True:
+                with self.lock:
+                    delay = self._try_take(lane)
+                if not delay:
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self._leave(lane, t0)
+
+    def pause(self, seconds: float):
+        """Trendyol 429: bucket'ı boşalt, Retry-After boyunca token üretme."""
+        with self.lock:
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            self._refill(time.monotonic())
+            return {"rate": self.rate, "burst": self.burst, "tokens": round(self.tokens, 2),
+                    "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+                    "waiting": dict(self.waiting)}
+
+UPSTREAM = UpstreamScheduler(TRENDYOL_RPS, TRENDYOL_BURST)
+
+# =========================
+# DEVRE KESİCİ (Trendyol)
+# =========================
+# Trendyol yavaş/kapalıyken her sayfa sayfa başına 60 sn bekleyip hata
+# veriyordu. Art arda BREAKER_FAILURES hata (bağlantı / 5xx) devreyi açar:
+# BREAKER_OPEN_SECONDS boyunca upstream'e hiç gidilmez (anında 503), sayfalar
+# son geçerli veriyle (SWR) cevap verir. Süre dolunca tek bir deneme isteği
+# geçer (half_open); başarılıysa devre kapanır, değilse tekrar açılır.
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+_metric("upstream_circuit_state", "Trendyol devre kesicisi (0=closed, 1=half_open, 2=open).", "gauge")
+
+class CircuitBreaker:
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failures: int, open_seconds: float):
+        self.max_failures, self.open_seconds = failures, open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def _set(self, state: str):
+        self.state = state
+        metric_set("upstream_circuit_state", self.STATES[state])
+
+    def is_open(self) -> bool:
+        """Upstream'e şu an gidilemez mi (soğuma süresi bitmemiş ya da deneme isteği sürüyor)?"""
+        with self.lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at < self.open_seconds
+            return self.state == "half_open" and self.probe_in_flight
+
+    def before(self):
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self._set("half_open")
+                self.probe_in_flight = False
+            if self.state == "open" or (self.state == "half_open" and self.probe_in_flight):
+                raise HTTPException(status_code=503, detail="Trendyol API şu an erişilemiyor (devre açık), biraz sonra tekrar deneyin")
+            if self.state == "half_open":
+                self.probe_in_flight = True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.probe_in_flight = False
+            if self.state != "closed":
+                logger.info("trendyol circuit closed")
+                self._set("closed")
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.max_failures):
+                logger.warning("trendyol circuit open (%s failures)", self.failures)
+                self.opened_at = time.monotonic()
+                self._set("open")
+
+BREAKER = CircuitBreaker(BREAKER_FAILURES, BREAKER_OPEN_SECONDS)
+
 # =========================
 # TRENDYOL API
 # =========================
 def trendyol_headers() -> tuple[str, dict]:
-    api_key = os.getenv("TRENDYOL_API_KEY")
-    api_secret = os.getenv("TRENDYOL_API_SECRET")
-    seller_id = os.getenv("TRENDYOL_SELLER_ID")
+    seller = SELLERS.get(current_seller_id(), {})
+    api_key = seller.get("api_key")
+    api_secret = seller.get("api_secret")
+    seller_id = seller.get("id")
 
     if not api_key or not api_secret or not seller_id:
         raise HTTPException(status_code=500, detail="TRENDYOL_API_KEY/SECRET/SELLER_ID env eksik")
 
     auth = base64.b64encode(f"{api_key}:{api_secret}".encode()).decode()
-    url = f"https://api.trendyol.com/sapigw/suppliers/{seller_id}/orders"
+    url = f"{TRENDYOL_BASE_URL}/sapigw/suppliers/{seller_id}/orders"
     headers = {
         "Authorization": f"Basic {auth}",
         "User-Agent": f"{seller_id} - Trendyol API",
     }
     return url, headers
 
+class BudgetExceeded(Exception):
+    """İsteğin süre bütçesi (deadline) doldu; tarama o ana kadarki veriyle biter."""
+
+class FetchResult(list):
+    """Upstream sonucu + meta: eski veri mi (stale_*), yarım mı kaldı (truncated / next_page)."""
+    stale_at: Optional[str] = None
+    stale_reason: str = ""
+    truncated: str = ""  # "" | "deadline" | "max_pages"
+    next_page: Optional[int] = None
+
+    def __init__(self, items=(), **meta):
+        super().__init__(items)
+        for k, v in meta.items():
+            setattr(self, k, v)
+
+    def with_items(self, items) -> "FetchResult":
+        return FetchResult(items, **self.__dict__)
+
+    def truncate(self, reason: str, next_page: int):
+        self.truncated, self.next_page = reason, next_page
+        metric_inc("fetch_truncated_total", reason=reason)
+        span_set(truncated=reason, next_page=next_page)
+
+    def meta(self) -> dict:
+        out = {}
+        if self.stale_at:
+            out.update(stale=True, stale_since=self.stale_at, stale_reason=self.stale_reason)
+        if self.truncated:
+            out.update(truncated=True, truncated_reason=self.truncated, next_page=self.next_page)
+        return out
+
+_metric("fetch_truncated_total", "Süre bütçesi ya da sayfa sınırı yüzünden yarım kalan taramalar (reason=deadline|max_pages).", "counter")
+
+def budget_deadline(seconds: float) -> float:
+    return time.monotonic() + seconds
+
+def _budget_timeout(deadline: Optional[float], timeout: float) -> float:
+    """Sayfa timeout'u bütçenin kalanıyla sınırlı; bütçe bittiyse BudgetExceeded."""
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise BudgetExceeded()
+    return min(timeout, left)
+
+def _budget_sleep_ok(deadline: Optional[float], delay: float):
+    # tekrar denemeyi beklemek bütçeyi aşacaksa hiç bekleme
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        raise BudgetExceeded()
+
+def _upstream_result(r, t0: float, attempt: int) -> Optional[float]:
+    """Yanıtı metriklere yazar. None: başarılı; sayı: o kadar bekleyip tekrar dene (Retry-After)."""
+    metric_observe("trendyol_request_duration_seconds", time.perf_counter() - t0, status=r.status_code)
+    metric_inc("trendyol_response_bytes_total", len(r.content or b""))
+    if r.status_code < 400:
+        BREAKER.success()
+        metric_inc("trendyol_pages_total")
+        span_set(status=r.status_code, bytes=len(r.content or b""))
+        return None
+    metric_inc("trendyol_errors_total", status=r.status_code)
+    if r.status_code >= 500:
+        BREAKER.failure()
+    if (r.status_code != 429 and r.status_code < 500) or attempt >= TRENDYOL_MAX_RETRIES:
+        raise HTTPException(status_code=502, detail=f"Trendyol API hata: {r.status_code} - {r.text}")
+    retry_after = _num((r.headers or {}).get("Retry-After"), 0.0)
+    if r.status_code == 429:
+        UPSTREAM.pause(retry_after or 1.0)
+    return retry_after
+
+def _upstream_conn_error(attempt: int):
+    metric_inc("trendyol_errors_total", status="conn")
+    BREAKER.failure()
+    if attempt >= TRENDYOL_MAX_RETRIES:
+        raise HTTPException(status_code=502, detail="Trendyol API'ye bağlanılamadı")
+
+def _retry_delay(attempt: int, retry_after: float) -> float:
+    metric_inc("trendyol_retries_total")
+    span_set(retries=attempt)
+    return min(30.0, retry_after or 0.5 * (2 ** attempt))
+
+@traced("trendyol.get")
+def _trendyol_get(url: str, headers: dict, params: dict, timeout: float = 60, deadline: Optional[float] = None):
+    """Tek Trendyol isteği: 429/5xx/bağlantı hatasında Retry-After'a uyarak tekrar dener, metrik yazar.
+    deadline (time.monotonic) verilirse timeout ve beklemeler onu aşmaz; aşacaksa BudgetExceeded."""
+    span_set(page=params.get("page"))
+    attempt = 0
+    while True:
+        retry_after = 0.0
+        t0 = time.perf_counter()
+        BREAKER.before()
+        UPSTREAM.acquire()
+        page_timeout = _budget_timeout(deadline, timeout)
+        try:
+            r = requests.get(url, headers=headers, params=params, timeout=page_timeout)
+        except requests.RequestException as e:
+            # bütçe yüzünden kısalan timeout upstream arızası sayılmaz (devre kesiciye yazılmaz)
+            if page_timeout < timeout and isinstance(e, requests.Timeout):
+                raise BudgetExceeded() from e
+            _upstream_conn_error(attempt)
+        else:
+            retry_after = _upstream_result(r, t0, attempt)
+            if retry_after is None:
+                return r
+        attempt += 1
+        delay = _retry_delay(attempt, retry_after)
+        _budget_sleep_ok(deadline, delay)
+        time.sleep(delay)
+
+@traced("trendyol.fetch_orders")
 def fetch_orders(
     start_ms: int | None = None,
     end_ms: int | None = None,
     order_number: str | None = None,
-    max_pages: int = 300
-) -> list[dict]:
+    max_pages: int = 300,
+    on_page=None,
+    deadline: Optional[float] = None,
+    start_page: int = 0,
+) -> FetchResult:
     """
     Sağlam sayfalama + opsiyonel orderNumber filtresi.
+    on_page(page, total_pages, content) her sayfadan sonra çağrılır (ilerleme / iptal);
+    True dönerse tarama orada biter.
+    deadline (time.monotonic) dolarsa ya da max_pages sayfaya varılırsa o ana kadarki
+    siparişler truncated + next_page ile döner; start_page=next_page ile devam edilir.
     """
     url, headers = trendyol_headers()
-    orders: list[dict] = []
+    orders = FetchResult()
+    newest = 0
 
-    page = 0
+    page = start_page
     while True:
         params = {"page": page, "size": PAGE_SIZE}
         if start_ms is not None:
@@ -270,31 +1808,39 @@ def fetch_orders(
         if order_number:
             params["orderNumber"] = str(order_number).strip()
 
-        r = requests.get(url, headers=headers, params=params, timeout=60)
-        if r.status_code >= 400:
-            raise HTTPException(status_code=502, detail=f"Trendyol API hata: {r.status_code} - {r.text}")
-
+        try:
+            r = _trendyol_get(url, headers, params, timeout=60, deadline=deadline)
+        except BudgetExceeded:
+            orders.truncate("deadline", page)
+            break
         data = r.json() or {}
         content = data.get("content") or []
         if not content:
             break
 
         orders.extend(content)
+        newest = max(newest, _newest_modified(content))
+        span_set(pages=page + 1, orders=len(orders))
 
         total_pages = data.get("totalPages")
+        if on_page is not None and on_page(page, total_pages, content):
+            break
         if isinstance(total_pages, int) and page >= (total_pages - 1):
             break
 
         page += 1
-        if page >= max_pages:
+        if page - start_page >= max_pages:
+            orders.truncate("max_pages", page)
             break
 
+    note_orders_watermark(newest)
     return orders
 
-def find_order_by_number(order_number: str) -> Optional[dict]:
+def find_order_by_number(order_number: str, deep: bool = True, on_page=None) -> Optional[dict]:
     """
     1) Önce orderNumber filtresiyle hızlı dene (180 gün)
     2) Olmazsa 365 gün geniş aralık brute-force (limitli sayfalama)
+    deep=False ise sadece 1. adım yapılır; 2. adım arka plan işine (find_order) bırakılır.
     """
     order_number = str(order_number).strip()
     if not order_number:
@@ -308,19 +1854,424 @@ def find_order_by_number(order_number: str) -> Optional[dict]:
     for o in orders:
         if str(o.get("orderNumber") or "").strip() == order_number:
             return o
+    if not deep:
+        return None
 
     # 2) geniş aralık: 365 gün (filter yoksa yakalasın diye)
+    found: list[dict] = []
+
+    def _scan(page, total_pages, content):
+        for o in content:
+            if str(o.get("orderNumber") or "").strip() == order_number:
+                found.append(o)
+        if on_page is not None:
+            on_page(page, total_pages, content)
+        return bool(found)
+
     start2 = now - timedelta(days=365)
-    orders2 = fetch_orders(start_ms=_ms(start2), end_ms=_ms(now), order_number=None, max_pages=300)
-    for o in orders2:
-        if str(o.get("orderNumber") or "").strip() == order_number:
-            return o
+    fetch_orders(start_ms=_ms(start2), end_ms=_ms(now), order_number=None, max_pages=300, on_page=_scan)
+    return found[0] if found else None
+
+@traced("trendyol.fetch_claims")
+def fetch_claims(start_ms: int, end_ms: int, on_page, max_pages: int = 300) -> int:
+    """İade talepleri (claimDate aralığı). Her sayfa on_page(content) ile verilir, bellekte birikmez.
+    Çekilen sayfa sayısını döner."""
+    url, headers = trendyol_headers()
+    url = url.rsplit("/", 1)[0] + "/claims"
+    page = 0
+    while page < max_pages:
+        r = _trendyol_get(url, headers, {"page": page, "size": PAGE_SIZE, "startDate": start_ms, "endDate": end_ms})
+        data = r.json() or {}
+        content = data.get("content") or []
+        if not content:
+            break
+        on_page(content)
+        span_set(pages=page + 1)
+        total_pages = data.get("totalPages")
+        if isinstance(total_pages, int) and page >= (total_pages - 1):
+            page += 1
+            break
+        page += 1
+    return page
+
+@traced("trendyol.fetch_settlements")
+def fetch_settlements(start_ms: int, end_ms: int, on_page, max_pages: int = 300) -> int:
+    """Cari hesap hareketleri (transactionDate aralığı, SETTLEMENT_TYPES türleri).
+    API 15 günden uzun aralık kabul etmiyor; aralık parçalanır. Çekilen sayfa sayısını döner."""
+    _, headers = trendyol_headers()
+    url = f"{TRENDYOL_BASE_URL}/integration/finance/che/sellers/{SELLERS[current_seller_id()]['id']}/settlements"
+    pages = 0
+    chunk_ms = 15 * 86_400_000 - 1
+    for tx_type in SETTLEMENT_TYPES:
+        lo = start_ms
+        while lo <= end_ms:
+            hi = min(end_ms, lo + chunk_ms)
+            page = 0
+            while page < max_pages:
+                params = {"page": page, "size": SETTLEMENT_PAGE_SIZE, "startDate": lo, "endDate": hi,
+                          "transactionType": tx_type}
+                data = _trendyol_get(url, headers, params).json() or {}
+                content = data.get("content") or []
+                if not content:
+                    break
+                on_page(content)
+                pages += 1
+                total_pages = data.get("totalPages")
+                if isinstance(total_pages, int) and page >= (total_pages - 1):
+                    break
+                page += 1
+            lo = hi + 1
+    span_set(pages=pages)
+    return pages
+
+# =========================
+# TRENDYOL ASYNC (httpx)
+# =========================
+# Sync fetch_orders bir taramanın tamamı boyunca threadpool thread'i tutuyor;
+# birkaç yavaş rapor /health'i ve UI'ı aç bırakıyordu. Rapor yolları bu async
+# istemciyi kullanır: sayfa 0'dan totalPages öğrenilir, kalanlar
+# TRENDYOL_CONCURRENCY kadar paralel çekilir. CPU işi (özet, satırlar, Excel,
+# tablo render) run_in_threadpool / iterate_in_threadpool ile açıkça thread'e verilir.
+# Arka plan işleri ve tekil aramalar sync fetch_orders'ı kullanmaya devam eder.
+ASYNC_HTTP = {"client": None}
+logging.getLogger("httpx").setLevel(logging.WARNING)  # her sayfa isteğini INFO'da loglamasın
+
+def async_http() -> httpx.AsyncClient:
+    client = ASYNC_HTTP["client"]
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=httpx.Limits(max_connections=TRENDYOL_CONCURRENCY * 4))
+        ASYNC_HTTP["client"] = client
+    return client
+
+async def _trendyol_get_async(url: str, headers: dict, params: dict, timeout: float = 60, deadline: Optional[float] = None):
+    with span("trendyol.get", page=params.get("page")):
+        attempt = 0
+        while True:
+            retry_after = 0.0
+            t0 = time.perf_counter()
+            BREAKER.before()
+            await UPSTREAM.acquire_async()
+            page_timeout = _budget_timeout(deadline, timeout)
+            try:
+                r = await async_http().get(url, headers=headers, params=params, timeout=page_timeout)
+            except httpx.HTTPError as e:
+                if page_timeout < timeout and isinstance(e, httpx.TimeoutException):
+                    raise BudgetExceeded() from e
+                _upstream_conn_error(attempt)
+            else:
+                retry_after = _upstream_result(r, t0, attempt)
+                if retry_after is None:
+                    return r
+            attempt += 1
+            delay = _retry_delay(attempt, retry_after)
+            _budget_sleep_ok(deadline, delay)
+            await asyncio.sleep(delay)
+
+async def fetch_orders_async(
+    start_ms: int | None = None,
+    end_ms: int | None = None,
+    order_number: str | None = None,
+    max_pages: int = 300,
+    deadline: Optional[float] = None,
+    start_page: int = 0,
+    progress: Optional[dict] = None,
+) -> FetchResult:
+    """fetch_orders ile aynı sonuç; ilk sayfadan sonrası eşzamanlı çekilir.
+    Bütçe dolunca baştan kesintisiz gelen sayfalar döner (truncated, next_page).
+    progress verilirse biten her sayfa progress[page] = content olarak yazılır."""
+    url, headers = trendyol_headers()
+
+    def params(page: int) -> dict:
+        p = {"page": page, "size": PAGE_SIZE}
+        if start_ms is not None:
+            p["startDate"] = start_ms
+        if end_ms is not None:
+            p["endDate"] = end_ms
+        if order_number:
+            p["orderNumber"] = str(order_number).strip()
+        return p
+
+    async def page_content(page: int) -> list[dict]:
+        r = await _trendyol_get_async(url, headers, params(page), deadline=deadline)
+        content = (r.json() or {}).get("content") or []
+        if progress is not None:
+            progress[page] = content
+        return content
+
+    result = FetchResult()
+    pages: list[list[dict]] = []
+    with span("trendyol.fetch_orders", mode="async") as sp:
+        try:
+            r = await _trendyol_get_async(url, headers, params(start_page), deadline=deadline)
+        except BudgetExceeded:
+            result.truncate("deadline", start_page)
+            return result
+        data = r.json() or {}
+        first = data.get("content") or []
+        if progress is not None:
+            progress[start_page] = first
+        pages.append(first)
+        total_pages = data.get("totalPages")
+        stop = start_page + max_pages
+        if first and isinstance(total_pages, int):
+            sem = asyncio.Semaphore(TRENDYOL_CONCURRENCY)
+
+            async def limited(page: int) -> list[dict]:
+                async with sem:
+                    return await page_content(page)
+
+            rest = range(start_page + 1, min(total_pages, stop))
+            got = await asyncio.gather(*(limited(p) for p in rest), return_exceptions=True)
+            # sadece kesintisiz önek: devam anahtarı "şu sayfadan sonrası" diyebilsin
+            for page, content in zip(rest, got):
+                if isinstance(content, BudgetExceeded):
+                    result.truncate("deadline", page)
+                    break
+                if isinstance(content, BaseException):
+                    raise content
+                pages.append(content)
+            if not result.truncated and total_pages > stop:
+                result.truncate("max_pages", stop)
+        elif first:
+            # totalPages dönmezse sync yoldaki gibi boş sayfaya kadar sırayla
+            for page in range(start_page + 1, stop):
+                try:
+                    content = await page_content(page)
+                except BudgetExceeded:
+                    result.truncate("deadline", page)
+                    break
+                if not content:
+                    break
+                pages.append(content)
+            else:
+                result.truncate("max_pages", stop)
+        result.extend(o for content in pages for o in content)
+        sp.set(pages=len(pages), orders=len(result))
+
+    await run_in_threadpool(note_orders_watermark, max((_newest_modified(c) for c in pages), default=0))
+    return result
+
+@app.on_event("shutdown")
+async def _close_async_http():
+    client = ASYNC_HTTP["client"]
+    ASYNC_HTTP["client"] = None
+    if client is not None:
+        await client.aclose()
+
+# =========================
+# SON GEÇERLİ VERİ (stale-while-revalidate)
+# =========================
+# Her başarılı tarama (aralık anahtarıyla) paylaşılan önbelleğe yazılır. Devre
+# açıksa, upstream hata verirse ya da tarama SWR_BUDGET_SECONDS'ı aşarsa sayfa
+# son geçerli veriyle ve "eski veri" işaretiyle döner; tarama arka planda sürer
+# ve bitince önbelleği tazeler. Aynı anahtar için eşzamanlı taramalar süreç
+# içinde tek task'ı, worker'lar arasında tek lease'i paylaşır: lease'i alamayan
+# worker upstream'e gitmez, diğerinin yazmasını bekler. ORDERS_CACHE_TTL içinde
+# ve sipariş filigranı ilerlemediyse kayıtlı tarama hiç upstream'e gidilmeden döner.
+# Son veri yoksa ve isteğin bütçesi (deadline) dolarsa, süren taramanın o ana
+# kadar gelen sayfaları "yarım" işaretiyle döner.
+SWR_BUDGET_SECONDS = float(os.getenv("SWR_BUDGET_SECONDS", "10"))
+SWR_TTL_SECONDS = float(os.getenv("SWR_TTL_SECONDS", str(24 * 3600)))
+ORDERS_CACHE_TTL = float(os.getenv("ORDERS_CACHE_TTL", "60"))
+SCAN_LEASE_SECONDS = float(os.getenv("SCAN_LEASE_SECONDS", "120"))
+SWR_INFLIGHT: dict = {}
+
+_metric("swr_served_total", "Eski (son geçerli) veriyle verilen cevaplar (reason=circuit_open|slow|error).", "counter")
+_metric("swr_shared_scans_total", "Başka worker'ın taramasını bekleyip sonucunu kullanan taramalar.", "counter")
+
+def _orders_version() -> int:
+    return get_data_versions().get("orders", (0, ""))[0]
+
+def swr_get(key: str) -> Optional[dict]:
+    return CACHE.get_json(f"swr:{key}")
+
+def swr_put(key: str, result: FetchResult, version: int):
+    # sayfa sınırına takılmış tarama da saklanır; işareti stale dönüşte kaybolmasın
+    meta = {"truncated": result.truncated, "next_page": result.next_page} if result.truncated else {}
+    CACHE.set_json(f"swr:{key}", {
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "ts": time.time(),
+        # tarama başlarken bilinen filigran ya da taramanın gördüğü en yeni değişiklik
+        "version": max(version, _newest_modified(result)),
+        "items": list(result),
+        "meta": meta,
+    }, SWR_TTL_SECONDS)
+
+def swr_lookup(key: str) -> tuple[Optional[dict], bool]:
+    """(son kayıt, taze mi) — taze: ORDERS_CACHE_TTL içinde ve filigran ilerlememiş."""
+    last = swr_get(key)
+    fresh = bool(last) and time.time() - last["ts"] < ORDERS_CACHE_TTL and last["version"] >= _orders_version()
+    return last, fresh
+
+def _swr_done(key: str, task: asyncio.Task):
+    SWR_INFLIGHT.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # bekleyen kalmadıysa "exception was never retrieved" olmasın
+
+def _stale(last: dict, reason: str, why: str) -> FetchResult:
+    metric_inc("swr_served_total", reason=reason)
+    span_set(stale=reason)
+    return FetchResult(last["items"], stale_at=last["saved_at"], stale_reason=why, **last["meta"])
+
+async def _scan_shared(key: str, start_ms: int, end_ms: int, max_pages: int, progress: dict) -> FetchResult:
+    """Aralığı tarayıp önbelleğe yazar; aynı anahtarı başka worker tarıyorsa onun sonucunu bekler."""
+    lease = f"lease:{key}"
+    started = time.time()
+    version = await run_in_threadpool(_orders_version)
+    owner = f"{os.getpid()}:{secrets.token_hex(4)}".encode()
+    # lease düşerse (tarama hata verdi / worker öldü) yeniden add denenir: bekleyen
+    # worker'lardan yalnızca biri devralır, diğerleri onu beklemeye döner
+    while not await run_in_threadpool(CACHE.add, lease, owner, SCAN_LEASE_SECONDS):
+        while True:
+            # önce lease, sonra sonuç: swr_put lease silinmeden yapıldığı için biten tarama kaçmaz
+            gone = await run_in_threadpool(CACHE.get, lease) is None
+            last = await run_in_threadpool(swr_get, key)
+            if last and last["ts"] >= started:
+                metric_inc("swr_shared_scans_total")
+                return FetchResult(last["items"], **last["meta"])
+            if gone:
+                break
+            await asyncio.sleep(0.25)
+    try:
+        result = await fetch_orders_async(start_ms=start_ms, end_ms=end_ms, max_pages=max_pages, progress=progress)
+        await run_in_threadpool(swr_put, key, result, version)
+        return result
+    finally:
+        await run_in_threadpool(CACHE.release, lease, owner)
+
+def _partial(progress: dict, start_page: int = 0) -> FetchResult:
+    """Süren taramanın o ana kadar baştan kesintisiz gelen sayfaları."""
+    page = start_page
+    result = FetchResult()
+    while page in progress:
+        result.extend(progress[page])
+        page += 1
+    result.truncate("deadline", page)
+    return result
+
+async def fetch_orders_swr(start_ms: int, end_ms: int, max_pages: int = 300, deadline: Optional[float] = None) -> FetchResult:
+    key = f"orders:{current_seller_id()}:{start_ms}:{end_ms}:{max_pages}"
+    last, fresh = await run_in_threadpool(swr_lookup, key)
+    if fresh:
+        return FetchResult(last["items"], **last["meta"])
+    if last and BREAKER.is_open():
+        return _stale(last, "circuit_open", "Trendyol şu an erişilemiyor")
+    entry = SWR_INFLIGHT.get(key)
+    if entry is None:
+        # paylaşılan tarama bütçesizdir: isteğin süresi dolsa da tamamlanıp önbelleği doldurur
+        progress: dict = {}
+        task = asyncio.ensure_future(_scan_shared(key, start_ms, end_ms, max_pages, progress))
+        entry = SWR_INFLIGHT[key] = (task, progress)
+        task.add_done_callback(functools.partial(_swr_done, key))
+    task, progress = entry
+    waits = ([SWR_BUDGET_SECONDS] if last else []) + ([deadline - time.monotonic()] if deadline is not None else [])
+    try:
+        # shield: bütçe dolsa da istemci kopsa da tarama arka planda tamamlanıp depoyu tazeler
+        return await asyncio.wait_for(asyncio.shield(task), max(0.0, min(waits)) if waits else None)
+    except asyncio.TimeoutError:
+        if not last:
+            return _partial(progress)
+        return _stale(last, "slow", "Trendyol yavaş yanıt veriyor; arka planda yenileniyor")
+    except HTTPException as e:
+        if not last:
+            raise
+        return _stale(last, "error", f"Trendyol hatası ({e.detail})")
+
+# =========================
+# KOŞULLU YANIT (ETag / Last-Modified)
+# =========================
+# Dashboard yenilemeleri aynı veriyi tekrar tekrar hesaplıyordu. ETag veri
+# filigranından (en yeni sipariş değişikliği + maliyet/fatura tablosu sürümü)
+# türetilir; If-None-Match tutarsa aggregation'a girmeden 304 dönülür.
+# Sipariş filigranı en fazla ORDERS_WATERMARK_TTL saniyede bir, tek satırlık
+# (size=1, lastModifiedDate'e göre) ucuz bir Trendyol isteğiyle doğrulanır.
+ORDERS_WATERMARK_TTL = int(os.getenv("ORDERS_WATERMARK_TTL", "60"))
+WATERMARK_STATE = {"orders_checked": {}}  # satıcı -> son kontrol zamanı
+
+def _newest_modified(content: list[dict]) -> int:
+    newest = 0
+    for o in content:
+        v = o.get("lastModifiedDate") or o.get("orderDate")
+        if isinstance(v, int) and v > newest:
+            newest = v
+    return newest
+
+def note_orders_watermark(newest_ms: int):
+    if not newest_ms:
+        return
+    conn = db()
+    bump_data_version(conn, "orders", newest_ms)
+    conn.commit()
+    conn.close()
 
+def refresh_orders_watermark():
+    """TTL dolduysa en son değişen siparişi sorup filigranı günceller. Hata sayfayı bozmasın."""
+    now = time.time()
+    sid = current_seller_id()
+    if now - WATERMARK_STATE["orders_checked"].get(sid, 0.0) < ORDERS_WATERMARK_TTL:
+        return
+    WATERMARK_STATE["orders_checked"][sid] = now
+    try:
+        url, headers = trendyol_headers()
+        params = {"page": 0, "size": 1, "orderByField": "LastModifiedDate", "orderByDirection": "DESC"}
+        BREAKER.before()
+        UPSTREAM.acquire()
+        r = requests.get(url, headers=headers, params=params, timeout=10)
+        metric_inc("trendyol_response_bytes_total", len(r.content or b""))
+        if r.status_code < 400:
+            note_orders_watermark(_newest_modified((r.json() or {}).get("content") or []))
+    except Exception as e:
+        logger.info("orders watermark probe failed: %s", e)
+
+def data_etag(request: Request, sources: tuple[str, ...]) -> tuple[str, str]:
+    """(ETag, Last-Modified) — istek parametreleri + kaynak filigranlarından."""
+    if "orders" in sources:
+        refresh_orders_watermark()
+    versions = get_data_versions()
+    # devre durumu da anahtarda: kesinti sırasında verilen eski sayfa, düzelince 304 ile kalmasın
+    parts = [current_seller_id(), request.url.path, str(request.url.query), date.today().isoformat(), str(INVOICE_RATE), BREAKER.state]
+    last = None
+    for name in sources:
+        version, updated_at = versions.get(name, (0, ""))
+        parts.append(f"{name}={version}")
+        if updated_at and (last is None or updated_at > last):
+            last = updated_at
+    digest = hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+    # varsayılan aralıklar bugüne bağlı: gün dönünce de değişmiş sayılır
+    last_dt = datetime.combine(date.today(), datetime.min.time())
+    if last:
+        last_dt = max(last_dt, datetime.fromisoformat(last))
+    return f'"{digest}"', format_datetime(last_dt.astimezone(), usegmt=True)
+
+def conditional_headers(etag: str, last_modified: str) -> dict:
+    # no-cache: tarayıcı saklar ama her seferinde ETag ile doğrular
+    return {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "private, no-cache"}
+
+def not_modified(request: Request, etag: str, last_modified: str) -> Optional[Response]:
+    hit = False
+    inm = request.headers.get("if-none-match")
+    ims = request.headers.get("if-modified-since")
+    if inm is not None:
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        hit = etag in tags or "*" in tags
+    elif ims:
+        try:
+            hit = parsedate_to_datetime(last_modified) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            hit = False
+    if hit and CACHE.get(f"etag:failed:{etag}"):
+        hit = False  # bu ETag ile verilen gövde yarıda hata basmıştı
+    metric_inc("cache_requests_total", cache="etag", result="hit" if hit else "miss")
+    if hit:
+        return Response(status_code=304, headers=conditional_headers(etag, last_modified))
     return None
 
 # =========================
 # KAR/ZARAR
 # =========================
+INVOICE_KEY = f"fatura_%{int(INVOICE_RATE*100)}"
+INVOICE_COLUMN = f"Fatura %{int(INVOICE_RATE*100)}"
+
 def calc_profit_for_line(line: dict) -> dict:
     sale = get_sale_price(line)
     commission = get_commission(line)
@@ -340,43 +2291,264 @@ def calc_profit_for_line(line: dict) -> dict:
         "kargo": 0.0,
         "satici_indirim": round(seller_disc, 2),
         "trendyol_indirim": round(ty_disc, 2),
-        f"fatura_%{int(INVOICE_RATE*100)}": round(invoice, 2),
+        INVOICE_KEY: round(invoice, 2),
         "toplam_kesinti": round(total_deductions, 2),
         "net_kar": round(net_profit, 2),
     }
 
 # =========================
-# E-ARŞİV TASLAK
+# RAPOR HESAPLARI
 # =========================
-def extract_customer_from_order(order: dict) -> dict:
-    inv = order.get("invoiceAddress") or {}
-    name = (inv.get("fullName") or f"{inv.get('name','')} {inv.get('surname','')}".strip()).strip()
-    vkn = str(inv.get("taxNumber") or inv.get("identityNumber") or "").strip()
-    addr = (inv.get("fullAddress") or inv.get("address") or "").strip()
-    city = (inv.get("city") or "").strip()
-    district = (inv.get("district") or inv.get("town") or "").strip()
-    fallback_name = (str(order.get("customerFirstName") or "") + " " + str(order.get("customerLastName") or "")).strip()
+def _in_range(o: dict, start_ms: int, end_ms: int) -> bool:
+    od = o.get("orderDate")
+    return not (isinstance(od, int) and not (start_ms <= od <= end_ms))
 
-    return {
-        "name": name or fallback_name,
-        "vkn_tckn": vkn,
-        "address": addr,
-        "city": city,
-        "district": district,
-    }
+@traced("compute.summary")
+def summarize_orders(orders: list[dict], start: str, end: str) -> dict:
+    start_ms, end_ms = date_range_to_ms(start, end)
 
-def get_existing_invoice_id_by_order(order_no: str) -> Optional[int]:
-    conn = db()
-    row = conn.execute("SELECT id FROM invoices WHERE order_number=? ORDER BY id DESC LIMIT 1", (order_no,)).fetchone()
-    conn.close()
-    if row:
-        return int(row["id"])
-    return None
+    toplam_siparis = 0
+    toplam_satis = toplam_komisyon = 0.0
+    toplam_satici_indirim = toplam_trendyol_indirim = 0.0
+    toplam_fatura = toplam_net = toplam_kesinti = 0.0
 
-def create_invoice_draft_from_order(order: dict) -> int:
-    order_no = str(order.get("orderNumber") or "").strip()
-    if not order_no:
-        raise HTTPException(400, "Sipariş numarası bulunamadı.")
+    for o in orders:
+        if not _in_range(o, start_ms, end_ms):
+            continue
+
+        toplam_siparis += 1
+        for l in (o.get("lines") or []):
+            calc = calc_profit_for_line(l)
+            toplam_satis += calc["satis"]
+            toplam_komisyon += calc["komisyon"]
+            toplam_satici_indirim += calc["satici_indirim"]
+            toplam_trendyol_indirim += calc["trendyol_indirim"]
+            toplam_fatura += calc.get(f"fatura_%{int(INVOICE_RATE*100)}", 0.0)
+            toplam_net += calc["net_kar"]
+            toplam_kesinti += calc["toplam_kesinti"]
+    span_set(orders=toplam_siparis)
+
+    return {
+        "tarih": {"start": start, "end": end},
+        "siparis": int(toplam_siparis),
+        "satis_toplam": round(toplam_satis, 2),
+        "komisyon_toplam": round(toplam_komisyon, 2),
+        "kargo_toplam": 0.0,
+        "satici_indirim_toplam": round(toplam_satici_indirim, 2),
+        "trendyol_indirim_toplam": round(toplam_trendyol_indirim, 2),
+        f"fatura_%{int(INVOICE_RATE*100)}_toplam": round(toplam_fatura, 2),
+        "toplam_kesinti_toplam": round(toplam_kesinti, 2),
+        "net_kar_toplam": round(toplam_net, 2),
+    }
+
+def _report_row(order_no: str, line: dict, calc: dict) -> dict:
+    """Rapor satırı (Excel, /report/lines, panel tablosu); fatura kolonu INVOICE_RATE'e göre adlanır."""
+    return {
+        "Sipariş": order_no,
+        "Ürün": line.get("productName") or "",
+        "Kampanya": calc["kampanya"],
+        "Satış": calc["satis"],
+        "Komisyon": calc["komisyon"],
+        "Kargo": 0.0,
+        "Satıcı İndirim": calc["satici_indirim"],
+        "Trendyol İndirim": calc["trendyol_indirim"],
+        INVOICE_COLUMN: calc[INVOICE_KEY],
+        "Net Kâr": calc["net_kar"],
+    }
+
+@traced("compute.rows")
+def order_rows(orders: list[dict], start_ms: int, end_ms: int) -> list[dict]:
+    rows = []
+    for o in orders:
+        if not _in_range(o, start_ms, end_ms):
+            continue
+
+        order_no = o.get("orderNumber") or ""
+        for l in (o.get("lines") or []):
+            calc = calc_profit_for_line(l)
+            rows.append(_report_row(order_no, l, calc))
+    span_set(lines=len(rows))
+    return rows
+
+# Panel paketi (/report/bundle): KPI'lar, ilk N satır ve grafik serisi tek
+# geçişte. Satırlar sınırlı bir heap'te tutulur, seri gün kovalarından sunucu
+# tarafında nokta bütçesine indirgenir; cevap boyu satır sayısıyla büyümez.
+BUNDLE_TOP = int(os.getenv("BUNDLE_TOP", "50"))
+BUNDLE_POINTS = int(os.getenv("BUNDLE_POINTS", "90"))
+BUNDLE_SORTS = ("recent", "net", "loss")
+SERIES_MODES = ("auto", "daily", "weekly", "lttb")
+
+def lttb(points: list, budget: int, y: int = 1) -> list:
+    """Largest-Triangle-Three-Buckets: sıralı noktalardan şekli koruyan budget tanesi (ilk/son dahil).
+    points: (x, ...) tuple'ları; y seçimde kullanılan alanın indeksi."""
+    n = len(points)
+    if budget >= n or budget < 3:
+        return list(points)
+    out = [points[0]]
+    every = (n - 2) / (budget - 2)
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        if nlo >= nhi:
+            nlo, nhi = n - 1, n
+        avg_x = sum(p[0] for p in points[nlo:nhi]) / (nhi - nlo)
+        avg_y = sum(p[y] for p in points[nlo:nhi]) / (nhi - nlo)
+        ax, ay = points[a][0], points[a][y]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((ax - avg_x) * (points[j][y] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(points[best])
+        a = best
+    out.append(points[-1])
+    return out
+
+def downsample_series(days: dict, start: str, end: str, points: int, mode: str = "auto") -> dict:
+    """days: 'YYYY-MM-DD' -> [sipariş, satış, net]. Boş günler sıfırla doldurulur.
+    auto: gün sayısı bütçeye sığıyorsa günlük, haftalık sığıyorsa haftalık, değilse LTTB."""
+    s, e = date.fromisoformat(start), date.fromisoformat(end)
+    daily = []
+    d = s
+    while d <= e:
+        v = days.get(d.isoformat(), (0, 0.0, 0.0))
+        daily.append((d.toordinal(), *v))
+        d += timedelta(days=1)
+    if mode == "auto":
+        mode = "daily" if len(daily) <= points else "weekly" if (len(daily) + 6) // 7 <= points else "lttb"
+    if mode == "weekly":
+        weeks: dict[int, list] = {}
+        for x, orders, sale, net in daily:
+            monday = x - date.fromordinal(x).weekday()
+            w = weeks.setdefault(monday, [x, x, 0, 0.0, 0.0])
+            w[1] = x
+            w[2] += orders
+            w[3] += sale
+            w[4] += net
+        buckets = list(weeks.values())
+    else:
+        picked = lttb(daily, points, y=3) if mode == "lttb" else daily
+        buckets = [(x, x, orders, sale, net) for x, orders, sale, net in picked]
+    return {
+        "mode": mode,
+        "days": len(daily),
+        "points": [{"start": date.fromordinal(b[0]).isoformat(), "end": date.fromordinal(b[1]).isoformat(),
+                    "siparis": b[2], "satis": round(b[3], 2), "net": round(b[4], 2)} for b in buckets],
+    }
+
+@traced("compute.bundle")
+def bundle_from_orders(orders: list[dict], start: str, end: str, top: int = BUNDLE_TOP, sort: str = "recent",
+                       points: int = BUNDLE_POINTS, series: str = "auto") -> dict:
+    """summarize_orders toplamları + sıralamaya göre ilk N satır (order_rows biçiminde) + seri."""
+    start_ms, end_ms = date_range_to_ms(start, end)
+    t = {"siparis": 0, "satis": 0.0, "komisyon": 0.0, "satici_indirim": 0.0, "trendyol_indirim": 0.0,
+         INVOICE_KEY: 0.0, "net_kar": 0.0, "toplam_kesinti": 0.0}
+    days: dict[str, list] = {}
+    heap: list = []  # (anahtar, sıra, satır) — en küçük anahtar tepede, top kadar
+    lines = seq = 0
+    for o in orders:
+        if not _in_range(o, start_ms, end_ms):
+            continue
+        od = o.get("orderDate")
+        day = _ms_day(od) if isinstance(od, int) else start
+        bucket = days.get(day)
+        if bucket is None:
+            bucket = days[day] = [0, 0.0, 0.0]
+        t["siparis"] += 1
+        bucket[0] += 1
+        order_no = o.get("orderNumber") or ""
+        for l in (o.get("lines") or []):
+            calc = calc_profit_for_line(l)
+            lines += 1
+            for k in ("satis", "komisyon", "satici_indirim", "trendyol_indirim", INVOICE_KEY, "net_kar", "toplam_kesinti"):
+                t[k] += calc[k]
+            bucket[1] += calc["satis"]
+            bucket[2] += calc["net_kar"]
+            if top <= 0:
+                continue
+            key = (od if isinstance(od, int) else 0) if sort == "recent" else calc["net_kar"] if sort == "net" else -calc["net_kar"]
+            if len(heap) >= top and key <= heap[0][0]:
+                continue
+            seq += 1
+            row = _report_row(order_no, l, calc)
+            if len(heap) < top:
+                heapq.heappush(heap, (key, -seq, row))
+            else:
+                heapq.heapreplace(heap, (key, -seq, row))
+    span_set(orders=t["siparis"], lines=lines)
+    return {
+        "tarih": {"start": start, "end": end},
+        "siparis": int(t["siparis"]),
+        "satis_toplam": round(t["satis"], 2),
+        "komisyon_toplam": round(t["komisyon"], 2),
+        "kargo_toplam": 0.0,
+        "satici_indirim_toplam": round(t["satici_indirim"], 2),
+        "trendyol_indirim_toplam": round(t["trendyol_indirim"], 2),
+        f"{INVOICE_KEY}_toplam": round(t[INVOICE_KEY], 2),
+        "toplam_kesinti_toplam": round(t["toplam_kesinti"], 2),
+        "net_kar_toplam": round(t["net_kar"], 2),
+        "satir": lines,
+        "siralama": sort,
+        "rows": [r for _, _, r in sorted(heap, reverse=True)],
+        "seri": downsample_series(days, start, end, points, series),
+    }
+
+def write_report_workbook(path: str, sumdata: dict, rows: list[dict]):
+    wb = Workbook()
+    ws1 = wb.active
+    ws1.title = "Ozet"
+    ws1.append(["Alan", "Tutar"])
+    ws1.append(["Start", sumdata["tarih"]["start"]])
+    ws1.append(["End", sumdata["tarih"]["end"]])
+    for k, v in sumdata.items():
+        if k == "tarih":
+            continue
+        ws1.append([k, v])
+
+    ws2 = wb.create_sheet("Detay")
+    if rows:
+        headers = list(rows[0].keys())
+        ws2.append(headers)
+        for r in rows:
+            ws2.append([r.get(h, "") for h in headers])
+    else:
+        ws2.append(["Bu tarih aralığında veri bulunamadı."])
+
+    wb.save(path)
+
+# =========================
+# E-ARŞİV TASLAK
+# =========================
+def extract_customer_from_order(order: dict) -> dict:
+    inv = order.get("invoiceAddress") or {}
+    name = (inv.get("fullName") or f"{inv.get('name','')} {inv.get('surname','')}".strip()).strip()
+    vkn = str(inv.get("taxNumber") or inv.get("identityNumber") or "").strip()
+    addr = (inv.get("fullAddress") or inv.get("address") or "").strip()
+    city = (inv.get("city") or "").strip()
+    district = (inv.get("district") or inv.get("town") or "").strip()
+    fallback_name = (str(order.get("customerFirstName") or "") + " " + str(order.get("customerLastName") or "")).strip()
+
+    return {
+        "name": name or fallback_name,
+        "vkn_tckn": vkn,
+        "address": addr,
+        "city": city,
+        "district": district,
+    }
+
+def get_existing_invoice_id_by_order(order_no: str) -> Optional[int]:
+    conn = db()
+    row = conn.execute("SELECT id FROM invoices WHERE order_number=? ORDER BY id DESC LIMIT 1", (order_no,)).fetchone()
+    conn.close()
+    if row:
+        return int(row["id"])
+    return None
+
+def create_invoice_draft_from_order(order: dict) -> int:
+    order_no = str(order.get("orderNumber") or "").strip()
+    if not order_no:
+        raise HTTPException(400, "Sipariş numarası bulunamadı.")
 
     # ✅ aynı siparişe tekrar taslak açmayı engelle
     existing = get_existing_invoice_id_by_order(order_no)
@@ -433,6 +2605,7 @@ def create_invoice_draft_from_order(order: dict) -> int:
             invoice_id, il["name"], il["quantity"], il["unit_price"], il["line_total"], il["vat_rate"]
         ))
 
+    bump_data_version(conn, "invoices")
     conn.commit()
     conn.close()
     return int(invoice_id)
@@ -454,16 +2627,17 @@ def build_basic_ubl_xml(inv: dict, lines: list[dict]) -> bytes:
     SubElement(root, "IssueDate").text = inv["issue_date"]
     SubElement(root, "DocumentCurrencyCode").text = inv["currency"] or "TRY"
 
+    seller = seller_info()
     sup = SubElement(root, "AccountingSupplierParty")
     sup_p = SubElement(sup, "Party")
-    SubElement(sup_p, "PartyName").text = SELLER_TITLE
-    SubElement(sup_p, "CompanyID").text = SELLER_VKN
-    SubElement(sup_p, "TaxOffice").text = SELLER_TAX_OFFICE
+    SubElement(sup_p, "PartyName").text = seller["title"]
+    SubElement(sup_p, "CompanyID").text = seller["vkn"]
+    SubElement(sup_p, "TaxOffice").text = seller["tax_office"]
     addr = SubElement(sup_p, "PostalAddress")
-    SubElement(addr, "StreetName").text = SELLER_ADDRESS
-    SubElement(addr, "CityName").text = SELLER_CITY
-    SubElement(addr, "CitySubdivisionName").text = SELLER_DISTRICT
-    SubElement(sup_p, "ElectronicMail").text = SELLER_EMAIL
+    SubElement(addr, "StreetName").text = seller["address"]
+    SubElement(addr, "CityName").text = seller["city"]
+    SubElement(addr, "CitySubdivisionName").text = seller["district"]
+    SubElement(sup_p, "ElectronicMail").text = seller["email"]
 
     cus = SubElement(root, "AccountingCustomerParty")
     cus_p = SubElement(cus, "Party")
@@ -511,9 +2685,10 @@ def build_pdf(inv: dict, lines: list[dict]) -> str:
     c.drawString(40, y, "Satıcı:")
     c.setFont("Helvetica", 10)
     y -= 15
-    c.drawString(60, y, f"{SELLER_TITLE} / VKN: {SELLER_VKN} / VD: {SELLER_TAX_OFFICE}")
+    seller = seller_info()
+    c.drawString(60, y, f"{seller['title']} / VKN: {seller['vkn']} / VD: {seller['tax_office']}")
     y -= 15
-    c.drawString(60, y, f"{SELLER_ADDRESS} {SELLER_DISTRICT}/{SELLER_CITY}")
+    c.drawString(60, y, f"{seller['address']} {seller['district']}/{seller['city']}")
     y -= 20
 
     c.setFont("Helvetica-Bold", 11)
@@ -564,11 +2739,1380 @@ def build_pdf(inv: dict, lines: list[dict]) -> str:
     c.save()
     return tmp.name
 
+# =========================
+# ARKA PLAN İŞLERİ (JOBS)
+# =========================
+# Yıllık Excel, toplu export ve 365 günlük sipariş araması HTTP isteği içinde
+# dakikalarca sürüyor ve proxy timeout'una takılıyordu. İş SQLite'a yazılır,
+# sınırlı sayıda worker thread öncelik sırasına göre çalıştırır; istemci
+# /jobs/{id} ile durumu izler, bitince /jobs/{id}/download ile sonucu alır.
+JOB_QUEUE: list = []          # heap: (priority, seq, seller_id, job_id)
+JOB_COND = threading.Condition()
+JOB_CANCEL: set = set()
+JOB_STATE = {"seq": 0, "workers": []}
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Çalışan işe verilir: ilerleme yazar, iptal isteğini kontrol eder."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def check(self):
+        if self.job_id in JOB_CANCEL:
+            raise JobCancelled()
+        # iptal başka bir worker process'inden de gelebilir
+        conn = db()
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE id=?", (self.job_id,)).fetchone()
+        conn.close()
+        if row and row["cancel_requested"]:
+            raise JobCancelled()
+
+    def progress(self, value: float, message: str = ""):
+        self.check()
+        job_update(self.job_id, progress=round(max(0.0, min(1.0, value)), 3), message=message)
+
+    def on_page(self, lo: float = 0.0, hi: float = 0.9):
+        # fetch_orders sayfa callback'i: ilerlemeyi [lo, hi] aralığına yayar
+        def _cb(page, total_pages, content):
+            total = total_pages if isinstance(total_pages, int) and total_pages > 0 else page + 2
+            self.progress(lo + (hi - lo) * (page + 1) / total, f"Trendyol sayfa {page + 1}/{total_pages or '?'}")
+        return _cb
+
+def job_update(job_id: str, when_status: Optional[str] = None, **fields) -> bool:
+    """when_status verilirse yalnızca iş hâlâ o durumdaysa yazar (tek UPDATE, worker'la yarışmaz).
+    Satır güncellendiyse True."""
+    if not fields:
+        return False
+    cols = ", ".join(f"{k}=?" for k in fields)
+    where, params = "id=?", [job_id]
+    if when_status is not None:
+        where += " AND status=?"
+        params.append(when_status)
+    conn = db()
+    cur = conn.execute(f"UPDATE jobs SET {cols} WHERE {where}", (*fields.values(), *params))
+    conn.commit()
+    conn.close()
+    return cur.rowcount == 1
+
+def get_job(job_id: str) -> dict:
+    conn = db()
+    row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    conn.close()
+    if not row:
+        raise HTTPException(404, "İş bulunamadı.")
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    return job
+
+def _job_result_path(job_id: str, suffix: str) -> str:
+    os.makedirs(JOB_DIR, exist_ok=True)
+    return os.path.join(JOB_DIR, f"{job_id}{suffix}")
+
+def _job_report_excel(ctx: JobContext, params: dict) -> tuple[str, str, str]:
+    start, end = params["start"], params["end"]
+    start_ms, end_ms = date_range_to_ms(start, end)
+    orders = fetch_orders(start_ms=start_ms, end_ms=end_ms, on_page=ctx.on_page(0.0, 0.8))
+    ctx.progress(0.85, "Excel hazırlanıyor")
+    path = _job_result_path(ctx.job_id, ".xlsx")
+    write_report_workbook(path, {**summarize_orders(orders, start, end), **orders.meta()}, order_rows(orders, start_ms, end_ms))
+    return (path, f"trendyol_kar_zarar_{start}_to_{end}.xlsx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+def _job_lines_csv(ctx: JobContext, params: dict) -> tuple[str, str, str]:
+    # toplu export: satır bazlı kâr/zarar CSV (Excel'in satır limitine takılmaz)
+    start, end = params["start"], params["end"]
+    start_ms, end_ms = date_range_to_ms(start, end)
+    orders = fetch_orders(start_ms=start_ms, end_ms=end_ms, on_page=ctx.on_page(0.0, 0.8))
+    ctx.progress(0.85, "CSV yazılıyor")
+    rows = order_rows(orders, start_ms, end_ms)
+    path = _job_result_path(ctx.job_id, ".csv")
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        if rows:
+            w = csv.DictWriter(f, fieldnames=list(rows[0].keys()), delimiter=";")
+            w.writeheader()
+            w.writerows(rows)
+    return path, f"trendyol_satirlar_{start}_to_{end}.csv", "text/csv"
+
+def _job_find_order(ctx: JobContext, params: dict) -> tuple[str, str, str]:
+    order_no = params["orderNumber"]
+    ctx.progress(0.02, "Hızlı arama (orderNumber filtresi)")
+    o = find_order_by_number(order_no, deep=True, on_page=ctx.on_page(0.05, 0.95))
+    result = {"found": bool(o), "orderNumber": order_no, "invoice_id": None}
+    if o:
+        result.update({
+            "orderDate": o.get("orderDate"),
+            "status": o.get("status"),
+            "shipmentPackageId": o.get("shipmentPackageId"),
+            "lines_count": len(o.get("lines") or []),
+        })
+        if params.get("create_draft"):
+            result["invoice_id"] = create_invoice_draft_from_order(o)
+    path = _job_result_path(ctx.job_id, ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    return path, f"siparis_{order_no}.json", "application/json"
+
+JOB_KINDS = {
+    "report_excel": _job_report_excel,
+    "lines_csv": _job_lines_csv,
+    "find_order": _job_find_order,
+}
+
+def _prune_jobs():
+    cutoff = (datetime.now() - timedelta(hours=JOB_TTL_HOURS)).isoformat(timespec="seconds")
+    conn = db()
+    old = conn.execute(
+        "SELECT id, result_path FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+    ).fetchall()
+    for r in old:
+        if r["result_path"] and os.path.exists(r["result_path"]):
+            try:
+                os.remove(r["result_path"])
+            except OSError:
+                pass
+    conn.executemany("DELETE FROM jobs WHERE id=?", [(r["id"],) for r in old])
+    conn.commit()
+    conn.close()
+
+def submit_job(kind: str, params: dict, priority: int = 5) -> str:
+    if kind not in JOB_KINDS:
+        raise HTTPException(400, f"Bilinmeyen iş türü: {kind}")
+    with JOB_COND:
+        if len(JOB_QUEUE) >= JOB_QUEUE_MAX:
+            raise HTTPException(429, "İş kuyruğu dolu, biraz sonra tekrar dene.", headers={"Retry-After": "30"})
+
+    _prune_jobs()
+    job_id = uuid.uuid4().hex
+    conn = db()
+    conn.execute(
+        "INSERT INTO jobs(id, kind, params, priority, status, created_at) VALUES(?,?,?,?,?,?)",
+        (job_id, kind, json.dumps(params, ensure_ascii=False), int(priority), "queued",
+         datetime.now().isoformat(timespec="seconds")),
+    )
+    conn.commit()
+    conn.close()
+    _enqueue_job(job_id, priority, current_seller_id())
+    return job_id
+
+def _enqueue_job(job_id: str, priority: int, seller_id: str):
+    # iş, gönderildiği satıcının DB'sinde ve kimliğiyle çalışır
+    with JOB_COND:
+        JOB_STATE["seq"] += 1
+        heapq.heappush(JOB_QUEUE, (int(priority), JOB_STATE["seq"], seller_id, job_id))
+        JOB_COND.notify()
+
+def cancel_job(job_id: str) -> dict:
+    job = get_job(job_id)
+    if job["status"] in ("done", "failed", "cancelled"):
+        return job
+    # kuyruktaki iş hiç çalışmadan iptal edilir: durum kontrolü + yazma tek UPDATE'te,
+    # aynı anda işi alan worker'la yarışmaz (o da status='queued' şartıyla alır)
+    if job_update(job_id, when_status="queued", status="cancelled", cancel_requested=1, message="İptal edildi",
+                  finished_at=datetime.now().isoformat(timespec="seconds")):
+        with JOB_COND:
+            # iptal edilen iş JOB_QUEUE_MAX'tan yer tutmasın
+            JOB_QUEUE[:] = [e for e in JOB_QUEUE if e[3] != job_id]
+            heapq.heapify(JOB_QUEUE)
+    elif job_update(job_id, when_status="running", cancel_requested=1):
+        JOB_CANCEL.add(job_id)
+    return get_job(job_id)
+
+def _run_job(job_id: str):
+    try:
+        job = get_job(job_id)
+    except HTTPException:
+        return
+    # iş, hâlâ queued ise alınır; arada iptal edildiyse (başka süreçten de olabilir) atlanır
+    if not job_update(job_id, when_status="queued", status="running",
+                      started_at=datetime.now().isoformat(timespec="seconds")):
+        JOB_CANCEL.discard(job_id)
+        return
+
+    ctx = JobContext(job_id)
+    root = start_trace(f"job {job['kind']}", job_id=job_id)
+    try:
+        ctx.check()
+        path, name, media_type = JOB_KINDS[job["kind"]](ctx, job["params"])
+        job_update(job_id, status="done", progress=1.0, message="Tamamlandı",
+                   result_path=path, result_name=name, media_type=media_type,
+                   finished_at=datetime.now().isoformat(timespec="seconds"))
+    except JobCancelled:
+        job_update(job_id, status="cancelled", message="İptal edildi",
+                   finished_at=datetime.now().isoformat(timespec="seconds"))
+    except HTTPException as e:
+        job_update(job_id, status="failed", error=str(e.detail),
+                   finished_at=datetime.now().isoformat(timespec="seconds"))
+    except Exception:
+        tb = traceback.format_exc()
+        record_error(f"Job {job_id} ({job['kind']}) failed\n\n{tb}")
+        job_update(job_id, status="failed", error=tb.strip().splitlines()[-1],
+                   finished_at=datetime.now().isoformat(timespec="seconds"))
+    finally:
+        JOB_CANCEL.discard(job_id)
+        try:
+            root.set(status=get_job(job_id)["status"])
+        except HTTPException:
+            pass
+        finish_trace(root)
+        _CURRENT_SPAN.set(None)
+
+def _job_worker():
+    UPSTREAM_LANE.set("bulk")  # arka plan taramaları etkileşimli isteklerin önüne geçmesin
+    while True:
+        with JOB_COND:
+            while not JOB_QUEUE:
+                JOB_COND.wait()
+            _, _, seller_id, job_id = heapq.heappop(JOB_QUEUE)
+        with seller_scope(seller_id):
+            _run_job(job_id)
+
+def start_job_workers():
+    if JOB_STATE["workers"]:
+        return
+    # yeniden başlatmada yarım kalan işler: running -> failed, queued -> tekrar kuyruğa
+    for sid in seller_ids():
+        with seller_scope(sid):
+            conn = db()
+            conn.execute(
+                "UPDATE jobs SET status='failed', error='Sunucu yeniden başladı', finished_at=? WHERE status='running'",
+                (datetime.now().isoformat(timespec="seconds"),),
+            )
+            conn.commit()
+            pending = conn.execute("SELECT id, priority FROM jobs WHERE status='queued' ORDER BY created_at").fetchall()
+            conn.close()
+        for r in pending:
+            _enqueue_job(r["id"], r["priority"], sid)
+
+    for i in range(max(1, JOB_WORKERS)):
+        t = threading.Thread(target=_job_worker, name=f"job-worker-{i}", daemon=True)
+        t.start()
+        JOB_STATE["workers"].append(t)
+    logger.info("Job workers started: %s", len(JOB_STATE["workers"]))
+
+# =========================
+# SİPARİŞ DEPOSU + SENKRON (satıcı başına)
+# =========================
+# Her satıcı için ayrı bir thread siparişleri periyodik olarak kendi DB'sindeki
+# orders / order_lines tablolarına çeker: ilk turda SYNC_INITIAL_DAYS, sonra
+# durum değişiklikleri ve geç güncellemeler için SYNC_LOOKBACK_DAYS geriye,
+# SYNC_WINDOW_DAYS'lik pencerelerle. Sadece yeni ya da lastModifiedDate'i
+# ilerlemiş paketler yazılır. Çok worker'lı kurulumda satıcı başına tek süreç
+# senkronlar (paylaşılan önbellekte lease). Taramalar "bulk" şeridinde.
+# Aynı turda iade talepleri (claims API, talep tarihine göre) claims tablosuna
+# çekilir; iptal edilen satırlar sipariş yazılırken oraya "cancel" olarak düşer.
+# Sipariş penceresinden sonra açılan geç iadeler de böylece kaçmaz. Cari hesap
+# hareketleri (settlements) de aynı pencerelerle, işlem tarihine göre çekilir.
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", "300"))  # 0 = kapalı
+SYNC_INITIAL_DAYS = int(os.getenv("SYNC_INITIAL_DAYS", "90"))
+SYNC_LOOKBACK_DAYS = int(os.getenv("SYNC_LOOKBACK_DAYS", "14"))
+SYNC_WINDOW_DAYS = int(os.getenv("SYNC_WINDOW_DAYS", "14"))
+SYNC_LEASE_SECONDS = float(os.getenv("SYNC_LEASE_SECONDS", "900"))
+SYNC_STATE = {"threads": {}, "wake": {}}
+
+_metric("sync_runs_total", "Sipariş senkron turları (seller, result=ok|error|skipped).", "counter")
+_metric("sync_packages_total", "Depoya yazılan sipariş paketleri (seller, change=new|updated).", "counter")
+_metric("sync_claims_total", "Depoya yazılan iade talepleri (seller, change=new|updated).", "counter")
+_metric("sync_settlements_total", "Depoya yazılan yeni cari hesap hareketleri (seller).", "counter")
+
+def _package_id(o: dict) -> str:
+    return str(o.get("shipmentPackageId") or o.get("id") or o.get("orderNumber") or "")
+
+def store_orders(conn, orders: list[dict], delta: Optional[dict] = None) -> tuple[int, int]:
+    """Yeni / değişmiş paketleri ve satırlarını yazar. (yeni, güncellenen) döner; commit çağırana ait.
+    delta (new_event_delta()) verilirse gün toplamı farkları, yeni siparişler ve durum değişiklikleri oraya eklenir."""
+    by_id = {}
+    for o in orders:
+        pid = _package_id(o)
+        if pid:
+            by_id[pid] = o
+    if not by_id:
+        return 0, 0
+    # known okunmadan yazma kilidi alınır: araya giren başka yazar aynı paketin farkını
+    # sku_stats / daily_agg'e ikinci kez uygulatmasın
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    known, known_status = {}, {}
+    for pid, modified, st in conn.execute(
+        f"SELECT package_id, last_modified, status FROM orders WHERE package_id IN ({','.join('?' * len(by_id))})",
+        list(by_id),
+    ):
+        known[pid], known_status[pid] = modified, st
+    now = datetime.now().isoformat(timespec="seconds")
+    new = updated = 0
+    removed, added = [], []  # sku_stats'tan düşülecek / eklenecek satırlar
+    removed_days, added_days = [], []  # daily_agg için aynısı
+    for pid, o in by_id.items():
+        order_date = int(_num(o.get("orderDate"), 0))
+        modified = int(_num(o.get("lastModifiedDate"), order_date))
+        if pid in known and known[pid] >= modified:
+            continue
+        order_no = str(o.get("orderNumber") or "")
+        conn.execute(
+            "INSERT OR REPLACE INTO orders(package_id, order_number, order_date, last_modified, status, payload, synced_at) "
+            "VALUES(?,?,?,?,?,?,?)",
+            (pid, order_no, order_date, modified, o.get("status") or "",
+             json.dumps(o, ensure_ascii=False, separators=(",", ":")), now),
+        )
+        if pid in known:
+            removed += conn.execute(f"SELECT {SKU_STATS_SOURCE} FROM order_lines WHERE package_id=?", (pid,)).fetchall()
+            removed_days += conn.execute(f"SELECT {DAILY_AGG_SOURCE} FROM order_lines WHERE package_id=?", (pid,)).fetchall()
+        conn.execute("DELETE FROM order_lines WHERE package_id=?", (pid,))
+        conn.execute("DELETE FROM claims WHERE claim_id=?", (f"cancel:{pid}",))
+        rows, cancels = [], []
+        for i, l in enumerate(o.get("lines") or []):
+            seller_disc, ty_disc = parse_discounts(l)
+            line_id = str(l.get("id") or "")
+            sku = l.get("merchantSku") or l.get("merchantSkuId") or ""
+            st = (l.get("orderLineItemStatusName") or l.get("orderLineItemStatus") or "").strip()
+            rows.append((
+                pid, i, line_id, order_no, order_date, sku, l.get("productName") or "",
+                get_qty(l), get_sale_price(l), get_commission(l), seller_disc, ty_disc,
+                str(l.get("salesCampaignId") if l.get("salesCampaignId") is not None else ""), st,
+            ))
+            if claim_kind(st) == "cancel":
+                # iptal için talep kaydı yok: paketin son değişikliği iptal anı sayılır
+                cancels.append((f"cancel:{pid}:{i}", f"cancel:{pid}", "cancel", pid, line_id, order_no, order_date,
+                                modified, modified, sku, l.get("productName") or "", get_sale_price(l), st, ""))
+        conn.executemany(
+            "INSERT INTO order_lines(package_id, line_no, line_id, order_number, order_date, merchant_sku, product_name, "
+            "quantity, sale, commission, seller_discount, ty_discount, campaign, status) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            rows,
+        )
+        conn.executemany(_CLAIM_INSERT, cancels)
+        added += [(r[5], r[7], r[8], r[9], r[10], r[11], r[4], r[13]) for r in rows]
+        added_days += [(r[4], r[1], r[5], r[12], r[7], r[8], r[9], r[10], r[11]) for r in rows]
+        if delta is not None:
+            note_order_event(delta, o, order_no, order_date, rows, known_status.get(pid) if pid in known else None)
+        if pid in known:
+            updated += 1
+        else:
+            new += 1
+    apply_sku_stats(conn, removed, sign=-1)
+    apply_sku_stats(conn, added)
+    removed_agg = apply_daily_agg(conn, removed_days, sign=-1)
+    added_agg = apply_daily_agg(conn, added_days)
+    if delta is not None:
+        for sign, agg in ((-1, removed_agg), (1, added_agg)):
+            for (day, _, _), a in agg.items():
+                d = delta["days"].setdefault(day, [0] * len(a))
+                for i, v in enumerate(a):
+                    d[i] += sign * v
+        delta["new"] += new
+        delta["updated"] += updated
+    return new, updated
+
+_CLAIM_INSERT = (
+    "INSERT OR REPLACE INTO claims(claim_item_id, claim_id, kind, package_id, line_id, order_number, order_date, "
+    "claim_date, last_modified, merchant_sku, product_name, amount, status, reason) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+)
+
+def store_claims(conn, claims: list[dict]) -> tuple[int, int]:
+    """İade taleplerini kalem başına yazar (lastModifiedDate ilerlemediyse dokunmaz). Commit çağırana ait."""
+    by_id = {str(c.get("id")): c for c in claims if c.get("id")}
+    if not by_id:
+        return 0, 0
+    known = dict(conn.execute(
+        f"SELECT claim_id, MAX(last_modified) FROM claims WHERE claim_id IN ({','.join('?' * len(by_id))}) GROUP BY claim_id",
+        list(by_id),
+    ).fetchall())
+    new = updated = 0
+    for cid, c in by_id.items():
+        claim_date = int(_num(c.get("claimDate"), 0))
+        modified = int(_num(c.get("lastModifiedDate"), claim_date))
+        if cid in known and known[cid] >= modified:
+            continue
+        pid = str(c.get("orderShipmentPackageId") or "")
+        order_no = str(c.get("orderNumber") or "")
+        order_date = int(_num(c.get("orderDate"), 0)) or None
+        rows = []
+        for item in c.get("items") or []:
+            line = item.get("orderLine") or {}
+            for ci in item.get("claimItems") or []:
+                rows.append((
+                    str(ci.get("id") or f"{cid}:{len(rows)}"), cid, "return", pid, str(line.get("id") or ""),
+                    order_no, order_date, claim_date, modified,
+                    line.get("merchantSku") or "", line.get("productName") or "", _num(line.get("price")),
+                    ((ci.get("claimItemStatus") or {}).get("name") or "").strip(),
+                    ((ci.get("customerClaimItemReason") or {}).get("name") or "").strip(),
+                ))
+        conn.execute("DELETE FROM claims WHERE claim_id=?", (cid,))
+        conn.executemany(_CLAIM_INSERT, rows)
+        if cid in known:
+            updated += 1
+        else:
+            new += 1
+    return new, updated
+
+RETURNS_LIMIT = int(os.getenv("RETURNS_LIMIT", "500"))
+
+@traced("store.returns")
+def query_returns(start_ms: int, end_ms: int, q: str = "", limit: int = RETURNS_LIMIT) -> tuple[list[dict], dict]:
+    """Aralıkta (talep / iptal tarihi) açılan iade ve iptaller, sipariş satırıyla birleştirilmiş.
+    Satırlar (talep, sipariş satırı) başına; net, satırın net kârının iade edilen adet payıdır."""
+    where, params = "c.claim_date BETWEEN ? AND ?", [start_ms, end_ms]
+    if q:
+        where += " AND (c.order_number LIKE ? OR c.merchant_sku LIKE ? OR c.product_name LIKE ?)"
+        params += [f"%{q}%"] * 3
+    conn = db()
+    rows = conn.execute(f"""
+        SELECT c.kind, c.order_number, c.claim_date, c.order_date, c.status, c.reason, c.merchant_sku,
+               c.product_name, COUNT(*) AS units, SUM(c.amount) AS amount,
+               l.quantity AS line_qty, l.sale, l.commission, l.seller_discount
+        FROM claims c LEFT JOIN order_lines l ON l.package_id = c.package_id AND l.line_id = c.line_id
+        WHERE {where}
+        GROUP BY c.claim_id, c.line_id
+        ORDER BY c.claim_date DESC
+        LIMIT ?""", params + [limit]).fetchall()
+    stats = {"lines": 0, "returns": 0, "cancels": 0}
+    for kind, n in conn.execute(
+        "SELECT kind, COUNT(*) FROM claims WHERE claim_date BETWEEN ? AND ? GROUP BY kind", (start_ms, end_ms)
+    ).fetchall():
+        stats["returns" if kind == "return" else "cancels"] = n
+    stats["lines"] = conn.execute(
+        "SELECT COUNT(*) FROM order_lines WHERE order_date BETWEEN ? AND ?", (start_ms, end_ms)
+    ).fetchone()[0]
+    conn.close()
+
+    out = []
+    for r in rows:
+        net = None
+        if r["sale"] is not None:
+            # calc_profit_for_line ile aynı formül, depodaki kolonlardan
+            sale, seller_disc = r["sale"] or 0.0, r["seller_discount"] or 0.0
+            line_net = sale - (r["commission"] or 0.0) - seller_disc - max(sale - seller_disc, 0.0) * INVOICE_RATE
+            share = 1.0 if r["kind"] == "cancel" else min(1.0, r["units"] / (r["line_qty"] or 1.0))
+            net = round(line_net * share, 2)
+        out.append({
+            "kind": r["kind"],
+            "order": r["order_number"],
+            "date": datetime.fromtimestamp(r["claim_date"] / 1000).strftime("%Y-%m-%d %H:%M"),
+            "order_date": datetime.fromtimestamp(r["order_date"] / 1000).strftime("%Y-%m-%d") if r["order_date"] else "",
+            "status": r["status"] or ("İade" if r["kind"] == "return" else "İptal"),
+            "reason": r["reason"] or "",
+            "product": r["product_name"] or "",
+            "units": r["units"] if r["kind"] == "return" else (r["line_qty"] or 1),
+            "sku": r["merchant_sku"] or "",
+            "sale": round(r["amount"] or 0.0, 2),
+            "net": net,
+        })
+    return out, stats
+
+def store_settlements(conn, items: list[dict]) -> int:
+    """Cari hesap hareketlerini yazar (id ile tekil, var olan atlanır). Yeni kayıt sayısını döner."""
+    before = conn.total_changes
+    conn.executemany(
+        "INSERT OR IGNORE INTO settlements(id, type, transaction_date, order_number, package_id, barcode, credit, debt, "
+        "commission, seller_revenue, payment_date, payment_order_id, description) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        [(
+            str(t["id"]), t.get("transactionType") or "", int(_num(t.get("transactionDate"), 0)),
+            str(t.get("orderNumber") or ""), str(t.get("shipmentPackageId") or ""), t.get("barcode") or "",
+            _num(t.get("credit")), _num(t.get("debt")), _num(t.get("commissionAmount")), _num(t.get("sellerRevenue")),
+            int(_num(t.get("paymentDate"), 0)) or None, str(t.get("paymentOrderId") or ""), t.get("description") or "",
+        ) for t in items if t.get("id") is not None],
+    )
+    return conn.total_changes - before
+
+def get_sync_state() -> dict:
+    conn = db()
+    rows = conn.execute("SELECT name, value FROM sync_state").fetchall()
+    conn.close()
+    return {r["name"]: json.loads(r["value"]) for r in rows}
+
+def _set_sync_state(conn, **values):
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.executemany(
+        "INSERT OR REPLACE INTO sync_state(name, value, updated_at) VALUES(?,?,?)",
+        [(k, json.dumps(v, ensure_ascii=False), now) for k, v in values.items()],
+    )
+
+def sync_orders() -> dict:
+    """Aktif satıcının siparişlerini depoya çeker; özet döner."""
+    sid = current_seller_id()
+    lease = f"lease:sync:{sid}"
+    owner = f"{os.getpid()}:{secrets.token_hex(4)}".encode()  # aynı süreçteki ikinci tur da ayırt edilsin
+    if not CACHE.add(lease, owner, SYNC_LEASE_SECONDS):
+        metric_inc("sync_runs_total", seller=sid, result="skipped")
+        return {"skipped": True}
+    counts = {"new": 0, "updated": 0, "pages": 0, "claims_new": 0, "claims_updated": 0, "settlements_new": 0}
+    started = datetime.now()
+    try:
+        first = not get_sync_state().get("last_ok")
+        start = started - timedelta(days=SYNC_INITIAL_DAYS if first else SYNC_LOOKBACK_DAYS)
+
+        def renew_lease():
+            # her sayfada: uzun ilk tur SYNC_LEASE_SECONDS'ı aşabilir, lease düşüp ikinci bir senkron başlamasın
+            if not CACHE.renew(lease, owner, SYNC_LEASE_SECONDS):
+                raise RuntimeError("Senkron lease'i kaybedildi (süre doldu, başka süreç devraldı)")
+
+        def on_page(page, total_pages, content):
+            renew_lease()
+            conn = db()
+            delta = new_event_delta()
+            new, updated = store_orders(conn, content, delta)
+            if new or updated:
+                record_event(conn, "orders", order_event_payload(delta))
+                # sürüm her commit'le birlikte: tur sürerken yazılan sayfa da depodan okuyan
+                # önbellekleri (what-if, karşılaştırma, ETag) geçersiz kılar
+                bump_data_version(conn, "store")
+            conn.commit()
+            conn.close()
+            counts["new"] += new
+            counts["updated"] += updated
+            counts["pages"] += 1
+
+        def on_claims(content):
+            renew_lease()
+            conn = db()
+            new, updated = store_claims(conn, content)
+            if new or updated:
+                bump_data_version(conn, "store")
+            conn.commit()
+            conn.close()
+            counts["claims_new"] += new
+            counts["claims_updated"] += updated
+
+        def on_settlements(content):
+            renew_lease()
+            conn = db()
+            added = store_settlements(conn, content)
+            if added:
+                bump_data_version(conn, "store")
+            conn.commit()
+            conn.close()
+            counts["settlements_new"] += added
+
+        w_start = start
+        cut = []  # max_pages'te kesilen pencereler: eksik kalan tur başarılı sayılmaz
+        while w_start < started:
+            w_end = min(started, w_start + timedelta(days=max(1, SYNC_WINDOW_DAYS)))
+            renew_lease()
+            if fetch_orders(start_ms=_ms(w_start), end_ms=_ms(w_end), on_page=on_page).truncated:
+                cut.append(w_start.date().isoformat())
+            fetch_claims(_ms(w_start), _ms(w_end), on_claims)
+            fetch_settlements(_ms(w_start), _ms(w_end), on_settlements)
+            w_start = w_end
+        if cut:
+            raise RuntimeError(f"Sipariş penceresi sayfa sınırında kesildi ({', '.join(cut)}); SYNC_WINDOW_DAYS'i küçültün")
+
+        conn = db()
+        if first:
+            bump_data_version(conn, "store")  # depo kapsamı ilk kez oluştu
+        # depo kapsamı: başarılı turların taradığı ilk tam gün (karşılaştırmalar bunun dışına çıkmaz)
+        first_day = (start.date() if start.time() == datetime.min.time() else start.date() + timedelta(days=1)).isoformat()
+        store_from = min(first_day, get_sync_state().get("store_from") or first_day)
+        _set_sync_state(conn, last_ok=started.isoformat(timespec="seconds"), last_counts=counts, last_error="",
+                        last_seconds=round((datetime.now() - started).total_seconds(), 1), store_from=store_from)
+        record_event(conn, "sync", {"last_ok": started.isoformat(timespec="seconds"), "counts": counts})
+        prune_events(conn)
+        conn.commit()
+        conn.close()
+        metric_inc("sync_runs_total", seller=sid, result="ok")
+        metric_inc("sync_packages_total", counts["new"], seller=sid, change="new")
+        metric_inc("sync_packages_total", counts["updated"], seller=sid, change="updated")
+        metric_inc("sync_claims_total", counts["claims_new"], seller=sid, change="new")
+        metric_inc("sync_claims_total", counts["claims_updated"], seller=sid, change="updated")
+        metric_inc("sync_settlements_total", counts["settlements_new"], seller=sid)
+        return counts
+    except Exception as e:
+        metric_inc("sync_runs_total", seller=sid, result="error")
+        conn = db()
+        _set_sync_state(conn, last_error=f"{started.isoformat(timespec='seconds')}: {getattr(e, 'detail', None) or e}")
+        conn.commit()
+        conn.close()
+        raise
+    finally:
+        CACHE.release(lease, owner)
+
+def _sync_worker(seller_id: str):
+    UPSTREAM_LANE.set("bulk")
+    wake = SYNC_STATE["wake"][seller_id]
+    with seller_scope(seller_id):
+        while True:
+            root = start_trace("sync orders", seller=seller_id)
+            try:
+                root.set(**sync_orders())
+            except Exception:
+                root.set(status="error")
+                record_error(f"Order sync for seller {seller_id} failed\n\n{traceback.format_exc()}")
+            finally:
+                finish_trace(root)
+                _CURRENT_SPAN.set(None)
+            wake.wait(SYNC_INTERVAL_SECONDS)
+            wake.clear()
+
+def start_sync_workers():
+    if SYNC_INTERVAL_SECONDS <= 0 or SYNC_STATE["threads"]:
+        return
+    for sid, seller in SELLERS.items():
+        if not (seller.get("api_key") and seller.get("api_secret")):
+            continue
+        SYNC_STATE["wake"][sid] = threading.Event()
+        t = threading.Thread(target=_sync_worker, args=(sid,), name=f"sync-{sid}", daemon=True)
+        t.start()
+        SYNC_STATE["threads"][sid] = t
+    logger.info("Order sync workers started: %s", len(SYNC_STATE["threads"]))
+
+# =========================
+# SKU İSTATİSTİKLERİ (gözlenen komisyon / indirim / fiyat)
+# =========================
+# Depodaki satırların SKU başına toplamları; oranlar okurken türetilir. Paket
+# yeniden yazılınca eski satırları düşülüp yenileri eklenir, geçmiş hiç
+# yeniden taranmaz. İptal satırları sayılmaz. Okuma PK ile tek satır.
+SKU_STATS_SOURCE = "merchant_sku, quantity, sale, commission, seller_discount, ty_discount, order_date, status"
+
+def apply_sku_stats(conn, rows, sign: int = 1):
+    """rows: SKU_STATS_SOURCE sırasıyla satırlar; sign=-1 düşer. Commit çağırana ait."""
+    agg: dict[str, list] = {}
+    for sku, qty, sale, comm, seller_disc, ty_disc, order_date, st in rows:
+        if not sku or claim_kind(st) == "cancel":
+            continue
+        a = agg.get(sku)
+        if a is None:
+            a = agg[sku] = [0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
+        a[0] += 1
+        a[1] += qty or 0.0
+        a[2] += sale or 0.0
+        a[3] += comm or 0.0
+        a[4] += seller_disc or 0.0
+        a[5] += ty_disc or 0.0
+        a[6] = max(a[6], order_date or 0)
+    if not agg:
+        return
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.executemany(
+        "INSERT INTO sku_stats(merchant_sku, lines, quantity, sale, commission, seller_discount, ty_discount, "
+        "last_order_date, updated_at) VALUES(?,?,?,?,?,?,?,?,?) ON CONFLICT(merchant_sku) DO UPDATE SET "
+        "lines=lines+excluded.lines, quantity=quantity+excluded.quantity, sale=sale+excluded.sale, "
+        "commission=commission+excluded.commission, seller_discount=seller_discount+excluded.seller_discount, "
+        "ty_discount=ty_discount+excluded.ty_discount, "
+        "last_order_date=MAX(COALESCE(last_order_date, 0), excluded.last_order_date), updated_at=excluded.updated_at",
+        [(sku, sign * a[0], sign * a[1], sign * a[2], sign * a[3], sign * a[4], sign * a[5], a[6] if sign > 0 else None, now)
+         for sku, a in agg.items()],
+    )
+
+def _sku_stat(r) -> dict:
+    sale, qty = r["sale"] or 0.0, r["quantity"] or 0.0
+    return {
+        "merchant_sku": r["merchant_sku"],
+        "lines": r["lines"],
+        "quantity": qty,
+        "commission_rate": r["commission"] / sale if sale > 0 else None,
+        "seller_discount_rate": r["seller_discount"] / sale if sale > 0 else None,
+        "ty_discount_rate": r["ty_discount"] / sale if sale > 0 else None,
+        "avg_price": sale / qty if qty > 0 else None,
+        "last_order_date": r["last_order_date"],
+    }
+
+def get_sku_stats(skus) -> dict[str, dict]:
+    skus = [s for s in dict.fromkeys(skus) if s]
+    if not skus:
+        return {}
+    conn = db()
+    rows = conn.execute(
+        f"SELECT * FROM sku_stats WHERE merchant_sku IN ({','.join('?' * len(skus))}) AND lines > 0", skus
+    ).fetchall()
+    conn.close()
+    return {r["merchant_sku"]: _sku_stat(r) for r in rows}
+
+# =========================
+# GÜNLÜK TOPLAMLAR (dönem karşılaştırma)
+# =========================
+# daily_agg: gün x SKU x kampanya toplamları, sku_stats gibi paket yazılırken
+# artımlı güncellenir (eski satırlar düşülür, yenileri eklenir). /report'un
+# karşılaştırmalı hali iki dönemi de buradan okur: gün sayısı x grup kadar
+# satır, upstream'e ve order_lines'a inilmez. /report ile aynı tanım: iptal
+# satırları da sayılır; sipariş adedi paketin ilk satırının grubuna yazılır.
+DAILY_AGG_SOURCE = "order_date, line_no, merchant_sku, campaign, quantity, sale, commission, seller_discount, ty_discount"
+COMPARE_MODES = ("previous", "yoy")
+COMPARE_TOP = int(os.getenv("COMPARE_TOP", "20"))
+
+def apply_daily_agg(conn, rows, sign: int = 1):
+    """rows: DAILY_AGG_SOURCE sırasıyla satırlar; sign=-1 düşer. (gün, SKU, kampanya) -> işaretsiz toplamlar döner."""
+    agg: dict[tuple, list] = {}
+    days: dict[int, str] = {}  # dakika -> gün; geri doldurmada fromtimestamp satır başına çağrılmasın
+    for order_date, line_no, sku, camp, qty, sale, comm, seller_disc, ty_disc in rows:
+        minute = (order_date or 0) // 60_000
+        day = days.get(minute)
+        if day is None:
+            day = days[minute] = _ms_day(minute * 60_000)
+        key = (day, sku or "", camp or "")
+        a = agg.get(key)
+        if a is None:
+            a = agg[key] = [0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        sale, seller_disc = sale or 0.0, seller_disc or 0.0
+        a[0] += line_no == 0
+        a[1] += 1
+        a[2] += qty or 0.0
+        a[3] += sale
+        a[4] += comm or 0.0
+        a[5] += seller_disc
+        a[6] += ty_disc or 0.0
+        a[7] += max(sale - seller_disc, 0.0)
+    if not agg:
+        return agg
+    conn.executemany(
+        "INSERT INTO daily_agg(day, merchant_sku, campaign, orders, lines, quantity, sale, commission, seller_discount, "
+        "ty_discount, invoice_base) VALUES(?,?,?,?,?,?,?,?,?,?,?) ON CONFLICT(day, merchant_sku, campaign) DO UPDATE SET "
+        "orders=orders+excluded.orders, lines=lines+excluded.lines, quantity=quantity+excluded.quantity, "
+        "sale=sale+excluded.sale, commission=commission+excluded.commission, "
+        "seller_discount=seller_discount+excluded.seller_discount, ty_discount=ty_discount+excluded.ty_discount, "
+        "invoice_base=invoice_base+excluded.invoice_base",
+        [(*key, *(sign * v for v in a)) for key, a in agg.items()],
+    )
+    return agg
+
+def compare_range(start: str, end: str, mode: str) -> tuple[str, str]:
+    """previous: hemen önceki eşit uzunlukta dönem; yoy: geçen yılın aynı günleri."""
+    s, e = date.fromisoformat(start), date.fromisoformat(end)
+    if mode == "yoy":
+        def year_ago(d: date) -> date:
+            try:
+                return d.replace(year=d.year - 1)
+            except ValueError:  # 29 Şubat
+                return d.replace(year=d.year - 1, day=28)
+        return year_ago(s).isoformat(), year_ago(e).isoformat()
+    return (s - timedelta(days=(e - s).days + 1)).isoformat(), (s - timedelta(days=1)).isoformat()
+
+def _daily_summary(a) -> dict:
+    """Toplamlar summarize_orders ile aynı anahtarlarla."""
+    inv = a[7] * INVOICE_RATE
+    kesinti = a[4] + a[5] + inv
+    return {
+        "siparis": int(a[0]),
+        "satis_toplam": round(a[3], 2),
+        "komisyon_toplam": round(a[4], 2),
+        "kargo_toplam": 0.0,
+        "satici_indirim_toplam": round(a[5], 2),
+        "trendyol_indirim_toplam": round(a[6], 2),
+        f"{INVOICE_KEY}_toplam": round(inv, 2),
+        "toplam_kesinti_toplam": round(kesinti, 2),
+        "net_kar_toplam": round(a[3] - kesinti, 2),
+    }
+
+def _daily_period(conn, start: str, end: str) -> tuple[dict, dict, dict]:
+    """(özet, SKU -> [satış, net], kampanya -> [satış, net])"""
+    total = [0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    by_sku: dict[str, list] = {}
+    by_campaign: dict[str, list] = {}
+    for r in conn.execute(
+        "SELECT merchant_sku, campaign, SUM(orders), SUM(lines), SUM(quantity), SUM(sale), SUM(commission), "
+        "SUM(seller_discount), SUM(ty_discount), SUM(invoice_base) FROM daily_agg "
+        "WHERE day BETWEEN ? AND ? GROUP BY merchant_sku, campaign",
+        (start, end),
+    ):
+        for i, v in enumerate(r[2:]):
+            total[i] += v or 0.0
+        sale = r[5] or 0.0
+        net = sale - (r[6] or 0.0) - (r[7] or 0.0) - (r[9] or 0.0) * INVOICE_RATE
+        for agg, key in ((by_sku, r[0] or "Bilinmeyen"), (by_campaign, r[1] or "0")):
+            a = agg.setdefault(key, [0.0, 0.0])
+            a[0] += sale
+            a[1] += net
+    return _daily_summary(total), by_sku, by_campaign
+
+def _delta(cur: float, prev: float) -> dict:
+    return {"fark": round(cur - prev, 2), "yuzde": round((cur - prev) / abs(prev), 4) if prev else None}
+
+def _delta_rows(cur: dict, prev: dict) -> list[dict]:
+    rows = []
+    for key in cur.keys() | prev.keys():
+        c, p = cur.get(key, (0.0, 0.0)), prev.get(key, (0.0, 0.0))
+        rows.append({"key": key, "satis": round(c[0], 2), "onceki_satis": round(p[0], 2),
+                     "net": round(c[1], 2), "onceki_net": round(p[1], 2), **_delta(c[1], p[1])})
+    rows.sort(key=lambda r: -abs(r["fark"]))
+    return rows
+
+def store_coverage(conn) -> Optional[tuple[str, str]]:
+    """Deponun eksiksiz kapsadığı (ilk gün, son gün) — senkron hiç bitmediyse None.
+    store_from kaydı olmayan eski depolarda daily_agg'in ilk günü kullanılır."""
+    state = {r[0]: json.loads(r[1]) for r in conn.execute("SELECT name, value FROM sync_state WHERE name IN ('last_ok', 'store_from')")}
+    if not state.get("last_ok"):
+        return None
+    first = state.get("store_from") or conn.execute("SELECT MIN(day) FROM daily_agg").fetchone()[0]
+    return (first, state["last_ok"][:10]) if first else None
+
+def _covered(coverage: Optional[tuple[str, str]], start: str, end: str) -> bool:
+    # bugünden sonrası boştur, eksik sayılmaz
+    end = min(end, date.today().isoformat())
+    return coverage is not None and coverage[0] <= start and end <= coverage[1]
+
+@traced("compute.compare")
+def compare_report(start: str, end: str, mode: str, top: int = COMPARE_TOP) -> dict:
+    """Seçili dönem + karşılaştırma dönemi, ikisi de daily_agg'den; metrik / SKU / kampanya farkları.
+    Dönemlerden biri depo kapsamı dışındaysa (senkron o günleri hiç taramadı) farklar sıfıra karşı
+    hesaplanmış olurdu: karşılaştırma yerine kapsam_disi + uyarı döner."""
+    prev_start, prev_end = compare_range(start, end, mode)
+    conn = db()
+    coverage = store_coverage(conn)
+    cur, cur_sku, cur_campaign = _daily_period(conn, start, end)
+    prev, prev_sku, prev_campaign = _daily_period(conn, prev_start, prev_end)
+    conn.close()
+    span_set(skus=len(cur_sku), prev_skus=len(prev_sku))
+    kapsam = {"start": coverage[0], "end": coverage[1]} if coverage else None
+    cur_ok, prev_ok = _covered(coverage, start, end), _covered(coverage, prev_start, prev_end)
+    out = {
+        "tarih": {"start": start, "end": end},
+        **cur,
+        "kaynak": "depo",
+        "kapsam": kapsam,
+        "kapsam_disi": not cur_ok,
+    }
+    if not (cur_ok and prev_ok):
+        where = f"{kapsam['start']} – {kapsam['end']}" if kapsam else "senkron henüz tamamlanmadı"
+        out["karsilastirma"] = {
+            "mod": mode,
+            "tarih": {"start": prev_start, "end": prev_end},
+            "kapsam_disi": True,
+            "uyari": f"Karşılaştırma yapılamadı: {'seçili dönem' if not cur_ok else 'karşılaştırma dönemi'} "
+                     f"depo kapsamı dışında ({where}).",
+        }
+        return out
+    return {
+        **out,
+        "karsilastirma": {
+            "mod": mode,
+            "tarih": {"start": prev_start, "end": prev_end},
+            **prev,
+            "fark": {k: _delta(v, prev[k]) for k, v in cur.items()},
+            "sku": _delta_rows(cur_sku, prev_sku)[:top],
+            "kampanya": _delta_rows(cur_campaign, prev_campaign),
+        },
+    }
+
+# =========================
+# CANLI PANEL OLAYLARI (SSE)
+# =========================
+# Senkron her sayfada yazdığı farkı (gün toplamlarındaki değişim, yeni
+# siparişler, durum değişiklikleri) events tablosuna aynı transaction'da ekler.
+# Süreç + satıcı başına tek bir poller EVENTS_POLL_SECONDS'ta bir `id > son`
+# okur ve açık bağlantıların kuyruklarına dağıtır: panel sayısı arttıkça ne
+# upstream'e ne DB'ye giden iş artar. Bağlanan panel önce depodan bir
+# snapshot (toplamlar + olay id'si, tek okuma transaction'ında) alır, sonra
+# sadece o id'den sonraki farkları uygular; kaçırma / çift sayma olmaz.
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "1"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+EVENTS_KEEP_HOURS = float(os.getenv("EVENTS_KEEP_HOURS", "24"))
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "500"))
+EVENTS_QUEUE_MAX = 256
+EVENT_ORDERS_MAX = 20  # olay başına listelenen yeni sipariş / durum değişikliği
+
+_metric("sse_clients", "Açık canlı panel bağlantısı (SSE).", "gauge")
+_metric("sse_events_total", "Panellere gönderilen olaylar.", "counter")
+
+def new_event_delta() -> dict:
+    return {"new": 0, "updated": 0, "days": {}, "orders": [], "status": []}
+
+def note_order_event(delta: dict, o: dict, order_no: str, order_date: int, rows: list, old_status: Optional[str]):
+    """rows: order_lines'a yazılan satırlar; old_status None ise paket yeni."""
+    status = o.get("status") or ""
+    if old_status is None:
+        if len(delta["orders"]) < EVENT_ORDERS_MAX:
+            sale = sum(r[8] for r in rows)
+            net = sum(r[8] - r[9] - r[10] - max(r[8] - r[10], 0.0) * INVOICE_RATE for r in rows)
+            delta["orders"].append({"no": order_no, "date": order_date, "status": status,
+                                    "satis": round(sale, 2), "net": round(net, 2)})
+    elif old_status != status and len(delta["status"]) < EVENT_ORDERS_MAX:
+        delta["status"].append({"no": order_no, "from": old_status, "to": status})
+
+def order_event_payload(delta: dict) -> dict:
+    return {
+        "new": delta["new"],
+        "updated": delta["updated"],
+        "days": {day: _daily_summary(a) for day, a in delta["days"].items() if any(a)},
+        "orders": delta["orders"],
+        "status": delta["status"],
+    }
+
+def record_event(conn, kind: str, payload: dict):
+    """Commit çağırana ait: olay, verinin kendisiyle birlikte görünür olur."""
+    conn.execute(
+        "INSERT INTO events(created_at, kind, payload) VALUES(?,?,?)",
+        (datetime.now().isoformat(timespec="seconds"), kind, json.dumps(payload, ensure_ascii=False, separators=(",", ":"))),
+    )
+
+def prune_events(conn):
+    cutoff = (datetime.now() - timedelta(hours=EVENTS_KEEP_HOURS)).isoformat(timespec="seconds")
+    conn.execute("DELETE FROM events WHERE created_at < ?", (cutoff,))
+
+def read_events(after_id: int, limit: int = 500) -> list[tuple]:
+    conn = db()
+    rows = conn.execute("SELECT id, kind, payload FROM events WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+    conn.close()
+    return [tuple(r) for r in rows]
+
+def last_event_id() -> int:
+    conn = db()
+    last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    conn.close()
+    return int(last)
+
+def events_snapshot(start: str, end: str) -> dict:
+    """Aralık toplamları + son olay id'si, aynı okuma transaction'ında; sonraki farklar bu
+    toplamların üstüne eklenir. kapsam_disi ise depo aralığı kapsamıyor, toplamlar eksiktir."""
+    conn = db()
+    conn.execute("BEGIN")
+    last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    coverage = store_coverage(conn)
+    summary, _, _ = _daily_period(conn, start, end)
+    conn.commit()
+    conn.close()
+    return {"id": int(last), "tarih": {"start": start, "end": end}, **summary,
+            "kapsam": {"start": coverage[0], "end": coverage[1]} if coverage else None,
+            "kapsam_disi": not _covered(coverage, start, end),
+            "last_sync": get_sync_state().get("last_ok") or ""}
+
+class EventHub:
+    """Satıcı başına bir poller task'ı; abone yoksa durur."""
+
+    def __init__(self):
+        self.subs: dict[str, set] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    def clients(self) -> int:
+        return sum(len(s) for s in self.subs.values())
+
+    def _publish(self):
+        metric_set("sse_clients", self.clients())
+
+    async def subscribe(self, seller_id: str) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(EVENTS_QUEUE_MAX)
+        task = self.tasks.get(seller_id)
+        if task is None or task.done():
+            # poller'ın başlangıç imleci abonenin snapshot'ından önce okunur: aradaki olay kaçmaz
+            after = await run_in_threadpool(last_event_id)
+            task = self.tasks.get(seller_id)
+            if task is None or task.done():
+                self.tasks[seller_id] = asyncio.create_task(self._poll(seller_id, after))
+        self.subs.setdefault(seller_id, set()).add(q)
+        self._publish()
+        return q
+
+    def unsubscribe(self, seller_id: str, q: asyncio.Queue):
+        self.subs.get(seller_id, set()).discard(q)
+        self._publish()
+
+    async def _poll(self, seller_id: str, after: int):
+        CURRENT_SELLER.set(seller_id)
+        while True:
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+            subs = self.subs.get(seller_id)
+            if not subs:
+                self.tasks.pop(seller_id, None)
+                return
+            try:
+                rows = await run_in_threadpool(read_events, after)
+            except Exception as e:
+                logger.info("event poll failed (%s): %s", seller_id, e)
+                continue
+            for row in rows:
+                after = row[0]
+                for q in list(subs):
+                    try:
+                        q.put_nowait(row)
+                    except asyncio.QueueFull:
+                        # yetişemeyen panel: kuyruğu boşalt, yeniden bağlanıp snapshot alsın
+                        while not q.empty():
+                            q.get_nowait()
+                        q.put_nowait(None)
+
+HUB = EventHub()
+
+# =========================
+# HAKEDİŞ MUTABAKATI (settlements <-> sipariş deposu)
+# =========================
+# Aralıktaki cari hesap hareketleri (probe) sipariş numarasına göre, depodaki
+# siparişlerden beklenen tutarlara (build) hash-join ile eşlenir:
+#   Sale   -> satırların satış - satıcı indirimi - komisyon toplamı (iptaller hariç)
+#   Return -> iade edilen adet payı kadar aynı tutarın eksisi (claims + order_lines)
+#   diğer türler -> sadece "diğer" sütununa yazılır
+# Vadesi (sipariş + SETTLEMENT_DUE_DAYS) aralıkta dolan ama hiç Sale hareketi
+# gelmeyen siparişler "gelmeyen" olarak vade gününe yazılır. Her şey indeksli
+# aralık sorgusu + tek geçişlik dict; upstream'e gidilmez.
+SETTLEMENT_DUE_DAYS = int(os.getenv("SETTLEMENT_DUE_DAYS", "10"))
+RECONCILE_LOOKBACK_DAYS = int(os.getenv("RECONCILE_LOOKBACK_DAYS", "45"))
+RECONCILE_TOLERANCE = float(os.getenv("RECONCILE_TOLERANCE", "0.05"))
+
+def _ms_day(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000).date().isoformat()
+
+def _line_revenue(sale, seller_discount, commission) -> float:
+    return (sale or 0.0) - (seller_discount or 0.0) - (commission or 0.0)
+
+@traced("reconcile.settlements")
+def reconcile_settlements(start_ms: int, end_ms: int, top: int = 50) -> dict:
+    """Gün gün beklenen / gerçekleşen / fark; en büyük farklar ve gelmeyen ödemeler."""
+    day_ms = 86_400_000
+    due_ms = SETTLEMENT_DUE_DAYS * day_ms
+    lookback_ms = start_ms - RECONCILE_LOOKBACK_DAYS * day_ms
+    now_ms = _ms(datetime.now())
+    conn = db()
+
+    # build: sipariş numarası -> beklenen satış / iade tutarı
+    expected_sale: dict[str, list] = {}  # no -> [order_date, tutar]
+    for no, od, sale, sd, comm, st in conn.execute(
+        "SELECT order_number, order_date, sale, seller_discount, commission, status FROM order_lines "
+        "WHERE order_date BETWEEN ? AND ?", (lookback_ms, end_ms),
+    ):
+        if claim_kind(st) == "cancel":
+            continue
+        e = expected_sale.get(no)
+        if e is None:
+            expected_sale[no] = [od, _line_revenue(sale, sd, comm)]
+        else:
+            e[1] += _line_revenue(sale, sd, comm)
+    expected_return: dict[str, float] = {}
+    for no, units, qty, sale, sd, comm in conn.execute(
+        "SELECT c.order_number, COUNT(*), l.quantity, l.sale, l.seller_discount, l.commission "
+        "FROM claims c JOIN order_lines l ON l.package_id = c.package_id AND l.line_id = c.line_id "
+        "WHERE c.kind = 'return' AND c.claim_date BETWEEN ? AND ? GROUP BY c.claim_id, c.line_id",
+        (lookback_ms, end_ms),
+    ):
+        expected_return[no] = expected_return.get(no, 0.0) - _line_revenue(sale, sd, comm) * min(1.0, units / (qty or 1.0))
+
+    # probe: aralıktaki hareketler, (sipariş, tür) başına toplanır
+    actual: dict[tuple, list] = {}  # (no, tür) -> [ilk gün ms, tutar, kayıt]
+    for no, tx_type, ts, revenue in conn.execute(
+        "SELECT order_number, type, transaction_date, seller_revenue FROM settlements WHERE transaction_date BETWEEN ? AND ?",
+        (start_ms, end_ms),
+    ):
+        kind = {"Sale": "sale", "Return": "return"}.get(tx_type, "other")
+        a = actual.get((no, kind))
+        if a is None:
+            actual[(no, kind)] = [ts, revenue or 0.0, 1]
+        else:
+            a[0] = min(a[0], ts)
+            a[1] += revenue or 0.0
+            a[2] += 1
+    paid = {r[0] for r in conn.execute(
+        "SELECT DISTINCT order_number FROM settlements WHERE type = 'Sale' AND transaction_date >= ?", (lookback_ms,)
+    )}
+    conn.close()
+
+    days: dict[str, dict] = {}
+
+    def day_row(d: str) -> dict:
+        row = days.get(d)
+        if row is None:
+            row = days[d] = {"day": d, "records": 0, "expected": 0.0, "actual": 0.0, "diff": 0.0,
+                             "unmatched": 0.0, "unmatched_n": 0, "other": 0.0, "missing": 0.0, "missing_n": 0}
+        return row
+
+    diffs = []
+    for (no, kind), (ts, amount, n) in actual.items():
+        row = day_row(_ms_day(ts))
+        row["records"] += n
+        if kind == "other":
+            row["other"] += amount
+            continue
+        exp = expected_sale.get(no, (0, None))[1] if kind == "sale" else expected_return.get(no)
+        if exp is None:
+            row["unmatched"] += amount
+            row["unmatched_n"] += 1
+            continue
+        row["expected"] += exp
+        row["actual"] += amount
+        row["diff"] += amount - exp
+        if abs(amount - exp) > RECONCILE_TOLERANCE:
+            diffs.append({"order": no, "kind": kind, "day": _ms_day(ts), "expected": round(exp, 2),
+                          "actual": round(amount, 2), "diff": round(amount - exp, 2)})
+
+    missing = []
+    for no, (od, exp) in expected_sale.items():
+        due = od + due_ms
+        if start_ms <= due <= min(end_ms, now_ms) and no not in paid and exp > RECONCILE_TOLERANCE:
+            row = day_row(_ms_day(due))
+            row["missing"] += exp
+            row["missing_n"] += 1
+            missing.append({"order": no, "order_day": _ms_day(od), "due_day": _ms_day(due), "expected": round(exp, 2)})
+
+    out_days = sorted(days.values(), key=lambda r: r["day"])
+    totals = {k: 0.0 for k in ("records", "expected", "actual", "diff", "unmatched", "unmatched_n", "other", "missing", "missing_n")}
+    for r in out_days:
+        for k in totals:
+            r[k] = round(r[k], 2)
+            totals[k] += r[k]
+    totals = {k: round(v, 2) for k, v in totals.items()}
+    totals["paid"] = round(totals["actual"] + totals["unmatched"] + totals["other"], 2)
+    totals["diff_orders"] = len(diffs)
+    diffs.sort(key=lambda r: -abs(r["diff"]))
+    missing.sort(key=lambda r: -r["expected"])
+    span_set(settlements=int(totals["records"]), orders=len(expected_sale), diffs=len(diffs), missing=len(missing))
+    return {"days": out_days, "totals": totals, "diffs": diffs[:top], "missing": missing[:top],
+            "due_days": SETTLEMENT_DUE_DAYS, "tolerance": RECONCILE_TOLERANCE}
+
+# =========================
+# SENARYO (what-if: fatura oranı / komisyon)
+# =========================
+# Net kâr oranlarda doğrusal: satış - komisyon - satıcı indirimi - oran * fatura
+# matrahı. Aralıktaki satırlar SQL'de bir kez (SKU, kampanya) gruplarına
+# toplanır ve sütun listeleri olarak paylaşılan önbellekte tutulur ("store"
+# sürümüne bağlı); her senaryo sadece bu sütunlar üzerinden hesaplanır, yani
+# satır sayısından değil grup sayısından etkilenir. İptal satırları sayılmaz;
+# maliyet sku_costs'taki güncel değerle.
+WHATIF_PARAMS = {
+    "invoice_rate": (0.0, 1.0),       # INVOICE_RATE yerine
+    "commission_rate": (0.0, 1.0),    # komisyon = satış * oran (gözlenen komisyon yerine)
+    "commission_delta": (-1.0, 1.0),  # gözlenen komisyona satış * delta eklenir (0.02 = +2 puan)
+    "cost_mult": (0.0, 10.0),         # maliyet çarpanı
+}
+WHATIF_MAX_SCENARIOS = int(os.getenv("WHATIF_MAX_SCENARIOS", "8"))
+# bundan uzun aralıklarda tarih indeksi + sıralama yerine idx_order_lines_group taranır
+WHATIF_GROUP_SCAN_DAYS = int(os.getenv("WHATIF_GROUP_SCAN_DAYS", "90"))
+
+def parse_scenario(text: str, idx: int) -> dict:
+    """"Fatura %8:invoice_rate=0.08,commission_delta=0.02" -> {"name", "params"}; ad opsiyonel."""
+    name, sep, body = text.partition(":")
+    if not sep:
+        name, body = "", text
+    params = {}
+    for part in body.split(","):
+        if not part.strip():
+            continue
+        k, _, v = part.partition("=")
+        k = k.strip()
+        if k not in WHATIF_PARAMS:
+            raise ValueError(f"bilinmeyen parametre '{k}' (geçerli: {', '.join(WHATIF_PARAMS)})")
+        try:
+            x = float(v.strip().replace(",", "."))
+        except ValueError:
+            raise ValueError(f"{k} sayı olmalı: '{v.strip()}'")
+        lo, hi = WHATIF_PARAMS[k]
+        if not lo <= x <= hi:
+            raise ValueError(f"{k} {lo:g} ile {hi:g} arasında olmalı")
+        params[k] = x
+    if not params:
+        raise ValueError(f"boş senaryo: '{text}'")
+    return {"name": name.strip() or f"S{idx}", "params": params}
+
+def _whatif_columns(start_ms: int, end_ms: int) -> dict:
+    """(SKU, kampanya) grupları için sütunlar: sku, campaign, lines, qty, sale, commission, discount, base."""
+    version = get_data_versions().get("store", (0, ""))[0]
+    key = f"whatif:{current_seller_id()}:{start_ms}:{end_ms}:{version}"
+    hit = CACHE.get_json(key)
+    if hit is not None:
+        return hit
+    cols = {k: [] for k in ("sku", "campaign", "lines", "qty", "sale", "commission", "discount", "base")}
+    index: dict[tuple, int] = {}
+    hint = "INDEXED BY idx_order_lines_group" if end_ms - start_ms > WHATIF_GROUP_SCAN_DAYS * 86_400_000 else ""
+    conn = db()
+    # status da gruplanır: iptal ayrımı claim_kind ile Python'da, satır başına değil grup başına
+    for sku, camp, st, n, qty, sale, comm, sd, base in conn.execute(
+        "SELECT merchant_sku, campaign, status, COUNT(*), SUM(quantity), SUM(sale), SUM(commission), "
+        f"SUM(seller_discount), SUM(MAX(sale - seller_discount, 0)) FROM order_lines {hint} "
+        "WHERE order_date BETWEEN ? AND ? GROUP BY merchant_sku, campaign, status",
+        (start_ms, end_ms),
+    ):
+        if claim_kind(st) == "cancel":
+            continue
+        g = (sku or "", camp or "0")
+        i = index.get(g)
+        if i is None:
+            i = index[g] = len(cols["sku"])
+            cols["sku"].append(g[0])
+            cols["campaign"].append(g[1])
+            for k in ("lines", "qty", "sale", "commission", "discount", "base"):
+                cols[k].append(0)
+        cols["lines"][i] += n
+        cols["qty"][i] += qty or 0.0
+        cols["sale"][i] += sale or 0.0
+        cols["commission"][i] += comm or 0.0
+        cols["discount"][i] += sd or 0.0
+        cols["base"][i] += base or 0.0
+    conn.close()
+    CACHE.set_json(key, cols, REPORT_CACHE_TTL)
+    return cols
+
+def _whatif_eval(cols: dict, cost: list, params: dict) -> dict:
+    """Grup başına komisyon / fatura / net / gerçek net sütunları."""
+    sale, disc = cols["sale"], cols["discount"]
+    ir = params.get("invoice_rate", INVOICE_RATE)
+    cm = params.get("cost_mult", 1.0)
+    if "commission_rate" in params:
+        cr = params["commission_rate"]
+        comm = [s * cr for s in sale]
+    else:
+        cd = params.get("commission_delta", 0.0)
+        comm = [c + s * cd for c, s in zip(cols["commission"], sale)] if cd else cols["commission"]
+    inv = [b * ir for b in cols["base"]]
+    net = [s - c - d - i for s, c, d, i in zip(sale, comm, disc, inv)]
+    real = [n - k * cm for n, k in zip(net, cost)]
+    return {"commission": comm, "invoice": inv, "net": net, "real_net": real, "cost_mult": cm}
+
+def _whatif_totals(cols: dict, cost: list, ev: dict) -> dict:
+    sales = sum(cols["sale"])
+    real = sum(ev["real_net"])
+    return {
+        "sales": round(sales, 2),
+        "commission": round(sum(ev["commission"]), 2),
+        "discount": round(sum(cols["discount"]), 2),
+        "invoice": round(sum(ev["invoice"]), 2),
+        "cost": round(sum(cost) * ev["cost_mult"], 2),
+        "net": round(sum(ev["net"]), 2),
+        "real_net": round(real, 2),
+        "margin": round(real / sales, 4) if sales else None,
+    }
+
+def _whatif_deltas(keys: list, base: dict, ev: dict) -> list[dict]:
+    agg: dict[str, list] = {}
+    for k, bn, br, n, r in zip(keys, base["net"], base["real_net"], ev["net"], ev["real_net"]):
+        a = agg.get(k)
+        if a is None:
+            a = agg[k] = [0.0, 0.0, 0.0, 0.0]
+        a[0] += n
+        a[1] += r
+        a[2] += n - bn
+        a[3] += r - br
+    return [{"key": k, "net": round(a[0], 2), "real_net": round(a[1], 2),
+             "delta_net": round(a[2], 2), "delta_real_net": round(a[3], 2)} for k, a in agg.items()]
+
+@traced("compute.whatif")
+def run_whatif(start_ms: int, end_ms: int, scenarios: list[dict], top: int = 50) -> dict:
+    """Depodaki geçmiş üzerinde baz + senaryolar; SKU ve kampanya kırılımında fark."""
+    cols = _whatif_columns(start_ms, end_ms)
+    cost_map = get_cost_map()
+    cost = [q * cost_map.get(sku, 0.0) for sku, q in zip(cols["sku"], cols["qty"])]
+    base = _whatif_eval(cols, cost, {})
+    base_totals = _whatif_totals(cols, cost, base)
+    out = []
+    for sc in scenarios:
+        ev = _whatif_eval(cols, cost, sc["params"])
+        totals = _whatif_totals(cols, cost, ev)
+        by_sku = _whatif_deltas(cols["sku"], base, ev)
+        by_sku.sort(key=lambda r: -abs(r["delta_real_net"]))
+        by_campaign = _whatif_deltas(cols["campaign"], base, ev)
+        by_campaign.sort(key=lambda r: r["delta_real_net"])
+        out.append({
+            **sc,
+            "totals": totals,
+            "delta": {k: round(totals[k] - base_totals[k], 2) for k in ("commission", "invoice", "cost", "net", "real_net")},
+            "by_sku": by_sku[:top],
+            "by_campaign": by_campaign,
+        })
+    span_set(groups=len(cols["sku"]), scenarios=len(scenarios))
+    return {
+        "baseline": {"params": {"invoice_rate": INVOICE_RATE}, "lines": sum(cols["lines"]), "skus": len(set(cols["sku"])),
+                     "totals": base_totals},
+        "scenarios": out,
+    }
+
+# =========================
+# TOPLU FİYAT (katalog)
+# =========================
+# sku_costs'taki her SKU için minimum kârlı fiyat c / (1 - komisyon - fatura - hedef)
+# tek SQL sorgusunda, küme olarak hesaplanır (satır satır Python yok). Parametre
+# önceliği: sku_pricing (SKU'ya özel) > sku_stats'ta gözlenen komisyon oranı /
+# ortalama satış fiyatı > formdaki varsayılan (PRICING_DEFAULT_COMMISSION).
+PRICING_DEFAULT_COMMISSION = float(os.getenv("PRICING_DEFAULT_COMMISSION", "0.20"))
+PRICING_SORTS = {"gap": "gap", "gap_pct": "gap_pct", "sku": "sku", "min_price": "min_price", "cost": "cost"}
+PRICING_FILTERS = {
+    "all": "",
+    "below": "AND gap < 0",
+    "above": "AND gap >= 0",
+    "nodata": "AND (price IS NULL OR min_price IS NULL)",
+}
+PRICING_COLUMNS = ("sku", "cost", "commission_rate", "commission_source", "target_margin", "price", "min_price",
+                   "gap", "gap_pct", "net")
+
+def _pricing_sql(commission_rate: float, target_margin: float, only: str = "all", q: str = "") -> tuple[str, list]:
+    where = PRICING_FILTERS.get(only, "")
+    params = [commission_rate, target_margin, INVOICE_RATE, INVOICE_RATE]
+    if q:
+        where += " AND sku LIKE ?"
+        params.append(f"%{q}%")
+    sql = f"""
+        WITH observed AS (
+            SELECT merchant_sku, sale / NULLIF(quantity, 0) AS price, commission / NULLIF(sale, 0) AS rate
+            FROM sku_stats WHERE lines > 0
+        ), params AS (
+            SELECT c.merchant_sku AS sku, c.cost AS cost,
+                   COALESCE(p.commission_rate, o.rate, ?) AS commission_rate,
+                   CASE WHEN p.commission_rate IS NOT NULL THEN 'sku'
+                        WHEN o.rate IS NOT NULL THEN 'siparis' ELSE 'varsayilan' END AS commission_source,
+                   COALESCE(p.target_margin, ?) AS target_margin,
+                   COALESCE(p.sale_price, o.price) AS price
+            FROM sku_costs c
+            LEFT JOIN sku_pricing p ON p.merchant_sku = c.merchant_sku
+            LEFT JOIN observed o ON o.merchant_sku = c.merchant_sku
+        ), rates AS (
+            SELECT *, 1.0 - commission_rate - ? AS keep, 1.0 - commission_rate - ? - target_margin AS denom FROM params
+        ), priced AS (
+            SELECT *, CASE WHEN denom > 0 THEN cost / denom END AS min_price FROM rates
+        )
+        SELECT sku, cost, commission_rate, commission_source, target_margin, price, min_price,
+               price - min_price AS gap, (price - min_price) / min_price AS gap_pct, price * keep - cost AS net
+        FROM priced WHERE 1=1 {where}
+    """
+    return sql, params
+
+def _catalogue_sql(commission_rate: float, target_margin: float, only: str, q: str,
+                   sort: str, desc: bool, limit: Optional[int]) -> tuple[str, list]:
+    order = PRICING_SORTS.get(sort, "gap")
+    sql, params = _pricing_sql(commission_rate, target_margin, only, q)
+    sql += f" ORDER BY {order} IS NULL, {order} {'DESC' if desc else 'ASC'}"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return sql, params
+
+def price_catalogue(commission_rate: float, target_margin: float, only: str = "all", q: str = "",
+                    sort: str = "gap", desc: bool = False, limit: Optional[int] = None):
+    """Katalog fiyat simülasyonu; satırları (dict) sırayla yield eder, bağlantı generator kapanınca kapanır.
+    Tek thread'de tüketilmeli; StreamingResponse için price_catalogue_batches."""
+    sql, params = _catalogue_sql(commission_rate, target_margin, only, q, sort, desc, limit)
+    conn = db()
+    try:
+        with span("pricing.catalogue", sort=PRICING_SORTS.get(sort, "gap"), only=only):
+            cur = conn.execute(sql, params)
+        for r in cur:
+            yield dict(zip(PRICING_COLUMNS, r))
+    finally:
+        conn.close()
+
+async def price_catalogue_batches(commission_rate: float, target_margin: float, only: str = "all", q: str = "",
+                                  sort: str = "gap", desc: bool = False):
+    """price_catalogue'un akış sürümü: STREAM_BATCH'lik parçalar, her biri tek run_in_threadpool çağrısı.
+    Sync generator'ı StreamingResponse her adımda başka thread'de ilerletir ve SQLite bağlantısı
+    thread'e bağlıdır; bu yüzden bağlantı generator'ındır (check_same_thread=False) ama hiçbir
+    an iki thread tarafından kullanılmaz."""
+    sql, params = _catalogue_sql(commission_rate, target_margin, only, q, sort, desc, None)
+    conn = await run_in_threadpool(db, False)
+    try:
+        with span("pricing.catalogue", sort=PRICING_SORTS.get(sort, "gap"), only=only):
+            cur = await run_in_threadpool(conn.execute, sql, params)
+        while True:
+            rows = await run_in_threadpool(cur.fetchmany, STREAM_BATCH)
+            if not rows:
+                break
+            yield [dict(zip(PRICING_COLUMNS, r)) for r in rows]
+    finally:
+        conn.close()
+
+def pricing_summary(commission_rate: float, target_margin: float, q: str = "") -> dict:
+    sql, params = _pricing_sql(commission_rate, target_margin, "all", q)
+    conn = db()
+    row = conn.execute(
+        f"SELECT COUNT(*), SUM(gap < 0), SUM(gap >= 0), SUM(gap IS NULL), SUM(CASE WHEN gap < 0 THEN -gap END) FROM ({sql})",
+        params,
+    ).fetchone()
+    conn.close()
+    return {"total": row[0], "below": row[1] or 0, "above": row[2] or 0, "nodata": row[3] or 0,
+            "below_gap": round(row[4] or 0.0, 2)}
+
 # =========================
 # UI
 # =========================
 def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
     """Modern, sidebar'lı tek layout."""
+    head, tail = ui_shell_parts(title, active)
+    return head + body + tail
+
+_BODY_SLOT = "\x00__BODY__\x00"
+
+def ui_shell_parts(title: str, active: str = "dashboard") -> tuple[str, str]:
+    """ui_shell'in body öncesi / sonrası parçaları (stream_page için)."""
 
     def nav_item(key: str, label: str, href: str, icon: str) -> str:
         cls = "bg-orange-50 text-orange-700 border-orange-200" if key == active else "hover:bg-slate-50 text-slate-700 border-transparent"
@@ -579,6 +4123,20 @@ def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
             f'</a>'
         )
 
+    # birden çok mağaza varsa satıcı seçici (SellerMiddleware ?seller= ile cookie'ye yazar)
+    seller_picker = ""
+    if len(SELLERS) > 1:
+        cur = current_seller_id()
+        options = "".join(
+            f'<option value="{html.escape(sid)}"{" selected" if sid == cur else ""}>'
+            f'{html.escape(seller_info(sid)["title"])} ({html.escape(sid)})</option>'
+            for sid in SELLERS
+        )
+        seller_picker = (
+            '<form method="get" class="mt-3"><select name="seller" onchange="this.form.submit()" '
+            f'class="w-full px-3 py-2 rounded-xl border bg-slate-50 text-sm font-semibold">{options}</select></form>'
+        )
+
     sidebar = f"""
       <div class="hidden lg:block lg:w-72">
         <div class="sticky top-4 space-y-4">
@@ -590,6 +4148,7 @@ def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
                 <div class="text-xs text-slate-500">Kâr/Zarar + e-Arşiv Taslak</div>
               </div>
             </div>
+            {seller_picker}
           </div>
 
           <div class="p-3 rounded-2xl bg-white border shadow-sm space-y-2">
@@ -601,6 +4160,7 @@ def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
             {nav_item("returns","İadeler","/app/returns","↩️")}
             {nav_item("campaigns","Kampanyalar","/app/campaigns","🎯")}
             {nav_item("invoices","Faturalar","/app/invoices","🧿")}
+            {nav_item("jobs","İşler","/app/jobs","⏳")}
             {nav_item("settings","Ayarlar","/app/settings","⚙️")}
           </div>
 
@@ -630,13 +4190,14 @@ def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
               {nav_item("orders","Siparişler","/app/orders","🧾")}
               {nav_item("invoices","Faturalar","/app/invoices","🧿")}
               {nav_item("settings","Ayarlar","/app/settings","⚙️")}
+              {seller_picker}
             </div>
           </details>
         </div>
       </div>
     """
 
-    return f"""
+    page = f"""
 <!doctype html>
 <html lang="tr">
 <head>
@@ -665,7 +4226,7 @@ def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
           </div>
         </div>
 
-        {body}
+        {_BODY_SLOT}
 
         <div class="text-xs text-slate-400 py-8">© {date.today().year} • build: ui-v2</div>
       </div>
@@ -674,6 +4235,123 @@ def ui_shell(title: str, body: str, active: str = "dashboard") -> str:
 </body>
 </html>
 """
+    head, tail = page.split(_BODY_SLOT, 1)
+    return head, tail
+
+# Sık kullanılan parçalar: modül yüklenirken bir kez hazırlanır, satır başına
+# sadece format_map çalışır (eski "rows_html += f'...'" birikimi yerine).
+ERROR_BOX_TPL = "<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: {err}</div>"
+STALE_BOX_TPL = ("<div class='mt-3 p-3 rounded-xl bg-amber-50 border border-amber-200 text-amber-800 text-sm'>"
+                 "<b>Eski veri gösteriliyor:</b> {reason}. Son başarılı çekim: {since}.</div>")
+TRUNCATED_BOX_TPL = ("<div class='mt-3 p-3 rounded-xl bg-amber-50 border border-amber-200 text-amber-800 text-sm'>"
+                     "<b>Eksik veri:</b> {reason}. Tam sonuç için aralığı daraltın ya da İşler'den export başlatın.</div>")
+SYNC_PENDING_BOX_TPL = ("<div class='mt-3 p-3 rounded-xl bg-amber-50 border border-amber-200 text-amber-800 text-sm'>"
+                        "<b>Sipariş deposu henüz dolmadı:</b> ilk senkron tamamlanınca veriler burada görünür "
+                        "(Ayarlar → Mağazalar / Sipariş Senkronu).</div>")
+EMPTY_ROW_TPL = "<tr><td class='p-3 text-slate-500' colspan='{colspan}'>{text}</td></tr>"
+STREAM_BATCH = int(os.getenv("STREAM_BATCH", "250"))
+
+def tr_money(v) -> str:
+    try:
+        return f"{float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except Exception:
+        return str(v)
+
+def error_box(err: str) -> str:
+    return ERROR_BOX_TPL.format(err=err) if err else ""
+
+def stale_box(result) -> str:
+    return STALE_BOX_TPL.format(reason=html.escape(result.stale_reason), since=result.stale_at.replace("T", " "))
+
+def truncated_box(result) -> str:
+    if result.truncated == "max_pages":
+        reason = f"sayfa sınırına ulaşıldı, ilk {result.next_page} sayfa gösteriliyor"
+    else:
+        reason = f"süre sınırı doldu, ilk {result.next_page} sayfa gösteriliyor"
+    return TRUNCATED_BOX_TPL.format(reason=reason)
+
+def render_rows(tpl: str, rows, colspan: int, empty: str = "Kayıt yok.", batch: int = STREAM_BATCH):
+    """Satırları şablonla basar, batch'ler halinde yield eder (liste join, string birikimi yok)."""
+    t0 = time.perf_counter()
+    buf = []
+    n = 0
+    for r in rows:
+        buf.append(tpl.format_map(r))
+        n += 1
+        if len(buf) >= batch:
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+    if not n:
+        yield EMPTY_ROW_TPL.format(colspan=colspan, text=empty)
+    # yield'ler arası context kopyalandığı için span burada tek seferde kaydedilir
+    with span("render.rows", rows=n) as sp:
+        sp.start = t0
+
+def _stream_failed(title: str, e: Exception) -> str:
+    # header'lar gitti; 500 dönemeyiz, hatayı sayfaya basıp kapatıyoruz
+    tb = traceback.format_exc()
+    record_error(f"ERROR while streaming {title}\n\n{tb}")
+    return error_box(str(e))
+
+def stream_page(title: str, chunks, active: str = "dashboard", etag: str = "") -> StreamingResponse:
+    """Shell + sayfa başlığı hemen gönderilir, tablo satırları hesaplandıkça akar.
+    chunks sync generator (threadpool'da akar) ya da async iterator olabilir.
+    etag verilirse akış ortasında patlayan gövdenin ETag'i 304'e konu olmaz."""
+    head, tail = ui_shell_parts(title, active)
+
+    def gen():
+        yield head
+        try:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            if etag:
+                CACHE.set(f"etag:failed:{etag}", b"1", ttl=ETAG_FAILED_TTL)
+            yield _stream_failed(title, e)
+        yield tail
+
+    async def agen():
+        yield head
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            if etag:
+                await run_in_threadpool(CACHE.set, f"etag:failed:{etag}", b"1", ETAG_FAILED_TTL)
+            yield _stream_failed(title, e)
+        yield tail
+
+    body = agen() if hasattr(chunks, "__aiter__") else gen()
+    return StreamingResponse(body, media_type="text/html; charset=utf-8")
+
+def page_headers(etag: str, last_modified: str, err: str = "", data=None) -> dict:
+    """HTML sayfa başlıkları. Hatayla, eski (stale) ya da yarım (truncated) veriyle
+    üretilmiş gövde doğrulayıcı almaz: yoksa sonraki yenilemeler 304 ile o sayfaya
+    sabitlenir (report_meta'nın JSON için yaptığı gibi). etag yoksa sağlam gövdeye başlık eklenmez."""
+    if err or getattr(data, "stale_at", None) or getattr(data, "truncated", ""):
+        return {"Cache-Control": "no-store"}
+    return conditional_headers(etag, last_modified) if etag else {}
+
+async def prefetch(fetch) -> tuple:
+    """(data, err) — veri stream_page'den önce alınır ki başlıklar sonuca göre seçilebilsin."""
+    try:
+        return await fetch(), ""
+    except Exception as e:
+        return [], str(e)
+
+async def render_fetched(head: str, data, err: str, render):
+    """head + uyarı kutuları; render(data, err) sync generator'ı (aggregation + tablo) threadpool'da akar."""
+    yield head
+    if getattr(data, "stale_at", None):
+        yield stale_box(data)
+    if getattr(data, "truncated", ""):
+        yield truncated_box(data)
+    async for chunk in iterate_in_threadpool(render(data, err)):
+        yield chunk
 
 # =========================
 # ENDPOINTS
@@ -683,26 +4361,32 @@ def root():
     return {"ok": True}
 
 @app.get("/health")
-def health():
+async def health():
+    # async: threadpool dolu olsa bile cevap verir
     return {"status": "running"}
 
 @app.get("/env")
 def env_check():
+    seller = SELLERS.get(current_seller_id(), {})
+    info = seller_info()
     return {
-        "TRENDYOL_API_KEY_SET": bool(os.getenv("TRENDYOL_API_KEY")),
-        "TRENDYOL_API_SECRET_SET": bool(os.getenv("TRENDYOL_API_SECRET")),
-        "TRENDYOL_SELLER_ID_SET": bool(os.getenv("TRENDYOL_SELLER_ID")),
+        "TRENDYOL_API_KEY_SET": bool(seller.get("api_key")),
+        "TRENDYOL_API_SECRET_SET": bool(seller.get("api_secret")),
+        "TRENDYOL_SELLER_ID_SET": bool(seller.get("id")),
         "PANEL_AUTH_SET": bool(os.getenv("PANEL_USER") and os.getenv("PANEL_PASS")),
         "INVOICE_RATE": INVOICE_RATE,
         "PAGE_SIZE": PAGE_SIZE,
-        "DB_PATH": DB_PATH,
-        "SELLER_TITLE_SET": SELLER_TITLE != "UNVANINIZ",
-        "SELLER_VKN_SET": SELLER_VKN != "0000000000",
+        "DB_PATH": seller_db_path(current_seller_id()),
+        "SELLER_TITLE_SET": info["title"] != "UNVANINIZ",
+        "SELLER_VKN_SET": info["vkn"] != "0000000000",
+        "SELLERS": list(SELLERS),
+        "CURRENT_SELLER": current_seller_id(),
     }
 
 @app.get("/debug/find-order")
 def debug_find_order(orderNumber: str = Query(...), auth=Depends(panel_auth)):
-    o = find_order_by_number(orderNumber)
+    with upstream_lane("interactive"):
+        o = find_order_by_number(orderNumber)
     if not o:
         return {"found": False, "orderNumber": orderNumber}
     return {
@@ -714,103 +4398,289 @@ def debug_find_order(orderNumber: str = Query(...), auth=Depends(panel_auth)):
         "lines_count": len(o.get("lines") or []),
     }
 
-@app.get("/report")
-def report(start: str = Query(...), end: str = Query(...), auth=Depends(panel_auth)):
-    start_ms, end_ms = date_range_to_ms(start, end)
-    orders = fetch_orders(start_ms=start_ms, end_ms=end_ms)
-
-    toplam_siparis = 0
-    toplam_satis = toplam_komisyon = 0.0
-    toplam_satici_indirim = toplam_trendyol_indirim = 0.0
-    toplam_fatura = toplam_net = toplam_kesinti = 0.0
-
-    for o in orders:
-        od = o.get("orderDate")
-        if isinstance(od, int) and not (start_ms <= od <= end_ms):
+@app.get("/debug/profile")
+async def debug_profile(
+    seconds: float = Query(default=10, gt=0),
+    format: str = Query(default="collapsed"),
+    interval_ms: float = Query(default=PROFILE_INTERVAL_MS, ge=1, le=1000),
+    auth=Depends(panel_auth)
+):
+    # Tüm process'i N saniye örnekler (o sırada gelen gerçek trafik dahil).
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    sampler = StackSampler(interval_ms).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        counts = sampler.stop()
+    title = f"process, {seconds:g} sn"
+    if format == "html":
+        return HTMLResponse(flame_html(counts, title, sampler.samples, interval_ms))
+    return PlainTextResponse(f"# {title}\n" + collapsed_stacks(counts))
+
+@app.get("/debug/upstream")
+async def debug_upstream(auth=Depends(panel_auth)):
+    # Trendyol kotası: kalan token, şerit başına kuyruk, 429 sonrası duraklama
+    return UPSTREAM.snapshot()
+
+@app.get("/debug/traces")
+async def debug_traces(
+    min_ms: float = Query(default=0, ge=0),
+    name: str = Query(default=""),
+    limit: int = Query(default=50, ge=1, le=1000),
+    auth=Depends(panel_auth)
+):
+    # En yeni trace'ler önce; ağaç yerine özet (detay için /debug/traces/{id}).
+    out = []
+    for t in reversed(list(TRACES)):
+        if t["duration_ms"] < min_ms or (name and name not in t["name"]):
             continue
+        out.append({
+            "trace_id": t["trace_id"],
+            "name": t["name"],
+            "started_at": t["started_at"],
+            "duration_ms": t["duration_ms"],
+            "status": t["attrs"].get("status"),
+            "spans": t["spans"],
+        })
+        if len(out) >= limit:
+            break
+    return {"count": len(out), "traces": out}
 
-        toplam_siparis += 1
-        for l in (o.get("lines") or []):
-            calc = calc_profit_for_line(l)
-            toplam_satis += calc["satis"]
-            toplam_komisyon += calc["komisyon"]
-            toplam_satici_indirim += calc["satici_indirim"]
-            toplam_trendyol_indirim += calc["trendyol_indirim"]
-            toplam_fatura += calc.get(f"fatura_%{int(INVOICE_RATE*100)}", 0.0)
-            toplam_net += calc["net_kar"]
-            toplam_kesinti += calc["toplam_kesinti"]
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str, auth=Depends(panel_auth)):
+    for t in reversed(list(TRACES)):
+        if t["trace_id"] == trace_id:
+            return t
+    raise HTTPException(status_code=404, detail="Trace bulunamadı")
 
-    return {
-        "tarih": {"start": start, "end": end},
-        "siparis": int(toplam_siparis),
-        "satis_toplam": round(toplam_satis, 2),
-        "komisyon_toplam": round(toplam_komisyon, 2),
-        "kargo_toplam": 0.0,
-        "satici_indirim_toplam": round(toplam_satici_indirim, 2),
-        "trendyol_indirim_toplam": round(toplam_trendyol_indirim, 2),
-        f"fatura_%{int(INVOICE_RATE*100)}_toplam": round(toplam_fatura, 2),
-        "toplam_kesinti_toplam": round(toplam_kesinti, 2),
-        "net_kar_toplam": round(toplam_net, 2),
-    }
+def encode_cursor(start_ms: int, end_ms: int, page: int) -> str:
+    raw = json.dumps({"s": start_ms, "e": end_ms, "p": page}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-@app.get("/report/lines")
-def report_lines(start: str = Query(...), end: str = Query(...), auth=Depends(panel_auth)):
+def decode_cursor(cursor: str, start_ms: int, end_ms: int) -> int:
+    """Devam anahtarından sayfa numarası; anahtar başka aralığa aitse 400."""
+    try:
+        d = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        page = int(d["p"])
+        ok = d["s"] == start_ms and d["e"] == end_ms and page >= 0
+    except Exception:
+        ok = False
+    if not ok:
+        raise HTTPException(status_code=400, detail="Geçersiz devam anahtarı (cursor)")
+    return page
+
+async def fetch_report_orders(start_ms: int, end_ms: int, cursor: str, budget: float) -> FetchResult:
+    deadline = budget_deadline(budget)
+    if cursor:
+        # SWR deposu tam aralık için; devam istekleri kaldığı sayfadan doğrudan çeker
+        page = decode_cursor(cursor, start_ms, end_ms)
+        return await fetch_orders_async(start_ms=start_ms, end_ms=end_ms, deadline=deadline, start_page=page)
+    return await fetch_orders_swr(start_ms, end_ms, deadline=deadline)
+
+def report_meta(response: Response, orders: FetchResult, start_ms: int, end_ms: int) -> dict:
+    """stale / truncated işaretleri: header + JSON; ikisinde de doğrulayıcı yok (no-store), yarım sonuçta devam anahtarı (next_cursor)."""
+    meta = orders.meta()
+    if orders.stale_at:
+        response.headers["X-Data-Stale"] = orders.stale_at
+    if orders.truncated:
+        meta["next_cursor"] = encode_cursor(start_ms, end_ms, orders.next_page)
+        response.headers["X-Data-Truncated"] = orders.truncated
+    if orders.stale_at or orders.truncated:
+        # eski / yarım cevap tam cevabın ETag'iyle doğrulanmasın (304 istemciyi o gövdede bırakır)
+        for h in ("ETag", "Last-Modified"):
+            if h in response.headers:
+                del response.headers[h]
+        response.headers["Cache-Control"] = "no-store"
+    return meta
+
+# Uzun aralıklarda cevap en geç ~budget saniyede döner. Yarım kaldıysa
+# truncated=true + next_cursor gelir; aynı start/end ile ?cursor=... çağrısı
+# kalan sayfaları getirir (toplamlar ve satırlar parçalar arasında toplanabilir).
+# compare=previous|yoy: iki dönem de depodaki günlük toplamlardan (daily_agg),
+# upstream'e gidilmez; cevaba "karsilastirma" (özet, fark, SKU, kampanya) eklenir.
+# Depo yalnızca senkronun taradığı günleri kapsar ("kapsam"); dönemlerden biri
+# dışında kalırsa karşılaştırma yerine kapsam_disi + uyarı döner.
+@app.get("/report")
+async def report(
+    request: Request,
+    response: Response,
+    start: str = Query(...),
+    end: str = Query(...),
+    cursor: str = Query(default=""),
+    budget: float = Query(default=REPORT_BUDGET_SECONDS, gt=0, le=300),
+    compare: str = Query(default=""),
+    top: int = Query(default=COMPARE_TOP, ge=0, le=5000),
+    auth=Depends(panel_auth),
+):
+    compare = compare if compare in COMPARE_MODES else ""
+    if compare:
+        return await run_in_threadpool(_report_compare, request, response, start, end, compare, top)
+    etag, last_modified = await run_in_threadpool(data_etag, request, ("orders",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    response.headers.update(conditional_headers(etag, last_modified))
+
+    # ETag veri sürümlerini içerdiğinden hesaplanmış cevap worker'lar arasında paylaşılabilir
+    hit = await run_in_threadpool(CACHE.get_json, f"report:{etag}")
+    if hit is not None:
+        return hit
     start_ms, end_ms = date_range_to_ms(start, end)
-    orders = fetch_orders(start_ms=start_ms, end_ms=end_ms)
+    orders = await fetch_report_orders(start_ms, end_ms, cursor, budget)
+    meta = report_meta(response, orders, start_ms, end_ms)
+    out = {**await run_in_threadpool(summarize_orders, orders, start, end), **meta}
+    if not meta:
+        await run_in_threadpool(CACHE.set_json, f"report:{etag}", out, REPORT_CACHE_TTL)
+    return out
+
+def _report_compare(request: Request, response: Response, start: str, end: str, mode: str, top: int):
+    etag, last_modified = data_etag(request, ("store",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    response.headers.update(conditional_headers(etag, last_modified))
+    hit = CACHE.get_json(f"report:{etag}")
+    if hit is not None:
+        return hit
+    out = compare_report(start, end, mode, top)
+    CACHE.set_json(f"report:{etag}", out, REPORT_CACHE_TTL)
+    return out
 
-    rows = []
-    for o in orders:
-        od = o.get("orderDate")
-        if isinstance(od, int) and not (start_ms <= od <= end_ms):
-            continue
-
-        order_no = o.get("orderNumber") or ""
-        for l in (o.get("lines") or []):
-            calc = calc_profit_for_line(l)
-            rows.append({
-                "Sipariş": order_no,
-                "Ürün": l.get("productName") or "",
-                "Kampanya": calc["kampanya"],
-                "Satış": calc["satis"],
-                "Komisyon": calc["komisyon"],
-                "Kargo": 0.0,
-                "Satıcı İndirim": calc["satici_indirim"],
-                "Trendyol İndirim": calc["trendyol_indirim"],
-                f"Fatura %10": calc.get("fatura_%10", 0.0),
-                "Net Kâr": calc["net_kar"],
-            })
-
-    return {"tarih": {"start": start, "end": end}, "adet": len(rows), "rows": rows}
+@app.get("/report/lines")
+async def report_lines(
+    request: Request,
+    response: Response,
+    start: str = Query(...),
+    end: str = Query(...),
+    cursor: str = Query(default=""),
+    budget: float = Query(default=REPORT_BUDGET_SECONDS, gt=0, le=300),
+    auth=Depends(panel_auth),
+):
+    etag, last_modified = await run_in_threadpool(data_etag, request, ("orders",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    response.headers.update(conditional_headers(etag, last_modified))
+
+    hit = await run_in_threadpool(CACHE.get_json, f"report:{etag}")
+    if hit is not None:
+        return hit
+    start_ms, end_ms = date_range_to_ms(start, end)
+    orders = await fetch_report_orders(start_ms, end_ms, cursor, budget)
+    meta = report_meta(response, orders, start_ms, end_ms)
+    rows = await run_in_threadpool(order_rows, orders, start_ms, end_ms)
+    out = {"tarih": {"start": start, "end": end}, "adet": len(rows), "rows": rows, **meta}
+    if not meta:
+        await run_in_threadpool(CACHE.set_json, f"report:{etag}", out, REPORT_CACHE_TTL)
+    return out
+
+@app.get("/report/bundle")
+async def report_bundle(
+    request: Request,
+    response: Response,
+    start: str = Query(...),
+    end: str = Query(...),
+    cursor: str = Query(default=""),
+    budget: float = Query(default=REPORT_BUDGET_SECONDS, gt=0, le=300),
+    compare: str = Query(default=""),
+    top: int = Query(default=BUNDLE_TOP, ge=0, le=1000),
+    sort: str = Query(default="recent"),
+    points: int = Query(default=BUNDLE_POINTS, ge=10, le=1000),
+    series: str = Query(default="auto"),
+    auth=Depends(panel_auth),
+):
+    """Panel için tek çağrı: /report toplamları + ilk N satır + indirgenmiş seri (+ compare varsa karşılaştırma)."""
+    compare = compare if compare in COMPARE_MODES else ""
+    sort = sort if sort in BUNDLE_SORTS else "recent"
+    series = series if series in SERIES_MODES else "auto"
+    etag, last_modified = await run_in_threadpool(data_etag, request, ("orders", "store") if compare else ("orders",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    response.headers.update(conditional_headers(etag, last_modified))
+
+    hit = await run_in_threadpool(CACHE.get_json, f"report:{etag}")
+    if hit is not None:
+        return hit
+    start_ms, end_ms = date_range_to_ms(start, end)
+    orders = await fetch_report_orders(start_ms, end_ms, cursor, budget)
+    meta = report_meta(response, orders, start_ms, end_ms)
+    out = await run_in_threadpool(bundle_from_orders, orders, start, end, top, sort, points, series)
+    if compare:
+        out["karsilastirma"] = (await run_in_threadpool(compare_report, start, end, compare))["karsilastirma"]
+    out.update(meta)
+    if not meta:
+        await run_in_threadpool(CACHE.set_json, f"report:{etag}", out, REPORT_CACHE_TTL)
+    return out
+
+@app.get("/report/payouts")
+def report_payouts(
+    request: Request,
+    response: Response,
+    start: str = Query(...),
+    end: str = Query(...),
+    top: int = Query(default=50, ge=0, le=5000),
+    auth=Depends(panel_auth),
+):
+    """Hakediş mutabakatı (depodaki settlements <-> siparişler), gün gün."""
+    etag, last_modified = data_etag(request, ("store",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    response.headers.update(conditional_headers(etag, last_modified))
+    start_ms, end_ms = date_range_to_ms(start, end)
+    return {"tarih": {"start": start, "end": end}, **reconcile_settlements(start_ms, end_ms, top=top)}
+
+@app.get("/report/whatif")
+def report_whatif(
+    request: Request,
+    response: Response,
+    start: str = Query(...),
+    end: str = Query(...),
+    scenario: list[str] = Query(default=[]),
+    top: int = Query(default=50, ge=0, le=5000),
+    auth=Depends(panel_auth),
+):
+    """Depodaki geçmiş üzerinde oran senaryoları. Örn:
+    ?scenario=Fatura %8:invoice_rate=0.08&scenario=Komisyon +2:commission_delta=0.02"""
+    if len(scenario) > WHATIF_MAX_SCENARIOS:
+        raise HTTPException(400, f"En fazla {WHATIF_MAX_SCENARIOS} senaryo gönderilebilir.")
+    try:
+        scenarios = [parse_scenario(s, i) for i, s in enumerate(scenario, 1)]
+    except ValueError as e:
+        raise HTTPException(400, f"Geçersiz senaryo: {e}")
+    etag, last_modified = data_etag(request, ("store", "costs"))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    response.headers.update(conditional_headers(etag, last_modified))
+    start_ms, end_ms = date_range_to_ms(start, end)
+    return {"tarih": {"start": start, "end": end}, **run_whatif(start_ms, end_ms, scenarios, top=top)}
 
 @app.get("/report/excel")
-def report_excel(start: str = Query(...), end: str = Query(...), auth=Depends(panel_auth)):
-    data = report_lines(start, end, auth=auth)
-    rows = data["rows"]
-    sumdata = report(start, end, auth=auth)
-
-    wb = Workbook()
-    ws1 = wb.active
-    ws1.title = "Ozet"
-    ws1.append(["Alan", "Tutar"])
-    ws1.append(["Start", sumdata["tarih"]["start"]])
-    ws1.append(["End", sumdata["tarih"]["end"]])
-    for k, v in sumdata.items():
-        if k == "tarih":
-            continue
-        ws1.append([k, v])
-
-    ws2 = wb.create_sheet("Detay")
-    if rows:
-        headers = list(rows[0].keys())
-        ws2.append(headers)
-        for r in rows:
-            ws2.append([r.get(h, "") for h in headers])
-    else:
-        ws2.append(["Bu tarih aralığında veri bulunamadı."])
-
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-    wb.save(tmp.name)
-    return FileResponse(tmp.name, filename=f"trendyol_kar_zarar_{start}_to_{end}.xlsx")
+async def report_excel(request: Request, start: str = Query(...), end: str = Query(...), auth=Depends(panel_auth)):
+    # Uzun aralıklar için: POST /jobs kind=report_excel (arka planda)
+    etag, _ = await run_in_threadpool(data_etag, request, ("orders",))
+    content = await run_in_threadpool(CACHE.get, f"excel:{etag}")
+    if content is None:
+        start_ms, end_ms = date_range_to_ms(start, end)
+        orders = await fetch_orders_swr(start_ms, end_ms)
+
+        def build() -> bytes:
+            with tempfile.NamedTemporaryFile(suffix=".xlsx") as tmp:
+                write_report_workbook(tmp.name, {**summarize_orders(orders, start, end), **orders.meta()}, order_rows(orders, start_ms, end_ms))
+                with open(tmp.name, "rb") as f:
+                    return f.read()
+
+        content = await run_in_threadpool(build)
+        # eski / yarım veriyle üretilen dosya paylaşılmaz; çok büyük dosya önbelleği boşaltmasın
+        if not orders.meta() and len(content) <= CACHE.max_bytes // 8:
+            await run_in_threadpool(CACHE.set, f"excel:{etag}", content, REPORT_CACHE_TTL)
+    return Response(
+        content,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f'attachment; filename="trendyol_kar_zarar_{start}_to_{end}.xlsx"'},
+    )
 
 # =========================
 # APP UI
@@ -825,20 +4695,25 @@ def app_dashboard(auth=Depends(panel_auth)):
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
         <div class="text-xs text-slate-500">Sipariş</div>
         <div class="text-3xl font-extrabold" id="k1">-</div>
+        <div class="text-xs font-bold mt-1" id="d1"></div>
       </div>
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
         <div class="text-xs text-slate-500">Satış</div>
         <div class="text-3xl font-extrabold" id="k2">-</div>
+        <div class="text-xs font-bold mt-1" id="d2"></div>
       </div>
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
         <div class="text-xs text-slate-500">Toplam Kesinti</div>
         <div class="text-3xl font-extrabold" id="k3">-</div>
+        <div class="text-xs font-bold mt-1" id="d3"></div>
       </div>
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
         <div class="text-xs text-slate-500">Net Kâr</div>
         <div class="text-3xl font-extrabold" id="k4">-</div>
+        <div class="text-xs font-bold mt-1" id="d4"></div>
       </div>
     </div>
+    <div class="mt-1 text-xs text-slate-500" id="kpiSrc"></div>
 
     <div class="mt-4 grid lg:grid-cols-3 gap-3">
       <div class="lg:col-span-2 p-4 rounded-2xl bg-white border shadow-sm">
@@ -852,10 +4727,26 @@ def app_dashboard(auth=Depends(panel_auth)):
               <div class="text-xs text-slate-500 mb-1">Bitiş</div>
               <input id="end" type="date" value="__END__" class="px-3 py-2 rounded-xl border bg-slate-50"/>
             </div>
+            <div>
+              <div class="text-xs text-slate-500 mb-1">Karşılaştır</div>
+              <select id="compare" class="px-3 py-2 rounded-xl border bg-slate-50">
+                <option value="">Yok</option>
+                <option value="previous">Önceki dönem</option>
+                <option value="yoy">Geçen yıl</option>
+              </select>
+            </div>
+            <div>
+              <div class="text-xs text-slate-500 mb-1">Tablo</div>
+              <select id="sort" class="px-3 py-2 rounded-xl border bg-slate-50">
+                <option value="recent">En yeni</option>
+                <option value="net">En kârlı</option>
+                <option value="loss">En zararlı</option>
+              </select>
+            </div>
             <button onclick="loadAll()" class="px-4 py-2 rounded-xl bg-orange-500 text-white font-extrabold shadow-sm">Raporu Getir</button>
           </div>
           <div class="flex gap-2">
-            <a id="excel" class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" href="#">Excel İndir</a>
+            <a id="excel" class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" href="#" onclick="return excelJob()">Excel İndir</a>
             <a class="px-4 py-2 rounded-xl bg-white border font-extrabold hover:bg-slate-50" href="/app/orders">Sipariş Ara</a>
           </div>
         </div>
@@ -870,7 +4761,7 @@ def app_dashboard(auth=Depends(panel_auth)):
                 <th class="text-right p-2">Satış</th>
                 <th class="text-right p-2">Komisyon</th>
                 <th class="text-right p-2">Satıcı İnd.</th>
-                <th class="text-right p-2">Fatura %10</th>
+                <th class="text-right p-2">__INVOICE_COL__</th>
                 <th class="text-right p-2">Net</th>
                 <th class="text-left p-2">e-Arşiv</th>
               </tr>
@@ -880,20 +4771,51 @@ def app_dashboard(auth=Depends(panel_auth)):
             </tbody>
           </table>
         </div>
+        <div class="mt-2 text-xs text-slate-500" id="tbInfo"></div>
       </div>
 
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
-        <div class="font-extrabold">Hızlı Özet</div>
-        <div class="text-xs text-slate-500">Net kâr / satış / komisyon / fatura toplamı.</div>
+        <div class="flex items-center justify-between">
+          <div class="font-extrabold">Hızlı Özet</div>
+          <span id="live" class="px-2 py-1 rounded-lg bg-slate-100 text-xs text-slate-500">canlı değil</span>
+        </div>
+        <div class="text-xs text-slate-500" id="c1Info">Satış / net kâr, dönem boyunca.</div>
         <div class="mt-3">
           <canvas id="c1" height="160"></canvas>
         </div>
+        <div class="mt-3 text-xs font-bold text-slate-500">Son gelenler</div>
+        <ul id="feed" class="mt-1 text-xs divide-y max-h-48 overflow-auto"></ul>
         <div class="mt-3 text-xs text-slate-500">
           İpucu: Fatura taslağı için tablodaki <b>Taslak</b> butonuna bas.
         </div>
       </div>
     </div>
 
+    <div id="cmpBox" class="mt-4 p-4 rounded-2xl bg-white border shadow-sm hidden">
+      <div class="font-extrabold">Dönem Karşılaştırma</div>
+      <div class="text-xs text-slate-500" id="cmpInfo"></div>
+      <div class="mt-3 grid lg:grid-cols-2 gap-3">
+        <div class="overflow-auto rounded-xl border">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-100"><tr>
+              <th class="text-left p-2">SKU</th><th class="text-right p-2">Net</th>
+              <th class="text-right p-2">Önceki</th><th class="text-right p-2">Fark</th><th class="text-right p-2">%</th>
+            </tr></thead>
+            <tbody id="cmpSku" class="divide-y bg-white"></tbody>
+          </table>
+        </div>
+        <div class="overflow-auto rounded-xl border">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-100"><tr>
+              <th class="text-left p-2">Kampanya</th><th class="text-right p-2">Net</th>
+              <th class="text-right p-2">Önceki</th><th class="text-right p-2">Fark</th><th class="text-right p-2">%</th>
+            </tr></thead>
+            <tbody id="cmpCampaign" class="divide-y bg-white"></tbody>
+          </table>
+        </div>
+      </div>
+    </div>
+
 <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js"></script>
 <script>
 function money(x){
@@ -901,51 +4823,180 @@ function money(x){
   return n.toLocaleString('tr-TR',{minimumFractionDigits:2, maximumFractionDigits:2});
 }
 
-let chart1 = null;
-function setChart(net, sales, comm, inv){
-  const ctx = document.getElementById('c1');
+// Excel arka planda hazırlanır (uzun aralıklar proxy timeout'una takılmasın)
+async function excelJob(){
+  const btn = document.getElementById('excel');
+  const fd = new FormData();
+  fd.append('kind', 'report_excel');
+  fd.append('start', document.getElementById('start').value);
+  fd.append('end', document.getElementById('end').value);
+  const r = await fetch('/jobs', {method: 'POST', body: fd});
+  let job = await r.json();
+  if(!r.ok){ btn.innerText = 'Excel: ' + (job.detail || 'hata'); return false; }
+  while(job.status === 'queued' || job.status === 'running'){
+    btn.innerText = `Excel hazırlanıyor… %${Math.round((job.progress||0)*100)}`;
+    await new Promise(res => setTimeout(res, 1500));
+    job = await (await fetch(`/jobs/${job.id}`)).json();
+  }
+  btn.innerText = 'Excel İndir';
+  if(job.status === 'done'){ window.location = job.download; }
+  else { alert('Excel hazırlanamadı: ' + (job.error || job.status)); }
+  return false;
+}
+
+// Seri sunucuda nokta bütçesine indirgenmiş gelir (günlük / haftalık / LTTB);
+// her nokta [start, end] gün aralığını temsil eder.
+let chart1 = null, seriesPoints = [];
+const SERIES_LABEL = {daily: 'günlük', weekly: 'haftalık', lttb: 'örneklenmiş'};
+function setChart(seri){
+  seriesPoints = seri.points || [];
+  document.getElementById('c1Info').innerText = `Satış / net kâr, ${SERIES_LABEL[seri.mode] || seri.mode} (${seriesPoints.length} nokta, ${seri.days} gün).`;
   const data = {
-    labels: ['Net Kâr','Satış','Komisyon','Fatura'],
-    datasets: [{ label: 'Tutar (TRY)', data: [net, sales, comm, inv] }]
+    labels: seriesPoints.map(p => p.start === p.end ? p.start.slice(5) : p.start.slice(5) + '…'),
+    datasets: [
+      { label: 'Satış', data: seriesPoints.map(p => p.satis), tension: 0.2, pointRadius: 0 },
+      { label: 'Net Kâr', data: seriesPoints.map(p => p.net), tension: 0.2, pointRadius: 0 },
+    ]
   };
   if(chart1){ chart1.destroy(); }
-  chart1 = new Chart(ctx, { type: 'bar', data });
+  chart1 = new Chart(document.getElementById('c1'), { type: 'line', data, options: { animation: false } });
 }
 
-async function loadAll(){
-  const s = document.getElementById('start').value;
-  const e = document.getElementById('end').value;
-  document.getElementById('excel').href = `/report/excel?start=${encodeURIComponent(s)}&end=${encodeURIComponent(e)}`;
+// KPI altındaki fark: up=true ise artış iyi (yeşil), kesintide ters
+const KPI_KEYS = [['d1','siparis',true], ['d2','satis_toplam',true], ['d3','toplam_kesinti_toplam',false], ['d4','net_kar_toplam',true]];
+function pct(x){ return x == null ? '' : ' (' + (x > 0 ? '+' : '') + (x*100).toFixed(1) + '%)'; }
+function deltaCls(v, up){ return v === 0 ? 'text-slate-500' : ((v > 0) === up ? 'text-emerald-600' : 'text-rose-600'); }
+
+function setCompare(sum){
+  const cmp = sum.karsilastirma;
+  const box = document.getElementById('cmpBox');
+  KPI_KEYS.forEach(([id, key, up]) => {
+    const el = document.getElementById(id);
+    const d = cmp && cmp.fark && cmp.fark[key];
+    el.className = 'text-xs font-bold mt-1 ' + (d ? deltaCls(d.fark, up) : '');
+    el.innerText = d ? `${d.fark > 0 ? '+' : ''}${key === 'siparis' ? d.fark : money(d.fark)}${pct(d.yuzde)} · önceki ${key === 'siparis' ? cmp[key] : money(cmp[key])}` : '';
+  });
+  if(!cmp){ box.classList.add('hidden'); return; }
+  box.classList.remove('hidden');
+  if(cmp.kapsam_disi){
+    document.getElementById('cmpInfo').innerText = cmp.uyari;
+    ['cmpSku', 'cmpCampaign'].forEach(id => document.getElementById(id).innerHTML = '');
+    return;
+  }
+  document.getElementById('cmpInfo').innerText = `${cmp.mod === 'yoy' ? 'Geçen yıl' : 'Önceki dönem'}: ${cmp.tarih.start} – ${cmp.tarih.end} (depodaki günlük toplamlardan)`;
+  const fill = (id, rows, label) => {
+    document.getElementById(id).innerHTML = rows.length ? rows.map(r => `
+      <tr>
+        <td class="p-2 font-semibold">${label(r.key)}</td>
+        <td class="p-2 text-right">${money(r.net)}</td>
+        <td class="p-2 text-right text-slate-500">${money(r.onceki_net)}</td>
+        <td class="p-2 text-right font-extrabold ${deltaCls(r.fark, true)}">${money(r.fark)}</td>
+        <td class="p-2 text-right ${deltaCls(r.fark, true)}">${r.yuzde == null ? '-' : (r.yuzde*100).toFixed(1)}</td>
+      </tr>`).join('') : `<tr><td class="p-3 text-slate-500" colspan="5">Kayıt yok.</td></tr>`;
+  };
+  fill('cmpSku', cmp.sku, k => k);
+  fill('cmpCampaign', cmp.kampanya, k => '#' + k);
+}
 
-  const r1 = await fetch(`/report?start=${encodeURIComponent(s)}&end=${encodeURIComponent(e)}`);
-  const sum = await r1.json();
+function renderKpis(sum){
   document.getElementById('k1').innerText = sum.siparis ?? '-';
   document.getElementById('k2').innerText = money(sum.satis_toplam);
   document.getElementById('k3').innerText = money(sum.toplam_kesinti_toplam);
   document.getElementById('k4').innerText = money(sum.net_kar_toplam);
+}
 
-  setChart(sum.net_kar_toplam||0, sum.satis_toplam||0, sum.komisyon_toplam||0, sum['fatura_%10_toplam']||0);
-
-  const r2 = await fetch(`/report/lines?start=${encodeURIComponent(s)}&end=${encodeURIComponent(e)}`);
-  const det = await r2.json();
-  const tb = document.getElementById('tb');
-  tb.innerHTML = '';
-  const rows = det.rows||[];
-  if(!rows.length){
-    tb.innerHTML = `<tr><td class="p-3 text-slate-500" colspan="9">Bu aralıkta satır yok.</td></tr>`;
+// Canlı güncelleme: farklar depoya göre hesaplandığından taban da depodur. /events'in
+// snapshot'ı (aynı transaction'daki toplam + olay id'si) KPI'lara yazılır, farklar onun
+// üstüne eklenir. Depo aralığı kapsamıyorsa /report/bundle (Trendyol) KPI'ları kalır ve
+// farklar uygulanmaz. Grafik Trendyol serisidir; depo farkı eklenmez.
+let live = null, liveBase = null, liveOn = false, liveApplied = false, kpiLoaded = '', liveSync = '', liveNote = '';
+function renderSource(){
+  const el = document.getElementById('kpiSrc');
+  if(liveOn){
+    el.innerText = `KPI kaynağı: depo, senkron ${liveSync} itibarıyla` + (liveApplied ? ' + canlı senkron farkları' : '');
     return;
   }
-  rows.forEach(row=>{
-    const tr = document.createElement('tr');
-    const orderNo = row['Sipariş'] || '';
-    tr.innerHTML = `
+  el.innerText = kpiLoaded ? `KPI kaynağı: Trendyol, ${kpiLoaded} itibarıyla` + (liveNote ? ` · ${liveNote}` : '') : '';
+}
+function setLive(text, on){
+  const el = document.getElementById('live');
+  el.innerText = text;
+  el.className = 'px-2 py-1 rounded-lg text-xs ' + (on ? 'bg-emerald-100 text-emerald-700' : 'bg-slate-100 text-slate-500');
+}
+function feed(items){
+  const ul = document.getElementById('feed');
+  items.forEach(html => {
+    const li = document.createElement('li');
+    li.className = 'py-1';
+    li.innerHTML = html;
+    ul.prepend(li);
+  });
+  while(ul.children.length > 30){ ul.removeChild(ul.lastChild); }
+}
+function startLive(s, e, base){
+  if(live){ live.close(); }
+  liveBase = null;
+  liveOn = false;
+  liveApplied = false;
+  liveNote = '';
+  renderSource();
+  live = new EventSource(`/events?start=${encodeURIComponent(s)}&end=${encodeURIComponent(e)}`);
+  // yeniden bağlanınca da snapshot gelir: taban her seferinde baştan kurulur
+  live.addEventListener('snapshot', ev => {
+    const snap = JSON.parse(ev.data);
+    liveApplied = false;
+    liveOn = !!snap.last_sync && !snap.kapsam_disi;
+    if(!liveOn){
+      liveBase = null;
+      liveNote = snap.last_sync ? 'depo bu aralığı kapsamıyor, canlı güncelleme kapalı' : 'depo henüz dolmadı, canlı güncelleme kapalı';
+      renderKpis(base);
+      setLive(snap.last_sync ? 'canlı kapalı' : 'depo henüz dolmadı', false);
+      renderSource();
+      return;
+    }
+    liveBase = snap;
+    liveSync = snap.last_sync.slice(11, 16);
+    renderKpis(liveBase);
+    setLive('canlı · ' + liveSync, true);
+    renderSource();
+  });
+  live.addEventListener('orders', ev => {
+    const d = JSON.parse(ev.data);
+    if(liveOn){
+      Object.entries(d.days).forEach(([day, m]) => {
+        if(day < s || day > e){ return; }
+        for(const k in m){ liveBase[k] = (liveBase[k]||0) + m[k]; }
+        liveApplied = true;
+      });
+      renderKpis(liveBase);
+      renderSource();
+    }
+    feed(d.orders.map(o => `<b>#${o.no}</b> yeni · ${money(o.satis)} <span class="text-slate-500">net ${money(o.net)}</span>`)
+      .concat(d.status.map(x => `<b>#${x.no}</b> ${x.from} → <b>${x.to}</b>`)));
+  });
+  live.addEventListener('sync', ev => {
+    const d = JSON.parse(ev.data);
+    if(liveOn){
+      liveSync = d.last_ok.slice(11, 16);
+      setLive('canlı · ' + liveSync, true);
+      renderSource();
+    }
+  });
+  // olay geçmişi kaçırıldı: farklar artık güvenilir değil, taban yeniden alınır
+  live.addEventListener('resync', () => loadAll());
+  live.onerror = () => setLive('bağlantı bekleniyor…', false);
+}
+
+function rowHtml(row){
+  const orderNo = row['Sipariş'] || '';
+  return `<tr>
       <td class="p-2 whitespace-nowrap font-semibold">${orderNo}</td>
       <td class="p-2 min-w-[240px]">${row['Ürün']||''}</td>
       <td class="p-2 text-slate-500">${row['Kampanya']||''}</td>
       <td class="p-2 text-right">${money(row['Satış'])}</td>
       <td class="p-2 text-right">${money(row['Komisyon'])}</td>
       <td class="p-2 text-right">${money(row['Satıcı İndirim'])}</td>
-      <td class="p-2 text-right">${money(row['Fatura %10'])}</td>
+      <td class="p-2 text-right">${money(row['__INVOICE_COL__'])}</td>
       <td class="p-2 text-right font-extrabold">${money(row['Net Kâr'])}</td>
       <td class="p-2">
         <form method="post" action="/invoice/draft">
@@ -953,39 +5004,78 @@ async function loadAll(){
           <button class="px-3 py-1.5 rounded-xl bg-white border hover:bg-slate-50 font-bold" type="submit">Taslak</button>
         </form>
       </td>
-    `;
-    tb.appendChild(tr);
-  });
+    </tr>`;
+}
+
+// Tek çağrı: KPI + ilk N satır + indirgenmiş seri (+ karşılaştırma); satır sayısıyla büyümez
+async function loadAll(){
+  const s = document.getElementById('start').value;
+  const e = document.getElementById('end').value;
+  const cmp = document.getElementById('compare').value;
+  const sort = document.getElementById('sort').value;
+  const points = Math.max(30, Math.min(180, Math.floor(document.getElementById('c1').clientWidth / 4)));
+
+  const r = await fetch(`/report/bundle?start=${encodeURIComponent(s)}&end=${encodeURIComponent(e)}&sort=${sort}&points=${points}` + (cmp ? `&compare=${cmp}` : ''));
+  const b = await r.json();
+  if(!r.ok){
+    document.getElementById('tb').innerHTML = `<tr><td class="p-3 text-rose-600" colspan="9">${b.detail || 'Rapor alınamadı.'}</td></tr>`;
+    return;
+  }
+  renderKpis(b);
+  setChart(b.seri);
+  setCompare(b);
+  kpiLoaded = new Date().toLocaleTimeString('tr-TR', {hour: '2-digit', minute: '2-digit'});
+  startLive(s, e, b);
+
+  const rows = b.rows||[];
+  document.getElementById('tb').innerHTML = rows.length ? rows.map(rowHtml).join('')
+    : `<tr><td class="p-3 text-slate-500" colspan="9">Bu aralıkta satır yok.</td></tr>`;
+  const label = {recent: 'en yeni', net: 'en kârlı', loss: 'en zararlı'}[b.siralama];
+  document.getElementById('tbInfo').innerText =
+    (b.satir > rows.length ? `${b.satir} satırdan ${label} ${rows.length} tanesi. Tümü için Excel İndir. ` : '')
+    + (b.truncated ? 'Veri eksik: süre bütçesi doldu, toplamlar kısmi.' : '');
 }
 </script>
 """
-    body = body_template.replace("__START__", week_ago.isoformat()).replace("__END__", today.isoformat()).replace("__ROWS_LOSS__", rows_loss or "<tr><td class='p-3 text-slate-500' colspan='4'>Yok</td></tr>").replace("__ROWS_PROFIT__", rows_profit or "<tr><td class='p-3 text-slate-500' colspan='4'>Yok</td></tr>")
+    body = (body_template.replace("__START__", week_ago.isoformat()).replace("__END__", today.isoformat())
+            .replace("__INVOICE_COL__", INVOICE_COLUMN))
     return ui_shell("Dashboard", body, active="dashboard")
 
-@app.get("/app/invoices", response_class=HTMLResponse)
-def app_invoices(auth=Depends(panel_auth)):
-    conn = db()
-    rows = conn.execute("SELECT * FROM invoices ORDER BY id DESC LIMIT 200").fetchall()
-    conn.close()
-
-    trs = ""
-    for r in rows:
-        trs += f"""
+INVOICE_ROW_TPL = """
         <tr class="border-b">
-          <td class="p-2">{r['id']}</td>
-          <td class="p-2">{r['order_number']}</td>
-          <td class="p-2">{r['issue_date']}</td>
-          <td class="p-2">{(r['customer_name'] or '')[:30]}</td>
-          <td class="p-2 text-right">{r['total']:.2f}</td>
-          <td class="p-2"><span class="px-2 py-1 rounded-lg bg-slate-100">{r['status']}</span></td>
+          <td class="p-2">{id}</td>
+          <td class="p-2">{order_number}</td>
+          <td class="p-2">{issue_date}</td>
+          <td class="p-2">{customer}</td>
+          <td class="p-2 text-right">{total:.2f}</td>
+          <td class="p-2"><span class="px-2 py-1 rounded-lg bg-slate-100">{status}</span></td>
           <td class="p-2 flex gap-2">
-            <a class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" href="/invoice/{r['id']}/pdf">PDF</a>
-            <a class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" href="/invoice/{r['id']}/xml">XML</a>
+            <a class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" href="/invoice/{id}/pdf">PDF</a>
+            <a class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" href="/invoice/{id}/xml">XML</a>
           </td>
         </tr>
         """
 
-    body = f"""
+@app.get("/app/invoices", response_class=HTMLResponse)
+def app_invoices(request: Request, auth=Depends(panel_auth)):
+    etag, last_modified = data_etag(request, ("invoices",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    # 200 satır: bağlantı yield'ler arasında (farklı thread'lerde) tutulmasın diye önce okunur
+    conn = db()
+    try:
+        rows = [
+            {"id": r["id"], "order_number": r["order_number"], "issue_date": r["issue_date"],
+             "customer": (r["customer_name"] or "")[:30], "total": r["total"], "status": r["status"]}
+            for r in conn.execute("SELECT * FROM invoices ORDER BY id DESC LIMIT 200")
+        ]
+    finally:
+        conn.close()
+
+    def chunks():
+        yield """
     <div class="p-4 rounded-2xl bg-white border shadow-sm">
       <div class="flex items-center justify-between">
         <div>
@@ -1007,14 +5097,53 @@ def app_invoices(auth=Depends(panel_auth)):
             </tr>
           </thead>
           <tbody>
-            {trs if trs else '<tr><td class="p-2 text-slate-500" colspan="7">Henüz taslak yok.</td></tr>'}
+        """
+        yield from render_rows(INVOICE_ROW_TPL, rows, colspan=7, empty="Henüz taslak yok.")
+        yield """
           </tbody>
         </table>
       </div>
     </div>
-    """
-    return ui_shell("Faturalar", body, active="invoices")
+        """
+
+    resp = stream_page("Faturalar", chunks(), active="invoices", etag=etag)
+    resp.headers.update(page_headers(etag, last_modified))
+    return resp
+
+
+ORDER_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 font-semibold whitespace-nowrap">{order_no}</td>
+          <td class="p-2 text-slate-500 whitespace-nowrap">{dt}</td>
+          <td class="p-2"><span class="px-2 py-1 rounded-xl bg-slate-100 text-slate-700 text-xs font-bold">{status}</span></td>
+          <td class="p-2 text-right whitespace-nowrap">{total_sale:.2f}</td>
+          <td class="p-2 text-right whitespace-nowrap font-extrabold">{total_net:.2f}</td>
+          <td class="p-2">
+            <form method="post" action="/invoice/draft">
+              <input type="hidden" name="orderNumber" value="{order_no}"/>
+              <button class="px-3 py-1.5 rounded-xl bg-orange-500 text-white font-extrabold shadow-sm" type="submit">Taslak Oluştur</button>
+            </form>
+          </td>
+        </tr>
+        """
+
+def _order_row(o: dict) -> dict:
+    od = o.get("orderDate")
+    dt = ""
+    if isinstance(od, int):
+        try:
+            dt = datetime.fromtimestamp(int(od)/1000).strftime("%Y-%m-%d %H:%M")
+        except Exception:
+            dt = str(od)
 
+    total_sale = 0.0
+    total_net = 0.0
+    for l in (o.get("lines") or []):
+        c = calc_profit_for_line(l)
+        total_sale += c["satis"]
+        total_net += c["net_kar"]
+    return {"order_no": o.get("orderNumber") or "", "dt": dt, "status": o.get("status") or "",
+            "total_sale": total_sale, "total_net": total_net}
 
 @app.get("/app/orders", response_class=HTMLResponse)
 def app_orders(
@@ -1026,56 +5155,25 @@ def app_orders(
     now = datetime.now()
     start = now - timedelta(days=int(days))
 
+    # başlıklar (yarım / hatalı gövdeye no-store) sonuca bağlı: veri gövdeden önce alınır
     orders = []
     err = ""
+    deep_hint = False
     try:
         if q:
-            found = find_order_by_number(q)
+            with upstream_lane("interactive"):
+                found = find_order_by_number(q, deep=False)
             orders = [found] if found else []
+            if not found:
+                deep_hint = True
         else:
-            orders = fetch_orders(start_ms=_ms(start), end_ms=_ms(now), order_number=None, max_pages=30)
+            orders = fetch_orders(start_ms=_ms(start), end_ms=_ms(now), order_number=None, max_pages=30,
+                                  deadline=budget_deadline(PAGE_BUDGET_SECONDS))
     except Exception as e:
         err = str(e)
 
-    rows_html = ""
-    for o in (orders or []):
-        if not o:
-            continue
-        order_no = o.get("orderNumber") or ""
-        status_ = o.get("status") or ""
-        od = o.get("orderDate")
-        dt = ""
-        if isinstance(od, int):
-            try:
-                dt = datetime.fromtimestamp(int(od)/1000).strftime("%Y-%m-%d %H:%M")
-            except Exception:
-                dt = str(od)
-
-        lines = o.get("lines") or []
-        total_sale = 0.0
-        total_net = 0.0
-        for l in lines:
-            c = calc_profit_for_line(l)
-            total_sale += c["satis"]
-            total_net += c["net_kar"]
-
-        rows_html += f"""
-        <tr class="border-b bg-white">
-          <td class="p-2 font-semibold whitespace-nowrap">{order_no}</td>
-          <td class="p-2 text-slate-500 whitespace-nowrap">{dt}</td>
-          <td class="p-2"><span class="px-2 py-1 rounded-xl bg-slate-100 text-slate-700 text-xs font-bold">{status_}</span></td>
-          <td class="p-2 text-right whitespace-nowrap">{total_sale:.2f}</td>
-          <td class="p-2 text-right whitespace-nowrap font-extrabold">{total_net:.2f}</td>
-          <td class="p-2">
-            <form method="post" action="/invoice/draft">
-              <input type="hidden" name="orderNumber" value="{order_no}"/>
-              <button class="px-3 py-1.5 rounded-xl bg-orange-500 text-white font-extrabold shadow-sm" type="submit">Taslak Oluştur</button>
-            </form>
-          </td>
-        </tr>
-        """
-
-    body = f"""
+    def chunks():
+        yield f"""
     <div class="p-4 rounded-2xl bg-white border shadow-sm">
       <div class="flex flex-wrap items-end justify-between gap-3">
         <div>
@@ -1095,9 +5193,21 @@ def app_orders(
           <a class="px-4 py-2 rounded-xl bg-white border font-extrabold hover:bg-slate-50" href="/app/orders">Sıfırla</a>
         </form>
       </div>
+        """
 
-      {("<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: "+err+"</div>") if err else ""}
-
+        yield error_box(err)
+        if getattr(orders, "truncated", ""):
+            yield truncated_box(orders)
+        if deep_hint and not err:
+            yield f"""
+      <form class="mt-3 p-3 rounded-xl bg-amber-50 border border-amber-200 text-amber-800 text-sm flex flex-wrap gap-2 items-center" method="post" action="/app/jobs/find-order">
+        Son 180 günde orderNumber filtresiyle bulunamadı. 365 günlük derin arama arka planda yapılabilir.
+        <input type="hidden" name="orderNumber" value="{q}"/>
+        <button class="px-3 py-1.5 rounded-xl bg-amber-600 text-white font-bold" type="submit">Derin Arama Başlat</button>
+      </form>
+            """
+
+        yield """
       <div class="mt-4 overflow-auto rounded-xl border">
         <table class="min-w-full text-sm">
           <thead class="bg-slate-100">
@@ -1111,13 +5221,129 @@ def app_orders(
             </tr>
           </thead>
           <tbody>
-            {rows_html if rows_html else "<tr><td class='p-3 text-slate-500' colspan='6'>Kayıt yok.</td></tr>"}
+        """
+        yield from render_rows(ORDER_ROW_TPL, (_order_row(o) for o in orders if o), colspan=6)
+        yield """
           </tbody>
         </table>
       </div>
     </div>
-    """
-    return ui_shell("Siparişler", body, active="orders")
+        """
+
+    resp = stream_page("Siparişler", chunks(), active="orders")
+    resp.headers.update(page_headers("", "", err, orders))
+    return resp
+
+
+@app.get("/app/jobs", response_class=HTMLResponse)
+def app_jobs(highlight: str = Query(default=""), auth=Depends(panel_auth)):
+    today = date.today()
+    body = """
+    <div class="grid lg:grid-cols-3 gap-3">
+      <div class="lg:col-span-2 p-4 rounded-2xl bg-white border shadow-sm">
+        <div class="font-extrabold text-lg">Arka Plan İşleri</div>
+        <div class="text-xs text-slate-500">Uzun raporlar, exportlar ve derin sipariş aramaları burada çalışır. Sayfa kendini yeniler.</div>
+
+        <div class="mt-4 overflow-auto rounded-xl border">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-100 sticky top-0">
+              <tr>
+                <th class="text-left p-2">Tür</th>
+                <th class="text-left p-2">Parametre</th>
+                <th class="text-left p-2">Durum</th>
+                <th class="text-right p-2">İlerleme</th>
+                <th class="text-left p-2">Oluşturma</th>
+                <th class="text-left p-2">İşlem</th>
+              </tr>
+            </thead>
+            <tbody id="jb" class="divide-y bg-white">
+              <tr><td class="p-3 text-slate-500" colspan="6">Yükleniyor…</td></tr>
+            </tbody>
+          </table>
+        </div>
+      </div>
+
+      <div class="p-4 rounded-2xl bg-white border shadow-sm">
+        <div class="font-extrabold text-lg">Yeni İş</div>
+        <form class="mt-3 space-y-2" onsubmit="return submitJob(this)">
+          <select name="kind" class="px-3 py-2 rounded-xl border bg-slate-50 w-full">
+            <option value="report_excel">Kâr/Zarar Excel</option>
+            <option value="lines_csv">Satır Export (CSV)</option>
+          </select>
+          <input name="start" type="date" value="__START__" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
+          <input name="end" type="date" value="__END__" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
+          <button class="w-full px-4 py-2 rounded-xl bg-orange-500 text-white font-extrabold shadow-sm" type="submit">Başlat</button>
+        </form>
+      </div>
+    </div>
+
+<script>
+const HL = "__HIGHLIGHT__";
+const LABELS = {report_excel: 'Excel', lines_csv: 'CSV Export', find_order: 'Sipariş Arama'};
+const BADGES = {queued: 'bg-slate-100 text-slate-700', running: 'bg-amber-50 text-amber-700',
+                done: 'bg-emerald-50 text-emerald-700', failed: 'bg-red-50 text-red-700', cancelled: 'bg-slate-100 text-slate-400'};
+
+async function cancelJob(id){
+  await fetch(`/jobs/${id}/cancel`, {method: 'POST'});
+  loadJobs();
+}
+
+async function submitJob(form){
+  const r = await fetch('/jobs', {method: 'POST', body: new FormData(form)});
+  if(!r.ok){ alert((await r.json()).detail || 'hata'); }
+  loadJobs();
+  return false;
+}
+
+function actions(j){
+  if(j.status === 'done'){
+    if(j.kind === 'find_order'){ return `<a class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" href="${j.download}">Sonuç</a> <a class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" href="/app/invoices">Faturalar</a>`; }
+    return `<a class="px-3 py-1 rounded-lg bg-slate-900 text-white font-bold" href="${j.download}">İndir</a>`;
+  }
+  if(j.status === 'queued' || j.status === 'running'){
+    return `<button class="px-3 py-1 rounded-lg bg-white border hover:bg-slate-50" onclick="cancelJob('${j.id}')">İptal</button>`;
+  }
+  return `<span class="text-xs text-slate-500">${j.error || j.message || ''}</span>`;
+}
+
+let timer = null;
+async function loadJobs(){
+  const data = await (await fetch('/jobs?limit=50')).json();
+  const tb = document.getElementById('jb');
+  const jobs = data.jobs || [];
+  if(!jobs.length){
+    tb.innerHTML = `<tr><td class="p-3 text-slate-500" colspan="6">Henüz iş yok.</td></tr>`;
+  } else {
+    tb.innerHTML = jobs.map(j => `
+      <tr class="${j.id === HL ? 'bg-orange-50' : ''}">
+        <td class="p-2 font-semibold">${LABELS[j.kind] || j.kind}</td>
+        <td class="p-2 text-slate-500 text-xs">${Object.values(j.params || {}).filter(v => v !== true).join(' → ')}</td>
+        <td class="p-2"><span class="px-2 py-1 rounded-xl text-xs font-bold ${BADGES[j.status] || ''}">${j.status}</span></td>
+        <td class="p-2 text-right">%${Math.round((j.progress || 0) * 100)}<div class="text-[11px] text-slate-400">${j.status === 'running' ? (j.message || '') : ''}</div></td>
+        <td class="p-2 text-slate-500 text-xs whitespace-nowrap">${j.created_at}</td>
+        <td class="p-2">${actions(j)}</td>
+      </tr>`).join('');
+  }
+  clearTimeout(timer);
+  if(jobs.some(j => j.status === 'queued' || j.status === 'running')){
+    timer = setTimeout(loadJobs, 2000);
+  }
+}
+loadJobs();
+</script>
+"""
+    body = body.replace("__START__", (today - timedelta(days=30)).isoformat()).replace("__END__", today.isoformat())
+    body = body.replace("__HIGHLIGHT__", "".join(ch for ch in highlight if ch.isalnum()))
+    return ui_shell("İşler", body, active="jobs")
+
+
+@app.post("/app/jobs/find-order")
+def app_jobs_find_order(orderNumber: str = Form(...), auth=Depends(panel_auth)):
+    orderNumber = str(orderNumber).strip()
+    if not orderNumber:
+        raise HTTPException(400, "orderNumber boş olamaz")
+    job_id = submit_job("find_order", {"orderNumber": orderNumber}, priority=1)
+    return RedirectResponse(url=f"/app/jobs?highlight={job_id}", status_code=303)
 
 
 @app.get("/app/settings", response_class=HTMLResponse)
@@ -1130,6 +5356,23 @@ def app_settings(auth=Depends(panel_auth)):
             return "***"
         return v[:2] + "***" + v[-2:]
 
+    seller = SELLERS.get(current_seller_id(), {})
+    info = seller_info()
+    sync_rows = []
+    for st in (_sync_status(sid) for sid in SELLERS):
+        state = "çalışıyor" if st["running"] else "kapalı"
+        err = f"<div class='text-xs text-red-700'>{html.escape(st['last_error'])}</div>" if st["last_error"] else ""
+        sync_rows.append(f"""
+          <tr class="border-b bg-white">
+            <td class="p-2 font-semibold">{html.escape(st['title'])} <span class="text-xs text-slate-500">({html.escape(st['seller'])})</span></td>
+            <td class="p-2">{state}</td>
+            <td class="p-2 text-right">{st['packages']}</td>
+            <td class="p-2 text-right">{st['lines']}</td>
+            <td class="p-2 text-right">{st['claims']}</td>
+            <td class="p-2">{st['last_ok'] or '-'}{err}</td>
+          </tr>""")
+    sync_body = "".join(sync_rows) or EMPTY_ROW_TPL.format(colspan=6, text="Satıcı tanımlı değil.")
+
     body = f"""
     <div class="grid lg:grid-cols-2 gap-3">
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
@@ -1139,19 +5382,19 @@ def app_settings(auth=Depends(panel_auth)):
         <div class="mt-4 grid grid-cols-2 gap-2 text-sm">
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">TRENDYOL_API_KEY</div>
-            <div class="font-bold">{mask(os.getenv("TRENDYOL_API_KEY",""))}</div>
+            <div class="font-bold">{mask(seller.get("api_key", ""))}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">TRENDYOL_API_SECRET</div>
-            <div class="font-bold">{mask(os.getenv("TRENDYOL_API_SECRET",""))}</div>
+            <div class="font-bold">{mask(seller.get("api_secret", ""))}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">TRENDYOL_SELLER_ID</div>
-            <div class="font-bold">{os.getenv("TRENDYOL_SELLER_ID","-") or "-"}</div>
+            <div class="font-bold">{html.escape(seller.get("id") or "-")}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">DB_PATH</div>
-            <div class="font-bold">{DB_PATH}</div>
+            <div class="font-bold">{seller_db_path(current_seller_id())}</div>
           </div>
         </div>
 
@@ -1167,29 +5410,57 @@ def app_settings(auth=Depends(panel_auth)):
         <div class="mt-4 grid grid-cols-2 gap-2 text-sm">
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">Ünvan</div>
-            <div class="font-bold">{SELLER_TITLE}</div>
+            <div class="font-bold">{html.escape(info["title"])}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">VKN</div>
-            <div class="font-bold">{SELLER_VKN}</div>
+            <div class="font-bold">{html.escape(info["vkn"])}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">Vergi Dairesi</div>
-            <div class="font-bold">{SELLER_TAX_OFFICE}</div>
+            <div class="font-bold">{html.escape(info["tax_office"])}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border">
             <div class="text-xs text-slate-500">E-posta</div>
-            <div class="font-bold">{SELLER_EMAIL}</div>
+            <div class="font-bold">{html.escape(info["email"])}</div>
           </div>
           <div class="p-3 rounded-xl bg-slate-50 border col-span-2">
             <div class="text-xs text-slate-500">Adres</div>
-            <div class="font-bold">{SELLER_ADDRESS} {SELLER_DISTRICT}/{SELLER_CITY}</div>
+            <div class="font-bold">{html.escape(info["address"])} {html.escape(info["district"])}/{html.escape(info["city"])}</div>
           </div>
         </div>
 
         <div class="mt-4 text-xs text-slate-500">
           Bu alanları ENV ile değiştiriyorsun: SELLER_TITLE, SELLER_VKN, SELLER_TAX_OFFICE, SELLER_ADDRESS, SELLER_CITY, SELLER_DISTRICT, SELLER_EMAIL
+          (çoklu mağazada TRENDYOL_SELLERS içinde satıcı başına title, vkn, tax_office, address, city, district, email)
+        </div>
+      </div>
+    </div>
+
+    <div class="mt-3 p-4 rounded-2xl bg-white border shadow-sm">
+      <div class="flex flex-wrap items-center justify-between gap-2">
+        <div>
+          <div class="font-extrabold text-lg">Mağazalar / Sipariş Senkronu</div>
+          <div class="text-xs text-slate-500">Her mağaza kendi verisini {SYNC_INTERVAL_SECONDS} sn'de bir ayrı worker ile çeker.</div>
         </div>
+        <form method="post" action="/app/sync/run">
+          <button class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Aktif mağazayı şimdi senkronla</button>
+        </form>
+      </div>
+      <div class="mt-3 overflow-auto rounded-xl border">
+        <table class="min-w-full text-sm">
+          <thead class="bg-slate-50">
+            <tr class="border-b">
+              <th class="p-2 text-left">Mağaza</th>
+              <th class="p-2 text-left">Senkron</th>
+              <th class="p-2 text-right">Paket</th>
+              <th class="p-2 text-right">Satır</th>
+              <th class="p-2 text-right">İade/İptal</th>
+              <th class="p-2 text-left">Son başarılı</th>
+            </tr>
+          </thead>
+          <tbody>{sync_body}</tbody>
+        </table>
       </div>
     </div>
     """
@@ -1200,10 +5471,16 @@ def app_settings(auth=Depends(panel_auth)):
 # MELONTIK-LIKE PAGES (v3)
 # =========================
 
-def _try_fetch_lines(start_dt: datetime, end_dt: datetime, max_pages: int = 30):
-    # Safely fetch orders and flatten lines with calculated profit.
-    cost_map = get_cost_map()
-    orders = fetch_orders(start_ms=_ms(start_dt), end_ms=_ms(end_dt), order_number=None, max_pages=max_pages)
+async def fetch_lines_async(start_dt: datetime, end_dt: datetime, max_pages: int = 30) -> FetchResult:
+    # Siparişleri çekip kârı hesaplanmış satırlara açar; upstream beklerken thread tutulmaz.
+    # PAGE_BUDGET_SECONDS dolarsa gelen kadarı "eksik veri" kutusuyla gösterilir.
+    cost_map = await run_in_threadpool(get_cost_map)
+    deadline = budget_deadline(PAGE_BUDGET_SECONDS)
+    orders = await fetch_orders_swr(_ms(start_dt), _ms(end_dt), max_pages=max_pages, deadline=deadline)
+    return orders.with_items(await run_in_threadpool(_flatten_lines, orders, cost_map))
+
+@traced("compute.lines")
+def _flatten_lines(orders: list[dict], cost_map: dict) -> list[dict]:
     flat = []
     for o in orders or []:
         order_no = o.get("orderNumber") or ""
@@ -1225,12 +5502,41 @@ def _try_fetch_lines(start_dt: datetime, end_dt: datetime, max_pages: int = 30):
                 "campaign": l.get("salesCampaignId") or "",
                 "qty": l.get("quantity") or 1,
                 "unit_cost": float(cost_map.get((l.get("merchantSku") or l.get("merchantSkuId") or ""), 0.0)),
+                "fatura": c[INVOICE_KEY],  # kârlılık / kampanya toplamları oranı bilmeden okur
                 **c
             })
+    span_set(orders=len(orders or []), lines=len(flat))
     return flat
 
+PROFIT_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 font-semibold">{key}{observed}</td>
+          <td class="p-2 text-right">{qty}</td>
+          <td class="p-2 text-right">{sales}</td>
+          <td class="p-2 text-right">{comm}</td>
+          <td class="p-2 text-right">{disc}</td>
+          <td class="p-2 text-right">{inv}</td>
+          <td class="p-2 text-right">{cost}</td>
+          <td class="p-2 text-right font-extrabold">{real_net}</td>
+          <td class="p-2 text-right">{net}</td>
+        </tr>
+        """
+
+PROFIT_OBSERVED_TPL = ("<div class='text-xs font-normal text-slate-500'>gözlenen kom. {cr} · ort. fiyat {price} · "
+                       "<a class='underline' href='/app/pricing?sku={sku}'>min. fiyat</a></div>")
+
+def _profit_row(r: dict, stats: Optional[dict] = None) -> dict:
+    observed = ""
+    if stats and stats["commission_rate"] is not None:
+        observed = PROFIT_OBSERVED_TPL.format(cr=f"%{stats['commission_rate'] * 100:.1f}", price=tr_money(stats["avg_price"] or 0),
+                                              sku=quote(r["key"]))
+    return {"key": r["key"], "observed": observed, "qty": r.get("qty", 0), "sales": tr_money(r["sales"]), "comm": tr_money(r["comm"]),
+            "disc": tr_money(r["disc"]), "inv": tr_money(r["inv"]), "cost": tr_money(r.get("cost", 0.0)),
+            "real_net": tr_money(r.get("real_net", 0.0)), "net": tr_money(r["net"])}
+
 @app.get("/app/profit", response_class=HTMLResponse)
-def app_profit(
+async def app_profit(
+    request: Request,
     start: str = Query(default=""),
     end: str = Query(default=""),
     group: str = Query(default="sku"),
@@ -1238,6 +5544,11 @@ def app_profit(
     sort: str = Query(default="real_net"),
     auth=Depends(panel_auth)
 ):
+    etag, last_modified = await run_in_threadpool(data_etag, request, ("orders", "costs", "store"))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
     # Kârlılık ekranı: Ürün/SKU bazlı ve Sipariş bazlı özet.
     today = date.today()
     if not start:
@@ -1253,80 +5564,7 @@ def app_profit(
     q = (q or "").strip().lower()
     sort = sort if sort in ("real_net","net","sales") else "real_net"
 
-    err = ""
-    rows = []
-    summary = {"sales": 0.0, "net": 0.0, "comm": 0.0, "inv": 0.0, "disc": 0.0, "cost": 0.0, "real_net": 0.0, "count": 0}
-    try:
-        lines = _try_fetch_lines(start_dt, end_dt, max_pages=40)
-        if q:
-            filtered = []
-            for x in lines:
-                if (q in str(x.get('orderNumber','')).lower()) or (q in str(x.get('merchantSku','')).lower()) or (q in str(x.get('sku','')).lower()) or (q in str(x.get('productName','')).lower()):
-                    filtered.append(x)
-            lines = filtered
-        summary["count"] = len(lines)
-        for x in lines:
-            summary["sales"] += x.get("satis", 0.0)
-            summary["net"] += x.get("net_kar", 0.0)
-            summary["comm"] += x.get("komisyon", 0.0)
-            summary["inv"] += x.get("fatura", 0.0)
-            summary["disc"] += x.get("satici_indirim", 0.0)
-            summary["cost"] += float(x.get("unit_cost", 0.0)) * float(x.get("qty", 1) or 1)
-            summary["real_net"] += x.get("net_kar", 0.0) - (float(x.get("unit_cost", 0.0)) * float(x.get("qty", 1) or 1))
-
-        agg = {}
-        if group == "sku":
-            for x in lines:
-                key = (x.get("merchantSku") or x.get("sku") or x.get("productName") or "Bilinmeyen")
-                a = agg.setdefault(key, {"key": key, "qty": 0, "sales": 0.0, "net": 0.0, "comm": 0.0, "inv": 0.0, "disc": 0.0, "cost": 0.0, "real_net": 0.0})
-                a["qty"] += int(x.get("qty", 1) or 1)
-                a["sales"] += x.get("satis", 0.0)
-                a["net"] += x.get("net_kar", 0.0)
-                a["comm"] += x.get("komisyon", 0.0)
-                a["inv"] += x.get("fatura", 0.0)
-                a["disc"] += x.get("satici_indirim", 0.0)
-                a["cost"] += float(x.get("unit_cost", 0.0)) * float(x.get("qty", 1) or 1)
-                a["real_net"] += x.get("net_kar", 0.0) - (float(x.get("unit_cost", 0.0)) * float(x.get("qty", 1) or 1))
-        else:
-            for x in lines:
-                key = x.get("orderNumber") or ""
-                a = agg.setdefault(key, {"key": key, "qty": 0, "sales": 0.0, "net": 0.0, "comm": 0.0, "inv": 0.0, "disc": 0.0, "cost": 0.0, "real_net": 0.0})
-                a["qty"] += int(x.get("qty", 1) or 1)
-                a["sales"] += x.get("satis", 0.0)
-                a["net"] += x.get("net_kar", 0.0)
-                a["comm"] += x.get("komisyon", 0.0)
-                a["inv"] += x.get("fatura", 0.0)
-                a["disc"] += x.get("satici_indirim", 0.0)
-                a["cost"] += float(x.get("unit_cost", 0.0)) * float(x.get("qty", 1) or 1)
-                a["real_net"] += x.get("net_kar", 0.0) - (float(x.get("unit_cost", 0.0)) * float(x.get("qty", 1) or 1))
-
-        rows = sorted(agg.values(), key=lambda r: r.get(sort, 0.0))
-    except Exception as e:
-        err = str(e)
-
-    def tr_money(v: float) -> str:
-        try:
-            return f"{float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        except Exception:
-            return str(v)
-
-    body_rows = ""
-    for r in rows[-200:]:
-        body_rows += f"""
-        <tr class="border-b bg-white">
-          <td class="p-2 font-semibold">{r['key']}</td>
-          <td class="p-2 text-right">{r.get('qty', 0)}</td>
-          <td class="p-2 text-right">{tr_money(r['sales'])}</td>
-          <td class="p-2 text-right">{tr_money(r['comm'])}</td>
-          <td class="p-2 text-right">{tr_money(r['disc'])}</td>
-          <td class="p-2 text-right">{tr_money(r['inv'])}</td>
-          <td class="p-2 text-right">{tr_money(r.get("cost",0.0))}</td>
-          <td class="p-2 text-right font-extrabold">{tr_money(r.get("real_net",0.0))}</td>
-          <td class="p-2 text-right">{tr_money(r['net'])}</td>
-        </tr>
-        """
-
-    body = f"""
+    head = f"""
     <div class="grid md:grid-cols-5 gap-3">
       <div class="p-4 rounded-2xl bg-white border shadow-sm md:col-span-3">
         <div class="flex flex-wrap gap-2 items-end justify-between">
@@ -1365,9 +5603,45 @@ def app_profit(
             <button class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Analiz</button>
           </form>
         </div>
+        """
 
-        {("<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: "+err+"</div>") if err else ""}
-
+    def body(lines, err):
+        rows = []
+        summary = {"sales": 0.0, "net": 0.0, "comm": 0.0, "inv": 0.0, "disc": 0.0, "cost": 0.0, "real_net": 0.0, "count": 0}
+        try:
+            if q:
+                lines = [
+                    x for x in lines
+                    if (q in str(x.get('orderNumber','')).lower()) or (q in str(x.get('merchantSku','')).lower()) or (q in str(x.get('sku','')).lower()) or (q in str(x.get('productName','')).lower())
+                ]
+            with span("compute.aggregate", group=group, lines=len(lines)):
+                summary["count"] = len(lines)
+
+                agg = {}
+                for x in lines:
+                    if group == "sku":
+                        key = (x.get("merchantSku") or x.get("sku") or x.get("productName") or "Bilinmeyen")
+                    else:
+                        key = x.get("orderNumber") or ""
+                    qty = float(x.get("qty", 1) or 1)
+                    cost = float(x.get("unit_cost", 0.0)) * qty
+                    a = agg.setdefault(key, {"key": key, "qty": 0, "sales": 0.0, "net": 0.0, "comm": 0.0, "inv": 0.0, "disc": 0.0, "cost": 0.0, "real_net": 0.0})
+                    a["qty"] += int(qty)
+                    for dst, k in (("sales", "satis"), ("net", "net_kar"), ("comm", "komisyon"), ("inv", "fatura"), ("disc", "satici_indirim")):
+                        v = x.get(k, 0.0)
+                        a[dst] += v
+                        summary[dst] += v
+                    a["cost"] += cost
+                    a["real_net"] += x.get("net_kar", 0.0) - cost
+                    summary["cost"] += cost
+                    summary["real_net"] += x.get("net_kar", 0.0) - cost
+
+                rows = sorted(agg.values(), key=lambda r: r.get(sort, 0.0))
+        except Exception as e:
+            err = str(e)
+
+        yield error_box(err)
+        yield f"""
         <div class="mt-4 overflow-auto rounded-xl border">
           <table class="min-w-full text-sm">
             <thead class="bg-slate-100 sticky top-0">
@@ -1384,7 +5658,12 @@ def app_profit(
               </tr>
             </thead>
             <tbody class="divide-y">
-              {body_rows if body_rows else "<tr><td class='p-3 text-slate-500' colspan='9'>Kayıt yok.</td></tr>"}
+        """
+        shown = rows[-200:]
+        # SKU görünümünde satır başına gözlenen oranlar: sku_stats'tan tek PK sorgusu
+        stats = get_sku_stats(r["key"] for r in shown) if group == "sku" else {}
+        yield from render_rows(PROFIT_ROW_TPL, (_profit_row(r, stats.get(r["key"])) for r in shown), colspan=9)
+        yield f"""
             </tbody>
           </table>
         </div>
@@ -1434,8 +5713,52 @@ def app_profit(
       </div>
     </div>
     """
-    return ui_shell("Kârlılık", body, active="profit")
 
+    def fetch():
+        return fetch_lines_async(start_dt, end_dt, max_pages=40)
+
+    data, err = await prefetch(fetch)
+    resp = stream_page("Kârlılık", render_fetched(head, data, err, body), active="profit", etag=etag)
+    resp.headers.update(page_headers(etag, last_modified, err, data))
+    return resp
+
+
+PRICING_PAGE_ROWS = int(os.getenv("PRICING_PAGE_ROWS", "200"))
+PRICING_ROW_TPL = """
+              <tr class="border-b bg-white">
+                <td class="p-2 font-semibold"><a class="hover:underline" href="/app/pricing?sku={sku_q}&cost={cost_raw}&sale_price={price_raw}&commission_rate={cr_raw}&target_margin={tm_raw}">{sku}</a></td>
+                <td class="p-2 text-right">{cost}</td>
+                <td class="p-2 text-right">{cr} <span class="text-xs text-slate-400">{src}</span></td>
+                <td class="p-2 text-right">{tm}</td>
+                <td class="p-2 text-right">{price}</td>
+                <td class="p-2 text-right">{min_price}</td>
+                <td class="p-2 text-right font-extrabold {gap_cls}">{gap}</td>
+                <td class="p-2 text-right {gap_cls}">{gap_pct}</td>
+                <td class="p-2 text-right">{net}</td>
+              </tr>"""
+OBSERVED_BOX_TPL = """
+        <div class="mt-3 p-3 rounded-xl bg-sky-50 border border-sky-200 text-sm text-sky-900">
+          <b>Siparişlerde gözlenen</b> ({lines} satır): komisyon {cr} · satıcı indirimi {sd} · Trendyol indirimi {td} · ort. fiyat {price}
+        </div>"""
+_COMMISSION_SOURCES = {"sku": "SKU", "siparis": "sipariş", "varsayilan": "varsayılan"}
+
+def _pricing_row(r: dict) -> dict:
+    def money(v):
+        return "-" if v is None else tr_money(v)
+
+    def pct(v):
+        return "-" if v is None else f"%{v * 100:.1f}".replace(".", ",")
+
+    gap = r["gap"]
+    return {
+        "sku": html.escape(r["sku"]), "sku_q": quote(r["sku"]),
+        "cost_raw": round(r["cost"], 2), "price_raw": round(r["price"] or 0.0, 2),
+        "cr_raw": round(r["commission_rate"], 4), "tm_raw": round(r["target_margin"], 4),
+        "cost": money(r["cost"]), "cr": pct(r["commission_rate"]), "src": _COMMISSION_SOURCES[r["commission_source"]],
+        "tm": pct(r["target_margin"]), "price": money(r["price"]), "min_price": money(r["min_price"]),
+        "gap": money(gap), "gap_pct": pct(r["gap_pct"]), "net": money(r["net"]),
+        "gap_cls": "" if gap is None else ("text-red-700" if gap < 0 else "text-emerald-700"),
+    }
 
 @app.get("/app/pricing", response_class=HTMLResponse)
 def app_pricing(
@@ -1443,28 +5766,64 @@ def app_pricing(
     sale_price: float = Query(default=0.0, ge=0.0),
     cost: float = Query(default=0.0, ge=0.0),
     target_margin: float = Query(default=0.15, ge=0.0, le=5.0),
-    commission_rate: float = Query(default=0.20, ge=0.0, le=1.0),
+    commission_rate: Optional[float] = Query(default=None, ge=0.0, le=1.0),
+    only: str = Query(default="below"),
+    q: str = Query(default=""),
+    sort: str = Query(default="gap"),
+    desc: bool = Query(default=False),
     auth=Depends(panel_auth)
 ):
     # Basit hedef fiyat hesabı (simülasyon)
+    def fm(x):
+        try:
+            return f"{float(x):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        except Exception:
+            return str(x)
+
     invoice_rate = float(INVOICE_RATE or 0.10)
     p = float(sale_price or 0.0)
     c = float(cost or 0.0)
     if (not c) and sku:
         c = float(get_cost_map().get(sku.strip(), 0.0))
     tr = float(target_margin or 0.0)
-    cr = float(commission_rate or 0.0)
+    # komisyon / fiyat verilmediyse SKU'nun siparişlerde gözlenen değerleri
+    stats = get_sku_stats([sku.strip()]).get(sku.strip()) if sku else None
+    cr_default = PRICING_DEFAULT_COMMISSION if commission_rate is None else float(commission_rate)
+    cr = cr_default
+    if commission_rate is None and stats and stats["commission_rate"] is not None:
+        cr = stats["commission_rate"]
+    if not p and stats and stats["avg_price"]:
+        p = round(stats["avg_price"], 2)
+    observed = ""
+    if stats:
+        observed = OBSERVED_BOX_TPL.format(
+            lines=stats["lines"], cr=f"%{(stats['commission_rate'] or 0) * 100:.1f}",
+            sd=f"%{(stats['seller_discount_rate'] or 0) * 100:.1f}", td=f"%{(stats['ty_discount_rate'] or 0) * 100:.1f}",
+            price=fm(stats["avg_price"] or 0),
+        )
 
     denom = (1.0 - cr - invoice_rate - tr)
     min_price = None
     if denom > 0:
         min_price = c / denom
 
-    def fm(x):
-        try:
-            return f"{float(x):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        except Exception:
-            return str(x)
+    # toplu mod: tüm katalog, SKU parametreleriyle
+    only = only if only in PRICING_FILTERS else "below"
+    sort = sort if sort in PRICING_SORTS else "gap"
+    q = (q or "").strip()
+    err = ""
+    summary = {"total": 0, "below": 0, "above": 0, "nodata": 0, "below_gap": 0.0}
+    batch_rows = []
+    try:
+        summary = pricing_summary(cr_default, tr, q)
+        batch_rows = [_pricing_row(r) for r in price_catalogue(cr_default, tr, only, q, sort, desc, limit=PRICING_PAGE_ROWS)]
+    except Exception as e:
+        err = str(e)
+    qs = urlencode({"commission_rate": cr_default, "target_margin": tr, "only": only, "q": q, "sort": sort, "desc": str(desc).lower()})
+    batch_body = "".join(PRICING_ROW_TPL.format_map(r) for r in batch_rows) or EMPTY_ROW_TPL.format(colspan=9, text="Kayıt yok.")
+
+    def opt(value, label, current):
+        return f'<option value="{value}" {"selected" if current == value else ""}>{label}</option>'
 
     body = f"""
     <div class="grid lg:grid-cols-3 gap-3">
@@ -1487,7 +5846,7 @@ def app_pricing(
           </div>
           <div>
             <div class="text-xs text-slate-500 mb-1">Komisyon Oranı</div>
-            <input name="commission_rate" value="{cr}" type="number" step="0.01" min="0" max="1" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
+            <input name="commission_rate" value="{round(cr, 4)}" type="number" step="0.0001" min="0" max="1" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
             <div class="text-[11px] text-slate-400 mt-1">0.20 = %20</div>
           </div>
           <div>
@@ -1500,6 +5859,7 @@ def app_pricing(
             <a class="px-4 py-2 rounded-xl bg-white border font-extrabold hover:bg-slate-50" href="/app/pricing">Sıfırla</a>
           </div>
         </form>
+        {observed}
 
         <div class="mt-4 grid md:grid-cols-3 gap-2 text-sm">
           <div class="p-3 rounded-xl bg-slate-50 border">
@@ -1517,7 +5877,7 @@ def app_pricing(
         </div>
 
         <div class="mt-3 text-xs text-slate-500">
-          Not: Bu ekran simülasyon. Komisyon/indirim ürün ve kampanyaya göre değişir. İstersen gerçek siparişlerden otomatik komisyon oranı çıkarırız.
+          Not: Bu ekran simülasyon. SKU yazıp komisyonu boş bırakırsan siparişlerde gözlenen oran ve ortalama fiyat kullanılır; kampanyaya göre değişebilir.
         </div>
       </div>
 
@@ -1543,10 +5903,101 @@ def app_pricing(
         </div>
       </div>
     </div>
+
+    <div class="mt-3 grid lg:grid-cols-4 gap-3">
+      <div class="lg:col-span-3 p-4 rounded-2xl bg-white border shadow-sm">
+        <div class="flex flex-wrap gap-3 items-end justify-between">
+          <div>
+            <div class="font-extrabold text-lg">Katalog (toplu)</div>
+            <div class="text-xs text-slate-500">Maliyeti girili tüm SKU'lar. Komisyon: SKU ayarı → siparişlerde gözlenen → varsayılan ({fm(cr_default)}). Fiyat: SKU ayarı → sipariş ortalaması.</div>
+          </div>
+          <form class="flex flex-wrap gap-2 items-end" method="get" action="/app/pricing">
+            <input type="hidden" name="commission_rate" value="{cr_default}"/>
+            <input type="hidden" name="target_margin" value="{tr}"/>
+            <div>
+              <div class="text-xs text-slate-500 mb-1">Göster</div>
+              <select name="only" class="px-3 py-2 rounded-xl border bg-slate-50">
+                {opt("below", "Minimumun altında", only)}{opt("above", "Minimumun üstünde", only)}
+                {opt("nodata", "Fiyatı bilinmeyen", only)}{opt("all", "Hepsi", only)}
+              </select>
+            </div>
+            <div>
+              <div class="text-xs text-slate-500 mb-1">Sırala</div>
+              <select name="sort" class="px-3 py-2 rounded-xl border bg-slate-50">
+                {opt("gap", "Fark", sort)}{opt("gap_pct", "Fark %", sort)}{opt("min_price", "Min. fiyat", sort)}
+                {opt("cost", "Maliyet", sort)}{opt("sku", "SKU", sort)}
+              </select>
+            </div>
+            <label class="flex items-center gap-1 text-xs text-slate-500 pb-3"><input type="checkbox" name="desc" value="true" {"checked" if desc else ""}/> azalan</label>
+            <div>
+              <div class="text-xs text-slate-500 mb-1">SKU</div>
+              <input name="q" value="{html.escape(q)}" class="px-3 py-2 rounded-xl border bg-slate-50 w-40"/>
+            </div>
+            <button class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Listele</button>
+            <a class="px-4 py-2 rounded-xl bg-white border font-extrabold hover:bg-slate-50" href="/pricing/batch.csv?{qs}">CSV indir</a>
+          </form>
+        </div>
+        {error_box(err)}
+        <div class="mt-3 grid md:grid-cols-4 gap-2 text-sm">
+          <div class="p-3 rounded-xl bg-slate-50 border"><div class="text-xs text-slate-500">SKU</div><div class="font-extrabold">{summary['total']}</div></div>
+          <div class="p-3 rounded-xl bg-red-50 border border-red-200"><div class="text-xs text-red-700">Minimumun altında</div><div class="font-extrabold text-red-800">{summary['below']} <span class="text-xs">(-{fm(summary['below_gap'])})</span></div></div>
+          <div class="p-3 rounded-xl bg-emerald-50 border border-emerald-200"><div class="text-xs text-emerald-700">Minimumun üstünde</div><div class="font-extrabold text-emerald-800">{summary['above']}</div></div>
+          <div class="p-3 rounded-xl bg-slate-50 border"><div class="text-xs text-slate-500">Fiyatı bilinmeyen</div><div class="font-extrabold">{summary['nodata']}</div></div>
+        </div>
+        <div class="mt-3 overflow-auto rounded-xl border">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-100 sticky top-0">
+              <tr>
+                <th class="text-left p-2">SKU</th>
+                <th class="text-right p-2">Maliyet</th>
+                <th class="text-right p-2">Komisyon</th>
+                <th class="text-right p-2">Hedef</th>
+                <th class="text-right p-2">Fiyat</th>
+                <th class="text-right p-2">Min. Fiyat</th>
+                <th class="text-right p-2">Fark</th>
+                <th class="text-right p-2">Fark %</th>
+                <th class="text-right p-2">Net</th>
+              </tr>
+            </thead>
+            <tbody class="divide-y">{batch_body}</tbody>
+          </table>
+        </div>
+        <div class="mt-2 text-xs text-slate-500">İlk {PRICING_PAGE_ROWS} satır gösterilir; tamamı için CSV.</div>
+      </div>
+
+      <div class="p-4 rounded-2xl bg-white border shadow-sm">
+        <div class="font-extrabold text-lg">SKU Ayarı</div>
+        <div class="text-xs text-slate-500">Boş bırakılan alan varsayılanı kullanır; hepsi boşsa ayar silinir.</div>
+        <form class="mt-3 space-y-2" method="post" action="/pricing/params">
+          <input name="merchant_sku" value="{html.escape(q)}" placeholder="SKU" class="px-3 py-2 rounded-xl border bg-slate-50 w-full" required/>
+          <input name="commission_rate" placeholder="Komisyon oranı (0.18)" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
+          <input name="target_margin" placeholder="Hedef kâr (0.15)" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
+          <input name="sale_price" placeholder="Satış fiyatı" class="px-3 py-2 rounded-xl border bg-slate-50 w-full"/>
+          <button class="w-full px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Kaydet</button>
+        </form>
+      </div>
+    </div>
     """
     return ui_shell("Fiyat / Hedef", body, active="pricing")
 
 
+RETURN_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 whitespace-nowrap">{date}<div class="text-xs text-slate-500">sipariş {order_date}</div></td>
+          <td class="p-2 font-semibold">{order}</td>
+          <td class="p-2"><span class="px-2 py-1 rounded-xl border {badge} text-xs font-bold">{status}</span><div class="text-xs text-slate-500 mt-1">{reason}</div></td>
+          <td class="p-2">{product} <span class="text-xs text-slate-500">x{units}</span></td>
+          <td class="p-2 text-slate-500">{sku}</td>
+          <td class="p-2 text-right">{sale}</td>
+          <td class="p-2 text-right font-extrabold">{net}</td>
+        </tr>
+        """
+
+def _return_row(r: dict) -> dict:
+    badge = "bg-red-50 text-red-700 border-red-200" if r["kind"] == "return" else "bg-amber-50 text-amber-700 border-amber-200"
+    return {**{k: html.escape(str(v)) for k, v in r.items()}, "badge": badge, "sale": tr_money(r["sale"]),
+            "net": "-" if r["net"] is None else tr_money(r["net"])}
+
 @app.get("/app/returns", response_class=HTMLResponse)
 def app_returns(
     start: str = Query(default=""),
@@ -1564,72 +6015,23 @@ def app_returns(
     else:
         end_dt = datetime.fromisoformat(end) + timedelta(days=1) - timedelta(milliseconds=1)
 
-    q = (q or "").strip().lower()
+    q = (q or "").strip()
 
     err = ""
     rows = []
     stats = {"lines": 0, "returns": 0, "cancels": 0}
     try:
-        orders = fetch_orders(start_ms=_ms(start_dt), end_ms=_ms(end_dt), order_number=None, max_pages=40)
-        for o in orders or []:
-            order_no = o.get("orderNumber") or ""
-            for l in (o.get("lines") or []):
-                status_name = (l.get("orderLineItemStatusName") or l.get("orderLineItemStatus") or "").strip()
-                status_l = status_name.lower()
-                stats["lines"] += 1
-                is_return = ("iade" in status_l) or ("return" in status_l)
-                is_cancel = ("iptal" in status_l) or ("cancel" in status_l)
-                if is_return:
-                    stats["returns"] += 1
-                if is_cancel:
-                    stats["cancels"] += 1
-                if not (is_return or is_cancel):
-                    continue
-
-                product = l.get("productName") or ""
-                sku = l.get("merchantSku") or l.get("sku") or ""
-                if q and (q not in product.lower()) and (q not in str(order_no).lower()) and (q not in str(sku).lower()):
-                    continue
-
-                c = calc_profit_for_line(l)
-                rows.append({
-                    "order": order_no,
-                    "status": status_name,
-                    "product": product,
-                    "sku": sku,
-                    "sale": c["satis"],
-                    "net": c["net_kar"],
-                })
-        rows = rows[:500]
+        rows, stats = query_returns(_ms(start_dt), _ms(end_dt), q, limit=RETURNS_LIMIT)
     except Exception as e:
         err = str(e)
 
-    def tr_money(v: float) -> str:
-        try:
-            return f"{float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        except Exception:
-            return str(v)
-
-    body_rows = ""
-    for r in rows:
-        badge = "bg-red-50 text-red-700 border-red-200" if ("iade" in (r["status"] or "").lower() or "return" in (r["status"] or "").lower()) else "bg-amber-50 text-amber-700 border-amber-200"
-        body_rows += f"""
-        <tr class="border-b bg-white">
-          <td class="p-2 font-semibold">{r['order']}</td>
-          <td class="p-2"><span class="px-2 py-1 rounded-xl border {badge} text-xs font-bold">{r['status']}</span></td>
-          <td class="p-2">{r['product']}</td>
-          <td class="p-2 text-slate-500">{r['sku']}</td>
-          <td class="p-2 text-right">{tr_money(r['sale'])}</td>
-          <td class="p-2 text-right font-extrabold">{tr_money(r['net'])}</td>
-        </tr>
-        """
-
-    body = f"""
+    def chunks():
+        yield f"""
     <div class="p-4 rounded-2xl bg-white border shadow-sm">
       <div class="flex flex-wrap gap-3 items-end justify-between">
         <div>
           <div class="font-extrabold text-lg">İadeler / İptaller</div>
-          <div class="text-xs text-slate-500">Satır durumundan (orderLineItemStatusName) filtrelenir.</div>
+          <div class="text-xs text-slate-500">Trendyol iade talepleri ve iptal satırları; talep / iptal tarihine göre, sipariş deposundan.</div>
         </div>
         <form class="flex flex-wrap gap-2 items-end" method="get" action="/app/returns">
           <div>
@@ -1642,57 +6044,121 @@ def app_returns(
           </div>
           <div>
             <div class="text-xs text-slate-500 mb-1">Ara</div>
-            <input name="q" value="{q}" placeholder="sipariş / sku / ürün" class="px-3 py-2 rounded-xl border bg-slate-50 w-56"/>
+            <input name="q" value="{html.escape(q)}" placeholder="sipariş / sku / ürün" class="px-3 py-2 rounded-xl border bg-slate-50 w-56"/>
           </div>
           <button class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Getir</button>
         </form>
       </div>
+        """
 
+        last_ok = get_sync_state().get("last_ok")
+        if not last_ok:
+            yield SYNC_PENDING_BOX_TPL
+        yield f"""
       <div class="mt-3 grid md:grid-cols-3 gap-2 text-sm">
         <div class="p-3 rounded-xl bg-slate-50 border">
           <div class="text-xs text-slate-500">Toplam Satır</div>
           <div class="font-extrabold">{stats['lines']}</div>
         </div>
         <div class="p-3 rounded-xl bg-red-50 border border-red-200">
-          <div class="text-xs text-red-700">İade</div>
+          <div class="text-xs text-red-700">İade (adet)</div>
           <div class="font-extrabold text-red-800">{stats['returns']}</div>
         </div>
         <div class="p-3 rounded-xl bg-amber-50 border border-amber-200">
-          <div class="text-xs text-amber-700">İptal</div>
+          <div class="text-xs text-amber-700">İptal (satır)</div>
           <div class="font-extrabold text-amber-800">{stats['cancels']}</div>
         </div>
       </div>
-
-      {("<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: "+err+"</div>") if err else ""}
-
+      <div class="mt-2 text-xs text-slate-500">Son senkron: {(last_ok or "-").replace("T", " ")}</div>
+        """
+        yield error_box(err)
+        yield """
       <div class="mt-4 overflow-auto rounded-xl border">
         <table class="min-w-full text-sm">
           <thead class="bg-slate-100 sticky top-0">
             <tr>
+              <th class="text-left p-2">Tarih</th>
               <th class="text-left p-2">Sipariş</th>
               <th class="text-left p-2">Durum</th>
               <th class="text-left p-2">Ürün</th>
               <th class="text-left p-2">SKU</th>
-              <th class="text-right p-2">Satış</th>
+              <th class="text-right p-2">Tutar</th>
               <th class="text-right p-2">Net</th>
             </tr>
           </thead>
           <tbody class="divide-y">
-            {body_rows if body_rows else "<tr><td class='p-3 text-slate-500' colspan='6'>Bu aralıkta iade/iptal yok.</td></tr>"}
+        """
+        yield from render_rows(RETURN_ROW_TPL, (_return_row(r) for r in rows), colspan=7, empty="Bu aralıkta iade/iptal yok.")
+        yield """
           </tbody>
         </table>
       </div>
     </div>
-    """
-    return ui_shell("İadeler", body, active="returns")
+        """
+
+    resp = stream_page("İadeler", chunks(), active="returns")
+    # hatalı ya da RETURNS_LIMIT'te kesilmiş (yarım) liste saklanmaz
+    if err or len(rows) >= RETURNS_LIMIT:
+        resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+PAYOUT_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 font-semibold whitespace-nowrap">{day}</td>
+          <td class="p-2 text-right">{records}</td>
+          <td class="p-2 text-right">{expected}</td>
+          <td class="p-2 text-right">{actual}</td>
+          <td class="p-2 text-right font-extrabold {diff_cls}">{diff}</td>
+          <td class="p-2 text-right">{unmatched}</td>
+          <td class="p-2 text-right">{other}</td>
+          <td class="p-2 text-right">{missing}</td>
+        </tr>
+        """
+PAYOUT_DIFF_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 font-semibold">{order}</td>
+          <td class="p-2">{kind}</td>
+          <td class="p-2 whitespace-nowrap">{day}</td>
+          <td class="p-2 text-right">{expected}</td>
+          <td class="p-2 text-right">{actual}</td>
+          <td class="p-2 text-right font-extrabold {diff_cls}">{diff}</td>
+        </tr>
+        """
+PAYOUT_MISSING_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 font-semibold">{order}</td>
+          <td class="p-2 whitespace-nowrap">{order_day}</td>
+          <td class="p-2 whitespace-nowrap">{due_day}</td>
+          <td class="p-2 text-right font-extrabold">{expected}</td>
+        </tr>
+        """
+_SETTLEMENT_KINDS = {"sale": "Satış", "return": "İade"}
+
+def _money_row(r: dict, keys: tuple) -> dict:
+    return {**r, **{k: tr_money(r[k]) for k in keys}}
+
+def _diff_cls(v: float) -> str:
+    if abs(v) <= RECONCILE_TOLERANCE:
+        return "text-slate-500"
+    return "text-emerald-700" if v > 0 else "text-red-700"
 
+def _payout_row(r: dict) -> dict:
+    row = _money_row(r, ("expected", "actual", "diff", "unmatched", "other", "missing"))
+    return {**row, "records": int(r["records"]), "diff_cls": _diff_cls(r["diff"])}
 
 @app.get("/app/payouts", response_class=HTMLResponse)
 def app_payouts(
+    request: Request,
     start: str = Query(default=""),
     end: str = Query(default=""),
     auth=Depends(panel_auth)
 ):
+    etag, last_modified = data_etag(request, ("store",))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
     today = date.today()
     if not start:
         start_dt = datetime.combine(today - timedelta(days=14), datetime.min.time())
@@ -1704,64 +6170,20 @@ def app_payouts(
         end_dt = datetime.fromisoformat(end) + timedelta(days=1) - timedelta(milliseconds=1)
 
     err = ""
-    daily = []
-    summary = {"sales": 0.0, "comm": 0.0, "disc": 0.0, "inv": 0.0, "net": 0.0, "cost": 0.0, "real_net": 0.0}
+    rec = {"days": [], "diffs": [], "missing": [], "totals": {}}
     try:
-        lines = _try_fetch_lines(start_dt, end_dt, max_pages=40)
-        by_day = {}
-        for x in lines:
-            od = x.get("orderDate")
-            d = (od.date().isoformat() if hasattr(od, "date") and od else "unknown")
-            a = by_day.setdefault(d, {"day": d, "sales": 0.0, "comm": 0.0, "disc": 0.0, "inv": 0.0, "net": 0.0, "cost": 0.0, "real_net": 0.0})
-            q = float(x.get("qty", 1) or 1)
-            cost = float(x.get("unit_cost", 0.0)) * q
-            a["sales"] += x.get("satis", 0.0)
-            a["comm"] += x.get("komisyon", 0.0)
-            a["disc"] += x.get("satici_indirim", 0.0)
-            a["inv"] += x.get("fatura", 0.0)
-            a["net"] += x.get("net_kar", 0.0)
-            a["cost"] += cost
-            a["real_net"] += x.get("net_kar", 0.0) - cost
-
-        daily = sorted(by_day.values(), key=lambda r: r["day"])
-        for r in daily:
-            summary["sales"] += r["sales"]
-            summary["comm"] += r["comm"]
-            summary["disc"] += r["disc"]
-            summary["inv"] += r["inv"]
-            summary["net"] += r["net"]
-            summary["cost"] += r["cost"]
-            summary["real_net"] += r["real_net"]
+        rec = reconcile_settlements(_ms(start_dt), _ms(end_dt))
     except Exception as e:
         err = str(e)
 
-    def tr_money(v: float) -> str:
-        try:
-            return f"{float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        except Exception:
-            return str(v)
-
-    rows = ""
-    for r in daily:
-        rows += f"""
-        <tr class="border-b bg-white">
-          <td class="p-2 font-semibold whitespace-nowrap">{r['day']}</td>
-          <td class="p-2 text-right">{tr_money(r['sales'])}</td>
-          <td class="p-2 text-right">{tr_money(r['comm'])}</td>
-          <td class="p-2 text-right">{tr_money(r['disc'])}</td>
-          <td class="p-2 text-right">{tr_money(r['inv'])}</td>
-          <td class="p-2 text-right">{tr_money(r['cost'])}</td>
-          <td class="p-2 text-right font-extrabold">{tr_money(r['real_net'])}</td>
-        </tr>
-        """
-
-    body = f"""
+    def chunks():
+        yield f"""
     <div class="grid lg:grid-cols-3 gap-3">
       <div class="lg:col-span-2 p-4 rounded-2xl bg-white border shadow-sm">
         <div class="flex flex-wrap gap-3 items-end justify-between">
           <div>
-            <div class="font-extrabold text-lg">Hakediş (Tahmini)</div>
-            <div class="text-xs text-slate-500">Gün gün: satış → kesintiler → tahmini gerçek net.</div>
+            <div class="font-extrabold text-lg">Hakediş Mutabakatı</div>
+            <div class="text-xs text-slate-500">Gün gün: siparişlerden beklenen → Trendyol cari hesabına yatan → fark.</div>
           </div>
           <form class="flex flex-wrap gap-2 items-end" method="get" action="/app/payouts">
             <div>
@@ -1775,55 +6197,129 @@ def app_payouts(
             <button class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Getir</button>
           </form>
         </div>
-
-        {("<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: "+err+"</div>") if err else ""}
-
+        """
+        if not get_sync_state().get("last_ok"):
+            yield SYNC_PENDING_BOX_TPL
+        yield error_box(err)
+        yield """
         <div class="mt-4 overflow-auto rounded-xl border">
           <table class="min-w-full text-sm">
             <thead class="bg-slate-100 sticky top-0">
               <tr>
                 <th class="text-left p-2">Gün</th>
-                <th class="text-right p-2">Satış</th>
-                <th class="text-right p-2">Komisyon</th>
-                <th class="text-right p-2">İndirim</th>
-                <th class="text-right p-2">Fatura</th>
-                <th class="text-right p-2">Maliyet</th>
-                <th class="text-right p-2">Tahmini Gerçek Net</th>
+                <th class="text-right p-2">Kayıt</th>
+                <th class="text-right p-2">Beklenen</th>
+                <th class="text-right p-2">Yatan</th>
+                <th class="text-right p-2">Fark</th>
+                <th class="text-right p-2">Eşleşmeyen</th>
+                <th class="text-right p-2">Diğer</th>
+                <th class="text-right p-2">Gelmeyen</th>
               </tr>
             </thead>
             <tbody class="divide-y">
-              {rows if rows else "<tr><td class='p-3 text-slate-500' colspan='7'>Kayıt yok.</td></tr>"}
+        """
+        yield from render_rows(PAYOUT_ROW_TPL, (_payout_row(r) for r in rec["days"]), colspan=8,
+                               empty="Bu aralıkta cari hesap hareketi yok.")
+        t = rec["totals"] or {k: 0 for k in ("expected", "paid", "diff", "unmatched", "unmatched_n", "other",
+                                             "missing", "missing_n", "diff_orders")}
+        yield f"""
             </tbody>
           </table>
         </div>
 
         <div class="mt-3 text-xs text-slate-500">
-          Not: Trendyol'un gerçek hakediş ekranındaki kesintiler farklı kalemler içerebilir. Bu tablo “yönetim” amaçlı tahmindir.
+          Beklenen: satış - satıcı indirimi - komisyon (iadede aynı tutarın eksisi); sadece eşleşen siparişler.
+          Eşleşmeyen: depoda siparişi bulunmayan hareket. Gelmeyen: vadesi ({SETTLEMENT_DUE_DAYS} gün) dolup Sale hareketi olmayan sipariş.
         </div>
       </div>
 
       <div class="p-4 rounded-2xl bg-white border shadow-sm">
         <div class="font-extrabold text-lg">Toplam</div>
         <div class="mt-3 space-y-2 text-sm">
-          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Satış</span><b>{tr_money(summary['sales'])}</b></div>
-          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Komisyon</span><b>{tr_money(summary['comm'])}</b></div>
-          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>İndirim</span><b>{tr_money(summary['disc'])}</b></div>
-          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Fatura</span><b>{tr_money(summary['inv'])}</b></div>
-          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Maliyet</span><b>{tr_money(summary['cost'])}</b></div>
-          <div class="p-3 rounded-xl bg-orange-50 border border-orange-200 flex justify-between"><span class="text-orange-700">Tahmini Gerçek Net</span><b class="text-orange-800">{tr_money(summary['real_net'])}</b></div>
+          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Beklenen</span><b>{tr_money(t['expected'])}</b></div>
+          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Yatan (toplam)</span><b>{tr_money(t['paid'])}</b></div>
+          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Fark ({t['diff_orders']} sipariş)</span><b class="{_diff_cls(t['diff'])}">{tr_money(t['diff'])}</b></div>
+          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Eşleşmeyen ({int(t['unmatched_n'])})</span><b>{tr_money(t['unmatched'])}</b></div>
+          <div class="p-3 rounded-xl bg-slate-50 border flex justify-between"><span>Diğer hareketler</span><b>{tr_money(t['other'])}</b></div>
+          <div class="p-3 rounded-xl bg-orange-50 border border-orange-200 flex justify-between"><span class="text-orange-700">Gelmeyen ({int(t['missing_n'])})</span><b class="text-orange-800">{tr_money(t['missing'])}</b></div>
         </div>
       </div>
     </div>
-    """
-    return ui_shell("Hakediş", body, active="payouts")
+
+    <div class="mt-3 grid lg:grid-cols-2 gap-3">
+      <div class="p-4 rounded-2xl bg-white border shadow-sm">
+        <div class="font-extrabold">En büyük farklar</div>
+        <div class="mt-3 overflow-auto rounded-xl border">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-100"><tr>
+              <th class="text-left p-2">Sipariş</th><th class="text-left p-2">Tür</th><th class="text-left p-2">Gün</th>
+              <th class="text-right p-2">Beklenen</th><th class="text-right p-2">Yatan</th><th class="text-right p-2">Fark</th>
+            </tr></thead>
+            <tbody class="divide-y">
+        """
+        yield from render_rows(PAYOUT_DIFF_ROW_TPL, (
+            {**_money_row(r, ("expected", "actual", "diff")), "kind": _SETTLEMENT_KINDS[r["kind"]], "diff_cls": _diff_cls(r["diff"])}
+            for r in rec["diffs"]
+        ), colspan=6, empty="Fark yok.")
+        yield """
+            </tbody>
+          </table>
+        </div>
+      </div>
+      <div class="p-4 rounded-2xl bg-white border shadow-sm">
+        <div class="font-extrabold">Gelmeyen ödemeler</div>
+        <div class="mt-3 overflow-auto rounded-xl border">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-100"><tr>
+              <th class="text-left p-2">Sipariş</th><th class="text-left p-2">Sipariş günü</th>
+              <th class="text-left p-2">Vade</th><th class="text-right p-2">Beklenen</th>
+            </tr></thead>
+            <tbody class="divide-y">
+        """
+        yield from render_rows(PAYOUT_MISSING_ROW_TPL, (_money_row(r, ("expected",)) for r in rec["missing"]),
+                               colspan=4, empty="Vadesi gelip ödenmeyen sipariş yok.")
+        yield """
+            </tbody>
+          </table>
+        </div>
+      </div>
+    </div>
+        """
+
+    resp = stream_page("Hakediş", chunks(), active="payouts", etag=etag)
+    resp.headers.update(page_headers(etag, last_modified, err))
+    return resp
 
 
+CAMPAIGN_ROW_TPL = """
+        <tr class="border-b bg-white">
+          <td class="p-2 font-semibold">#{campaign}</td>
+          <td class="p-2 text-right">{qty}</td>
+          <td class="p-2 text-right">{sales}</td>
+          <td class="p-2 text-right">{comm}</td>
+          <td class="p-2 text-right">{disc}</td>
+          <td class="p-2 text-right">{inv}</td>
+          <td class="p-2 text-right">{cost}</td>
+          <td class="p-2 text-right font-extrabold"><span class="px-2 py-1 rounded-xl border {badge}">{real_net_s}</span></td>
+        </tr>
+        """
+
+def _campaign_row(r: dict) -> dict:
+    badge = "bg-red-50 text-red-700 border-red-200" if r["real_net"] < 0 else "bg-emerald-50 text-emerald-700 border-emerald-200"
+    return {**_money_row(r, ("sales", "comm", "disc", "inv", "cost")), "badge": badge, "real_net_s": tr_money(r["real_net"])}
+
 @app.get("/app/campaigns", response_class=HTMLResponse)
-def app_campaigns(
+async def app_campaigns(
+    request: Request,
     start: str = Query(default=""),
     end: str = Query(default=""),
     auth=Depends(panel_auth)
 ):
+    etag, last_modified = await run_in_threadpool(data_etag, request, ("orders", "costs"))
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
     today = date.today()
     if not start:
         start_dt = datetime.combine(today - timedelta(days=30), datetime.min.time())
@@ -1834,52 +6330,7 @@ def app_campaigns(
     else:
         end_dt = datetime.fromisoformat(end) + timedelta(days=1) - timedelta(milliseconds=1)
 
-    err = ""
-    rows = []
-    try:
-        lines = _try_fetch_lines(start_dt, end_dt, max_pages=40)
-        agg = {}
-        for x in lines:
-            camp = x.get("campaign") or "0"
-            key = str(camp)
-            a = agg.setdefault(key, {"campaign": key, "qty": 0, "sales": 0.0, "comm": 0.0, "disc": 0.0, "inv": 0.0, "net": 0.0, "cost": 0.0, "real_net": 0.0})
-            q = float(x.get("qty", 1) or 1)
-            a["qty"] += int(q)
-            a["sales"] += x.get("satis", 0.0)
-            a["comm"] += x.get("komisyon", 0.0)
-            a["disc"] += x.get("satici_indirim", 0.0)
-            a["inv"] += x.get("fatura", 0.0)
-            a["net"] += x.get("net_kar", 0.0)
-            cost = float(x.get("unit_cost", 0.0)) * q
-            a["cost"] += cost
-            a["real_net"] += x.get("net_kar", 0.0) - cost
-        rows = sorted(agg.values(), key=lambda r: r.get("real_net", 0.0))
-    except Exception as e:
-        err = str(e)
-
-    def tr_money(v: float) -> str:
-        try:
-            return f"{float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        except Exception:
-            return str(v)
-
-    body_rows = ""
-    for r in rows:
-        badge = "bg-red-50 text-red-700 border-red-200" if r["real_net"] < 0 else "bg-emerald-50 text-emerald-700 border-emerald-200"
-        body_rows += f"""
-        <tr class="border-b bg-white">
-          <td class="p-2 font-semibold">#{r['campaign']}</td>
-          <td class="p-2 text-right">{r['qty']}</td>
-          <td class="p-2 text-right">{tr_money(r['sales'])}</td>
-          <td class="p-2 text-right">{tr_money(r['comm'])}</td>
-          <td class="p-2 text-right">{tr_money(r['disc'])}</td>
-          <td class="p-2 text-right">{tr_money(r['inv'])}</td>
-          <td class="p-2 text-right">{tr_money(r['cost'])}</td>
-          <td class="p-2 text-right font-extrabold"><span class="px-2 py-1 rounded-xl border {badge}">{tr_money(r['real_net'])}</span></td>
-        </tr>
-        """
-
-    body = f"""
+    head = f"""
     <div class="p-4 rounded-2xl bg-white border shadow-sm">
       <div class="flex flex-wrap gap-3 items-end justify-between">
         <div>
@@ -1898,9 +6349,33 @@ def app_campaigns(
           <button class="px-4 py-2 rounded-xl bg-slate-900 text-white font-extrabold shadow-sm" type="submit">Getir</button>
         </form>
       </div>
+        """
 
-      {("<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: "+err+"</div>") if err else ""}
-
+    def body(lines, err):
+        rows = []
+        try:
+            with span("compute.aggregate", lines=len(lines)):
+                agg = {}
+                for x in lines:
+                    camp = x.get("campaign") or "0"
+                    key = str(camp)
+                    a = agg.setdefault(key, {"campaign": key, "qty": 0, "sales": 0.0, "comm": 0.0, "disc": 0.0, "inv": 0.0, "net": 0.0, "cost": 0.0, "real_net": 0.0})
+                    q = float(x.get("qty", 1) or 1)
+                    a["qty"] += int(q)
+                    a["sales"] += x.get("satis", 0.0)
+                    a["comm"] += x.get("komisyon", 0.0)
+                    a["disc"] += x.get("satici_indirim", 0.0)
+                    a["inv"] += x.get("fatura", 0.0)
+                    a["net"] += x.get("net_kar", 0.0)
+                    cost = float(x.get("unit_cost", 0.0)) * q
+                    a["cost"] += cost
+                    a["real_net"] += x.get("net_kar", 0.0) - cost
+                rows = sorted(agg.values(), key=lambda r: r.get("real_net", 0.0))
+        except Exception as e:
+            err = str(e)
+
+        yield error_box(err)
+        yield """
       <div class="mt-4 overflow-auto rounded-xl border">
         <table class="min-w-full text-sm">
           <thead class="bg-slate-100 sticky top-0">
@@ -1916,7 +6391,9 @@ def app_campaigns(
             </tr>
           </thead>
           <tbody class="divide-y">
-            {body_rows if body_rows else "<tr><td class='p-3 text-slate-500' colspan='8'>Kayıt yok.</td></tr>"}
+        """
+        yield from render_rows(CAMPAIGN_ROW_TPL, (_campaign_row(r) for r in rows), colspan=8)
+        yield """
           </tbody>
         </table>
       </div>
@@ -1925,29 +6402,22 @@ def app_campaigns(
         İpucu: Gerçek Net <b>eksi</b> olan kampanyalarda fiyat/indirim/komisyonu gözden geçir.
       </div>
     </div>
-    """
-    return ui_shell("Kampanyalar", body, active="campaigns")
+        """
 
+    def fetch():
+        return fetch_lines_async(start_dt, end_dt, max_pages=40)
 
-@app.get("/app/costs", response_class=HTMLResponse)
-def app_costs(auth=Depends(panel_auth)):
-    costs = []
-    err = ""
-    try:
-        conn = db()
-        cur = conn.cursor()
-        cur.execute("SELECT merchant_sku, cost, updated_at FROM sku_costs ORDER BY merchant_sku")
-        costs = cur.fetchall()
-    except Exception as e:
-        err = str(e)
+    data, err = await prefetch(fetch)
+    resp = stream_page("Kampanyalar", render_fetched(head, data, err, body), active="campaigns", etag=etag)
+    resp.headers.update(page_headers(etag, last_modified, err, data))
+    return resp
 
-    rows = ""
-    for sku, cost, upd in (costs or []):
-        rows += f"""
+
+COST_ROW_TPL = """
         <tr class="border-b bg-white">
           <td class="p-2 font-semibold">{sku}</td>
-          <td class="p-2 text-right">{float(cost):.2f}</td>
-          <td class="p-2 text-slate-500 text-xs">{upd or ""}</td>
+          <td class="p-2 text-right">{cost:.2f}</td>
+          <td class="p-2 text-slate-500 text-xs">{upd}</td>
           <td class="p-2">
             <form method="post" action="/costs/delete" onsubmit="return confirm('Silinsin mi?');">
               <input type="hidden" name="merchant_sku" value="{sku}"/>
@@ -1957,7 +6427,10 @@ def app_costs(auth=Depends(panel_auth)):
         </tr>
         """
 
-    body = f"""
+@app.get("/app/costs", response_class=HTMLResponse)
+def app_costs(auth=Depends(panel_auth)):
+    def chunks():
+        yield """
     <div class="grid lg:grid-cols-3 gap-3">
       <div class="lg:col-span-1 p-4 rounded-2xl bg-white border shadow-sm">
         <div class="font-extrabold text-lg">SKU Maliyet Ekle</div>
@@ -1981,16 +6454,29 @@ def app_costs(auth=Depends(panel_auth)):
         </div>
       </div>
 
+"""
+        conn = None
+        err = ""
+        total = 0
+        try:
+            # generator her yield'den sonra başka thread'de sürebilir: bağlantı thread'e bağlanmaz
+            # (aynı anda tek thread kullanır)
+            conn = db(check_same_thread=False)
+            total = conn.execute("SELECT COUNT(*) FROM sku_costs").fetchone()[0]
+        except Exception as e:
+            err = str(e)
+
+        yield f"""
       <div class="lg:col-span-2 p-4 rounded-2xl bg-white border shadow-sm">
         <div class="flex items-end justify-between gap-2">
           <div>
             <div class="font-extrabold text-lg">Maliyet Listesi</div>
-            <div class="text-xs text-slate-500">Toplam: {len(costs or [])} SKU</div>
+            <div class="text-xs text-slate-500">Toplam: {total} SKU</div>
           </div>
           <a class="px-4 py-2 rounded-xl bg-white border font-extrabold hover:bg-slate-50" href="/app/profit">Kârlılığa Git</a>
         </div>
 
-        {("<div class='mt-3 p-3 rounded-xl bg-red-50 border border-red-200 text-red-700 text-sm'>Hata: "+err+"</div>") if err else ""}
+        {error_box(err)}
 
         <div class="mt-4 overflow-auto rounded-xl border">
           <table class="min-w-full text-sm">
@@ -2003,14 +6489,27 @@ def app_costs(auth=Depends(panel_auth)):
               </tr>
             </thead>
             <tbody class="divide-y">
-              {rows if rows else "<tr><td class='p-3 text-slate-500' colspan='4'>Henüz maliyet yok.</td></tr>"}
+        """
+        try:
+            rows = ()
+            if conn is not None and not err:
+                rows = (
+                    {"sku": sku, "cost": float(cost), "upd": upd or ""}
+                    for sku, cost, upd in conn.execute("SELECT merchant_sku, cost, updated_at FROM sku_costs ORDER BY merchant_sku")
+                )
+            yield from render_rows(COST_ROW_TPL, rows, colspan=4, empty="Henüz maliyet yok.")
+        finally:
+            if conn is not None:
+                conn.close()
+        yield """
             </tbody>
           </table>
         </div>
       </div>
     </div>
-    """
-    return ui_shell("Maliyetler", body, active="profit")
+        """
+
+    return stream_page("Maliyetler", chunks(), active="profit")
 
 
 @app.post("/costs/upsert")
@@ -2024,6 +6523,76 @@ def costs_delete(merchant_sku: str = Form(...), auth=Depends(panel_auth)):
     delete_cost(merchant_sku)
     return RedirectResponse(url="/app/costs", status_code=303)
 
+def _opt_float(v: str) -> Optional[float]:
+    v = (v or "").strip().replace(",", ".")
+    return float(v) if v else None
+
+@app.post("/pricing/params")
+def pricing_params(
+    merchant_sku: str = Form(...),
+    commission_rate: str = Form(default=""),
+    target_margin: str = Form(default=""),
+    sale_price: str = Form(default=""),
+    auth=Depends(panel_auth),
+):
+    try:
+        upsert_sku_pricing(merchant_sku, _opt_float(commission_rate), _opt_float(target_margin), _opt_float(sale_price))
+    except ValueError as e:
+        raise HTTPException(400, f"Geçersiz fiyat parametresi: {e}")
+    return RedirectResponse(url=f"/app/pricing?q={merchant_sku.strip()}", status_code=303)
+
+@app.get("/pricing/sku-stats")
+def pricing_sku_stats(sku: list[str] = Query(...), auth=Depends(panel_auth)):
+    """Gözlenen komisyon / indirim oranları ve ortalama fiyat (sku_stats, PK ile)."""
+    return get_sku_stats([x.strip() for x in sku])
+
+@app.get("/pricing/batch")
+def pricing_batch(
+    commission_rate: float = Query(default=PRICING_DEFAULT_COMMISSION, ge=0.0, le=1.0),
+    target_margin: float = Query(default=0.15, ge=0.0, le=5.0),
+    only: str = Query(default="all"),
+    q: str = Query(default=""),
+    sort: str = Query(default="gap"),
+    desc: bool = Query(default=False),
+    limit: int = Query(default=500, ge=1, le=100_000),
+    auth=Depends(panel_auth),
+):
+    q = q.strip()
+    return {
+        "params": {"commission_rate": commission_rate, "target_margin": target_margin, "invoice_rate": INVOICE_RATE},
+        "summary": pricing_summary(commission_rate, target_margin, q),
+        "rows": list(price_catalogue(commission_rate, target_margin, only, q, sort, desc, limit)),
+    }
+
+async def _pricing_csv(batches):
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=";")
+    buf.write("\ufeff")  # Excel UTF-8'i tanısın
+    w.writerow(PRICING_COLUMNS)
+    async for rows in batches:
+        for r in rows:
+            w.writerow(["" if r[k] is None else (round(r[k], 4) if isinstance(r[k], float) else r[k]) for k in PRICING_COLUMNS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+@app.get("/pricing/batch.csv")
+def pricing_batch_csv(
+    commission_rate: float = Query(default=PRICING_DEFAULT_COMMISSION, ge=0.0, le=1.0),
+    target_margin: float = Query(default=0.15, ge=0.0, le=5.0),
+    only: str = Query(default="all"),
+    q: str = Query(default=""),
+    sort: str = Query(default="gap"),
+    desc: bool = Query(default=False),
+    auth=Depends(panel_auth),
+):
+    batches = price_catalogue_batches(commission_rate, target_margin, only, q.strip(), sort, desc)
+    return StreamingResponse(
+        _pricing_csv(batches), media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="fiyat_katalog_{date.today().isoformat()}.csv"'},
+    )
+
 # =========================
 # FATURA API
 # =========================
@@ -2038,10 +6607,12 @@ def invoice_draft(orderNumber: str = Form(...), auth=Depends(panel_auth)):
     if existing:
         return RedirectResponse(url="/app/invoices", status_code=303)
 
-    # ✅ Trendyol’dan sağlam bul
-    o = find_order_by_number(orderNumber)
+    # ✅ Trendyol’dan hızlı bul (orderNumber filtresi); bulunamazsa 365 günlük tarama arka plan işine
+    with upstream_lane("interactive"):
+        o = find_order_by_number(orderNumber, deep=False)
     if not o:
-        raise HTTPException(404, f"Sipariş bulunamadı: {orderNumber}. Debug: /debug/find-order?orderNumber={orderNumber}")
+        job_id = submit_job("find_order", {"orderNumber": orderNumber, "create_draft": True}, priority=1)
+        return RedirectResponse(url=f"/app/jobs?highlight={job_id}", status_code=303)
 
     _ = create_invoice_draft_from_order(o)
     return RedirectResponse(url="/app/invoices", status_code=303)
@@ -2072,3 +6643,171 @@ def invoice_pdf(invoice_id: int, auth=Depends(panel_auth)):
     pdf_path = build_pdf(inv, lines)
     filename = f"earshiv_{inv['order_number']}_{inv['invoice_uuid']}.pdf"
     return FileResponse(pdf_path, filename=filename, media_type="application/pdf")
+
+# =========================
+# İŞLER (JOBS) API
+# =========================
+def _job_public(job: dict) -> dict:
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "params": job["params"],
+        "priority": job["priority"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"] or "",
+        "error": job["error"] or "",
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "download": f"/jobs/{job['id']}/download" if job["status"] == "done" else None,
+    }
+
+@app.post("/jobs")
+def jobs_submit(
+    kind: str = Form(...),
+    start: str = Form(default=""),
+    end: str = Form(default=""),
+    orderNumber: str = Form(default=""),
+    priority: int = Form(default=5, ge=0, le=9),
+    auth=Depends(panel_auth)
+):
+    if kind in ("report_excel", "lines_csv"):
+        if not start or not end:
+            raise HTTPException(400, "start / end zorunlu")
+        date_range_to_ms(start, end)  # format kontrolü
+        params = {"start": start, "end": end}
+    elif kind == "find_order":
+        orderNumber = (orderNumber or "").strip()
+        if not orderNumber:
+            raise HTTPException(400, "orderNumber boş olamaz")
+        params = {"orderNumber": orderNumber}
+    else:
+        raise HTTPException(400, f"Bilinmeyen iş türü: {kind}")
+    job_id = submit_job(kind, params, priority=priority)
+    return _job_public(get_job(job_id))
+
+@app.get("/jobs")
+def jobs_list(limit: int = Query(default=50, ge=1, le=500), auth=Depends(panel_auth)):
+    conn = db()
+    rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    out = []
+    for r in rows:
+        job = dict(r)
+        job["params"] = json.loads(job["params"] or "{}")
+        out.append(_job_public(job))
+    return {"adet": len(out), "jobs": out}
+
+@app.get("/jobs/{job_id}")
+def jobs_get(job_id: str, auth=Depends(panel_auth)):
+    return _job_public(get_job(job_id))
+
+@app.post("/jobs/{job_id}/cancel")
+def jobs_cancel(job_id: str, auth=Depends(panel_auth)):
+    return _job_public(cancel_job(job_id))
+
+@app.get("/jobs/{job_id}/download")
+def jobs_download(job_id: str, auth=Depends(panel_auth)):
+    job = get_job(job_id)
+    if job["status"] != "done":
+        raise HTTPException(409, f"İş henüz bitmedi (durum: {job['status']})")
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        raise HTTPException(410, "Sonuç dosyası silinmiş, işi tekrar başlat.")
+    return FileResponse(job["result_path"], filename=job["result_name"], media_type=job["media_type"])
+
+# =========================
+# SENKRON API
+# =========================
+def _sync_status(seller_id: str) -> dict:
+    with seller_scope(seller_id):
+        state = get_sync_state()
+        conn = db()
+        packages = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        lines = conn.execute("SELECT COUNT(*) FROM order_lines").fetchone()[0]
+        claims = conn.execute("SELECT COUNT(*) FROM claims").fetchone()[0]
+        settlements = conn.execute("SELECT COUNT(*) FROM settlements").fetchone()[0]
+        conn.close()
+    return {
+        "seller": seller_id,
+        "title": seller_info(seller_id)["title"],
+        "running": seller_id in SYNC_STATE["threads"],
+        "packages": packages,
+        "lines": lines,
+        "claims": claims,
+        "settlements": settlements,
+        "last_ok": state.get("last_ok"),
+        "last_error": state.get("last_error") or "",
+        "last_counts": state.get("last_counts") or {},
+        "last_seconds": state.get("last_seconds"),
+    }
+
+@app.get("/sync/status")
+def sync_status(auth=Depends(panel_auth)):
+    return {"interval_seconds": SYNC_INTERVAL_SECONDS, "sellers": [_sync_status(sid) for sid in SELLERS]}
+
+def _wake_sync() -> str:
+    # aktif satıcının worker'ını aralığın dolmasını beklemeden uyandırır
+    sid = current_seller_id()
+    wake = SYNC_STATE["wake"].get(sid)
+    if wake is None:
+        raise HTTPException(409, "Bu satıcı için senkron çalışmıyor (SYNC_INTERVAL_SECONDS=0 ya da API bilgisi eksik).")
+    wake.set()
+    return sid
+
+@app.post("/sync/run")
+def sync_run(auth=Depends(panel_auth)):
+    return {"ok": True, "seller": _wake_sync()}
+
+@app.post("/app/sync/run")
+def app_sync_run(auth=Depends(panel_auth)):
+    _wake_sync()
+    return RedirectResponse(url="/app/settings", status_code=303)
+
+@app.get("/events")
+async def events_stream(
+    request: Request,
+    start: str = Query(default=""),
+    end: str = Query(default=""),
+    auth=Depends(panel_auth),
+):
+    """SSE: önce aralığın depo snapshot'ı (event: snapshot), sonra senkron farkları (event: orders / sync)."""
+    if HUB.clients() >= EVENTS_MAX_CLIENTS:
+        raise HTTPException(503, "Çok fazla canlı bağlantı var, biraz sonra tekrar deneyin.")
+    start = start or date.today().isoformat()
+    end = end or start
+    date_range_to_ms(start, end)
+    sid = current_seller_id()
+    sub = await HUB.subscribe(sid)
+    try:
+        snap = await run_in_threadpool(events_snapshot, start, end)
+    except Exception:
+        HUB.unsubscribe(sid, sub)
+        raise
+
+    async def body():
+        last = snap["id"]
+        try:
+            yield f"retry: 3000\nid: {last}\nevent: snapshot\ndata: {json.dumps(snap, ensure_ascii=False)}\n\n"
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if ev is None:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                event_id, kind, payload = ev
+                if event_id <= last:
+                    continue  # snapshot'ta zaten var
+                last = event_id
+                metric_inc("sse_events_total", kind=kind)
+                yield f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+        finally:
+            HUB.unsubscribe(sid, sub)
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,508 @@
+"""
+Yerel Trendyol sipariş API mock'u (performans ölçümü / geliştirme için).
+
+Gerçek api.trendyol.com yerine:
+    python mock_trendyol.py --lines 100000 --latency-ms 120 --rate-429 0.02
+    TRENDYOL_BASE_URL=http://127.0.0.1:8900 uvicorn main:app
+
+Siparişler bellekte tutulmaz; sıra numarasından deterministik üretilir
+(1M satırda da sabit bellek). Her satıcı id'si (URL'deki suppliers/{id}) aynı
+boyutta ama farklı tohumlu bir defter görür: çoklu mağaza testinde veriler ayrışır.
+Desteklenenler:
+  GET  /sapigw/suppliers/{id}/orders   page/size/startDate/endDate/orderNumber,
+                                        orderByField=LastModifiedDate (size=1 filigran sorgusu)
+  GET  /sapigw/suppliers/{id}/claims   page/size/startDate/endDate (claimDate'e göre); iadeli
+                                        satırlar siparişten 3-20 gün sonra, saat ilerledikçe
+                                        görünür, 2 gün sonra Accepted olur
+  GET  /integration/finance/che/sellers/{id}/settlements
+                                        page/size/startDate/endDate/transactionType (Sale|Return);
+                                        satış teslimde (sipariş + 2-6 gün), iade kabulde hesaba
+                                        geçer. Her 53. satırda komisyon fazla kesilir, her 41.
+                                        sipariş hiç ödenmez (mutabakatta fark / gelmeyen)
+  GET  /__stats                         istek / sayfa / 429 sayaçları
+  POST /__reset                         sayaçları sıfırla
+  POST /__config                        JSON ile ayar değiştir (lines, latency_ms, rate_429, rate_5xx ...)
+
+Bench script'leri aynı process içinde MockTrendyol(...).start() ile kullanır.
+"""
+import argparse, json, random, re, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DAY_MS = 86_400_000
+ORDERS_PATH = re.compile(r"^/sapigw/suppliers/([^/]+)/orders/?$")
+CLAIMS_PATH = re.compile(r"^/sapigw/suppliers/([^/]+)/claims/?$")
+CLAIM_DELAY_DAYS = (3, 20)  # iade talebi siparişten kaç gün sonra açılır (min, max)
+SETTLEMENTS_PATH = re.compile(r"^/integration/finance/che/sellers/([^/]+)/settlements/?$")
+MAX_PAGE_SIZE = 200
+
+PRODUCTS = [
+    ("Pamuklu Tişört", 249.90), ("Kot Pantolon", 599.00), ("Spor Ayakkabı", 1299.00),
+    ("Deri Cüzdan", 349.50), ("Kapüşonlu Sweatshirt", 449.00), ("Yün Atkı", 189.90),
+    ("Sırt Çantası", 799.00), ("Güneş Gözlüğü", 299.00), ("Keten Gömlek", 399.90),
+    ("Çorap 3'lü", 89.90), ("Termos 500ml", 279.00), ("Telefon Kılıfı", 129.00),
+]
+CITIES = [("İstanbul", "Kadıköy"), ("Ankara", "Çankaya"), ("İzmir", "Bornova"), ("Bursa", "Nilüfer"), ("Antalya", "Muratpaşa")]
+NAMES = [("Ayşe", "Yılmaz"), ("Mehmet", "Kaya"), ("Zeynep", "Demir"), ("Can", "Şahin"), ("Elif", "Çelik"), ("Emre", "Arslan")]
+
+
+def lines_for(i: int) -> int:
+    # 15 siparişlik periyotta 23 satır: çoğu tek satır, bir kısmı 2-3 satırlı
+    return 1 + (i % 3 == 0) + (i % 5 == 0)
+
+
+class OrderBook:
+    """Sıra numarası -> sipariş. i=0 en yeni; orderDate = anchor - i*step."""
+
+    def __init__(self, lines: int = 10_000, days: int = 90, seed: int = 1, anchor_ms: int | None = None):
+        self.orders = max(1, -(-lines * 15 // 23))
+        self.days = days
+        self.seed = seed
+        self.anchor = anchor_ms or int(time.time() * 1000)
+        self.step = max(1, days * DAY_MS // self.orders)
+
+    def order_number(self, i: int) -> str:
+        return str(10_000_000 + i)
+
+    def index_of(self, order_number: str) -> int | None:
+        try:
+            i = int(str(order_number).strip()) - 10_000_000
+        except ValueError:
+            return None
+        return i if 0 <= i < self.orders else None
+
+    def index_range(self, start_ms: int | None, end_ms: int | None) -> tuple[int, int]:
+        """[lo, hi) — tarih aralığına düşen sıra numaraları."""
+        lo, hi = 0, self.orders
+        if end_ms is not None and end_ms < self.anchor:
+            lo = max(lo, -(-(self.anchor - end_ms) // self.step))
+        if start_ms is not None:
+            hi = min(hi, (self.anchor - start_ms) // self.step + 1)
+        return lo, max(lo, hi)
+
+    def order(self, i: int) -> dict:
+        rnd = random.Random(self.seed * 1_000_003 + i)
+        order_date = self.anchor - i * self.step
+        first, last = NAMES[i % len(NAMES)]
+        city, district = CITIES[i % len(CITIES)]
+        status = "Delivered" if i % 11 else rnd.choice(["Cancelled", "Returned", "Shipped"])
+        lines = []
+        total = 0.0
+        for j in range(lines_for(i)):
+            p = (i * 7 + j * 3) % len(PRODUCTS)
+            name, list_price = PRODUCTS[p]
+            qty = 1 if rnd.random() < 0.85 else 2
+            price = round(list_price * qty, 2)
+            seller_disc = round(price * rnd.choice((0, 0, 0.05, 0.10)), 2)
+            ty_disc = round(price * rnd.choice((0, 0, 0, 0.05)), 2)
+            details = []
+            if seller_disc or ty_disc:
+                # discountDetails ağır satırlar: indirim birden fazla kaleme bölünür
+                parts = 1 + (i + j) % 3
+                for _ in range(parts * qty):
+                    details.append({
+                        "lineItemPrice": round((price - seller_disc - ty_disc) / (parts * qty), 2),
+                        "lineItemSellerDiscount": round(seller_disc / (parts * qty), 2),
+                        "lineItemTyDiscount": round(ty_disc / (parts * qty), 2),
+                    })
+            line_status = "Returned" if (status == "Returned" or rnd.random() < 0.03) else status
+            lines.append({
+                "id": i * 10 + j,
+                "productName": name,
+                "merchantSku": f"SKU-{p:03d}",
+                "sku": f"TY{p:05d}",
+                "barcode": f"869{p:010d}",
+                "quantity": qty,
+                "price": price,
+                "amount": price,
+                "commission": round(price * (0.12 + 0.01 * (p % 6)), 2),
+                "discountDetails": details,
+                "salesCampaignId": (i // 500) % 4,
+                "orderLineItemStatusName": line_status,
+                "currencyCode": "TRY",
+            })
+            total += price - seller_disc
+        return {
+            "shipmentPackageId": 500_000_000 + i,
+            "orderNumber": self.order_number(i),
+            "orderDate": order_date,
+            "lastModifiedDate": order_date + (i % 5) * 3_600_000,
+            "status": status,
+            "customerFirstName": first,
+            "customerLastName": last,
+            "invoiceAddress": {
+                "fullName": f"{first} {last}",
+                "taxNumber": "" if i % 4 else f"{1_000_000_000 + i % 9_000_000_000}",
+                "fullAddress": f"Örnek Mah. {i % 200} Sk. No:{i % 50}",
+                "city": city,
+                "district": district,
+            },
+            "totalPrice": round(total, 2),
+            "currencyCode": "TRY",
+            "lines": lines,
+        }
+
+    def claim(self, i: int) -> dict | None:
+        """i. siparişin iade talebi (Returned satırları varsa); claimDate = orderDate + 3..20 gün."""
+        o = self.order(i)
+        returned = [l for l in o["lines"] if l["orderLineItemStatusName"] == "Returned"]
+        if not returned:
+            return None
+        claim_date = self.claim_date(i, o["orderDate"])
+        accepted = time.time() * 1000 - claim_date > 2 * DAY_MS
+        status = "Accepted" if accepted else "WaitingInAction"
+        items = []
+        for l in returned:
+            unit = round(l["price"] / l["quantity"], 2)
+            items.append({
+                "orderLine": {"id": l["id"], "productName": l["productName"], "merchantSku": l["merchantSku"],
+                              "barcode": l["barcode"], "price": unit, "salesCampaignId": l["salesCampaignId"]},
+                "claimItems": [{
+                    "id": f"{l['id']}-{k}",
+                    "orderLineItemId": l["id"] * 10 + k,
+                    "customerClaimItemReason": {"name": ("Beden uymadı", "Vazgeçtim", "Kusurlu ürün")[(i + k) % 3]},
+                    "claimItemStatus": {"name": status},
+                    "resolved": accepted,
+                } for k in range(l["quantity"])],
+            })
+        return {
+            "id": f"CLM-{o['shipmentPackageId']}",
+            "orderNumber": o["orderNumber"],
+            "orderDate": o["orderDate"],
+            "orderShipmentPackageId": o["shipmentPackageId"],
+            "claimDate": claim_date,
+            "lastModifiedDate": claim_date + (2 * DAY_MS if accepted else 0),
+            "customerFirstName": o["customerFirstName"],
+            "customerLastName": o["customerLastName"],
+            "items": items,
+        }
+
+    def claim_date(self, i: int, order_date: int) -> int:
+        lo, hi = CLAIM_DELAY_DAYS
+        return order_date + (lo + (i * 7) % (hi - lo + 1)) * DAY_MS
+
+    def settlements(self, i: int) -> list[dict]:
+        """i. siparişin cari hesap hareketleri: satır başına Sale, iade edilen satıra Return."""
+        if i % 41 == 7:
+            return []
+        o = self.order(i)
+        sale_date = o["orderDate"] + (2 + i % 5) * DAY_MS
+        return_date = self.claim_date(i, o["orderDate"]) + 2 * DAY_MS
+        out = []
+        for l in o["lines"]:
+            if l["orderLineItemStatusName"] == "Cancelled":
+                continue
+            credit = round(l["price"] - sum(d["lineItemSellerDiscount"] for d in l["discountDetails"]), 2)
+            commission = l["commission"]
+            if l["id"] % 53 == 0:
+                commission = round(commission + l["price"] * 0.02, 2)
+            base = {"orderNumber": o["orderNumber"], "shipmentPackageId": o["shipmentPackageId"], "barcode": l["barcode"],
+                    "commissionRate": round(l["commission"] / l["price"] * 100, 2), "country": "Türkiye"}
+            out.append(dict(base, id=f"S-{l['id']}", transactionDate=sale_date, transactionType="Sale",
+                            description="Satış", credit=credit, debt=0.0, commissionAmount=commission,
+                            sellerRevenue=round(credit - commission, 2), paymentDate=sale_date + 7 * DAY_MS,
+                            paymentOrderId=sale_date // (7 * DAY_MS)))
+            if l["orderLineItemStatusName"] == "Returned":
+                out.append(dict(base, id=f"R-{l['id']}", transactionDate=return_date, transactionType="Return",
+                                description="İade", credit=0.0, debt=credit, commissionAmount=-l["commission"],
+                                sellerRevenue=-round(credit - l["commission"], 2), paymentDate=return_date + 7 * DAY_MS,
+                                paymentOrderId=return_date // (7 * DAY_MS)))
+        return out
+
+    def settlements_between(self, start_ms: int | None, end_ms: int | None, kind: str | None = None) -> list[dict]:
+        now = int(time.time() * 1000)
+        end_ms = now if end_ms is None else min(end_ms, now)
+        max_delay = CLAIM_DELAY_DAYS[1] + 2
+        lo, hi = self.index_range(None if start_ms is None else start_ms - max_delay * DAY_MS, end_ms - 2 * DAY_MS)
+        out = [
+            t for i in range(lo, hi) for t in self.settlements(i)
+            if (start_ms is None or t["transactionDate"] >= start_ms) and t["transactionDate"] <= end_ms
+            and (not kind or t["transactionType"] == kind)
+        ]
+        out.sort(key=lambda t: (t["transactionDate"], t["id"]))
+        return out
+
+    def claims_between(self, start_ms: int | None, end_ms: int | None) -> list[dict]:
+        """claimDate aralığındaki (ve şu ana kadar açılmış) talepler, yeniden eskiye."""
+        now = int(time.time() * 1000)
+        end_ms = now if end_ms is None else min(end_ms, now)
+        lo_d, hi_d = CLAIM_DELAY_DAYS
+        lo, hi = self.index_range(None if start_ms is None else start_ms - hi_d * DAY_MS, end_ms - lo_d * DAY_MS)
+        out = []
+        for i in range(lo, hi):
+            c = self.claim(i)
+            if c and (start_ms is None or c["claimDate"] >= start_ms) and c["claimDate"] <= end_ms:
+                out.append(c)
+        out.sort(key=lambda c: -c["claimDate"])
+        return out
+
+    def total_lines(self) -> int:
+        full, rest = divmod(self.orders, 15)
+        return full * 23 + sum(lines_for(i) for i in range(rest))
+
+
+class MockTrendyol:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, lines: int = 10_000, days: int = 90,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0,
+                 rps_limit: float = 0.0, seed: int = 1, rate_5xx: float = 0.0):
+        self.host, self.port = host, port
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.rate_429, self.rps_limit = rate_429, rps_limit
+        self.rate_5xx = rate_5xx  # 1.0 = tam kesinti
+        self.seed = seed
+        self.book = OrderBook(lines, days, seed)
+        self.books: dict[str, OrderBook] = {}
+        self.listing_cache: dict[tuple, list] = {}  # claims / settlements: aynı aralığın sayfaları tekrar üretilmesin
+        self.lock = threading.Lock()
+        self.rnd = random.Random(seed)
+        self.server = None
+        self.reset()
+
+    # ---- ayar / sayaç ----
+    def configure(self, **kw):
+        with self.lock:
+            book_kw = {k: kw.pop(k) for k in ("lines", "days") if k in kw}
+            if book_kw:
+                self.book = OrderBook(book_kw.get("lines", self.book.total_lines()),
+                                      book_kw.get("days", self.book.days), self.seed)
+                self.books = {}
+                self.listing_cache = {}
+            for k, v in kw.items():
+                if not hasattr(self, k):
+                    raise ValueError(f"bilinmeyen ayar: {k}")
+                setattr(self, k, v)
+
+    def reset(self):
+        with self.lock:
+            self.counts = {"requests": 0, "pages": 0, "orders": 0, "bytes": 0, "throttled": 0, "failed": 0, "probes": 0,
+                           "lookups": 0, "claim_pages": 0, "settlement_pages": 0}
+            self.window = [time.monotonic(), 0]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.counts, "book_orders": self.book.orders, "book_lines": self.book.total_lines()}
+
+    def _throttle(self) -> float:
+        """429 verilecekse Retry-After (sn), yoksa 0."""
+        with self.lock:
+            self.counts["requests"] += 1
+            if self.rps_limit:
+                now = time.monotonic()
+                if now - self.window[0] >= 1.0:
+                    self.window = [now, 0]
+                self.window[1] += 1
+                if self.window[1] > self.rps_limit:
+                    self.counts["throttled"] += 1
+                    return max(0.05, 1.0 - (now - self.window[0]))
+            if self.rate_429 and self.rnd.random() < self.rate_429:
+                self.counts["throttled"] += 1
+                return 0.2
+        return 0.0
+
+    def book_for(self, supplier_id: str) -> OrderBook:
+        """Satıcıya özel defter: boyut / tarih ekseni self.book ile aynı, tohum satıcıdan."""
+        with self.lock:
+            book = self.books.get(supplier_id)
+            if book is None:
+                base = self.book
+                book = OrderBook(base.total_lines(), base.days, self.seed * 1_000_003 + zlib.crc32(supplier_id.encode()),
+                                 anchor_ms=base.anchor)
+                self.books[supplier_id] = book
+            return book
+
+    # ---- sipariş endpoint'i ----
+    def orders_page(self, q: dict, supplier_id: str = "") -> dict:
+        def arg(name, cast=int, default=None):
+            v = q.get(name)
+            try:
+                return cast(v[0]) if v else default
+            except ValueError:
+                return default
+
+        page = max(0, arg("page", default=0))
+        size = min(MAX_PAGE_SIZE, max(1, arg("size", default=50)))
+        book = self.book_for(supplier_id) if supplier_id else self.book
+        number = arg("orderNumber", str)
+        if number:
+            idx = book.index_of(number)
+            lo, hi = book.index_range(arg("startDate"), arg("endDate"))
+            indices = [idx] if idx is not None and lo <= idx < hi else []
+            with self.lock:
+                self.counts["lookups"] += 1
+        else:
+            lo, hi = book.index_range(arg("startDate"), arg("endDate"))
+            indices = range(lo, hi)
+            if arg("orderByField", str) == "LastModifiedDate" and size == 1:
+                with self.lock:
+                    self.counts["probes"] += 1
+        total = len(indices)
+        chunk = indices[page * size:(page + 1) * size]
+        content = [book.order(i) for i in chunk]
+        return {
+            "page": page,
+            "size": size,
+            "totalPages": (total + size - 1) // size,
+            "totalElements": total,
+            "content": content,
+        }
+
+    # ---- iade (claims) / cari hesap (settlements) endpoint'leri ----
+    def _listing_page(self, q: dict, supplier_id: str, kind: str, max_size: int = MAX_PAGE_SIZE) -> dict:
+        def arg(name, default=None):
+            v = q.get(name)
+            try:
+                return int(v[0]) if v else default
+            except ValueError:
+                return default
+
+        page = max(0, arg("page", 0))
+        size = min(max_size, max(1, arg("size", 50)))
+        book = self.book_for(supplier_id) if supplier_id else self.book
+        tx_type = (q.get("transactionType") or [""])[0]
+        key = (kind, supplier_id, arg("startDate"), arg("endDate"), tx_type)
+        with self.lock:
+            items = self.listing_cache.get(key)
+        if items is None:
+            if kind == "claims":
+                items = book.claims_between(key[2], key[3])
+            else:
+                items = book.settlements_between(key[2], key[3], tx_type)
+            with self.lock:
+                if len(self.listing_cache) > 16:
+                    self.listing_cache.clear()
+                self.listing_cache[key] = items
+        total = len(items)
+        return {
+            "page": page,
+            "size": size,
+            "totalPages": (total + size - 1) // size,
+            "totalElements": total,
+            "content": items[page * size:(page + 1) * size],
+        }
+
+    def claims_page(self, q: dict, supplier_id: str = "") -> dict:
+        return self._listing_page(q, supplier_id, "claims")
+
+    def settlements_page(self, q: dict, supplier_id: str = "") -> dict:
+        # gerçek API'de size 500 / 1000
+        return self._listing_page(q, supplier_id, "settlements", max_size=1000)
+
+    # ---- HTTP ----
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, code: int, payload, headers: dict | None = None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+                return len(body)
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                if u.path == "/__stats":
+                    return self._json(200, mock.stats())
+                m = ORDERS_PATH.match(u.path)
+                claims = CLAIMS_PATH.match(u.path)
+                settlements = SETTLEMENTS_PATH.match(u.path)
+                if not (m or claims or settlements):
+                    return self._json(404, {"error": "not found"})
+                if not self.headers.get("Authorization", "").startswith("Basic "):
+                    return self._json(401, {"error": "unauthorized"})
+                if mock.latency_ms or mock.jitter_ms:
+                    time.sleep((mock.latency_ms + random.uniform(0, mock.jitter_ms)) / 1000.0)
+                retry_after = mock._throttle()
+                if retry_after:
+                    return self._json(429, {"error": "Too Many Requests"}, {"Retry-After": f"{retry_after:.2f}"})
+                if mock.rate_5xx and random.random() < mock.rate_5xx:
+                    with mock.lock:
+                        mock.counts["failed"] += 1
+                    return self._json(503, {"error": "Service Unavailable"})
+                if claims or settlements:
+                    if claims:
+                        data, counter = mock.claims_page(parse_qs(u.query), claims.group(1)), "claim_pages"
+                    else:
+                        data, counter = mock.settlements_page(parse_qs(u.query), settlements.group(1)), "settlement_pages"
+                    self._json(200, data)
+                    with mock.lock:
+                        mock.counts[counter] += 1
+                    return
+                data = mock.orders_page(parse_qs(u.query), m.group(1))
+                n = self._json(200, data)
+                with mock.lock:
+                    mock.counts["pages"] += 1
+                    mock.counts["orders"] += len(data["content"])
+                    mock.counts["bytes"] += n
+
+            def do_POST(self):
+                u = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if u.path == "/__reset":
+                    mock.reset()
+                    return self._json(200, {"ok": True})
+                if u.path == "/__config":
+                    try:
+                        mock.configure(**json.loads(raw or b"{}"))
+                    except (ValueError, TypeError) as e:
+                        return self._json(400, {"error": str(e)})
+                    return self._json(200, mock.stats())
+                return self._json(404, {"error": "not found"})
+
+        return Handler
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "MockTrendyol":
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="mock-trendyol", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Trendyol sipariş API mock'u")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--lines", type=int, default=10_000, help="toplam sipariş satırı (1k-1M)")
+    ap.add_argument("--days", type=int, default=90, help="siparişlerin yayıldığı gün sayısı")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="rastgele 429 olasılığı (0-1)")
+    ap.add_argument("--rps-limit", type=float, default=0.0, help="saniyede istek limiti, aşınca 429 + Retry-After")
+    ap.add_argument("--rate-5xx", type=float, default=0.0, help="503 olasılığı (1 = kesinti)")
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+
+    mock = MockTrendyol(a.host, a.port, a.lines, a.days, a.latency_ms, a.jitter_ms, a.rate_429, a.rps_limit, a.seed, a.rate_5xx).start()
+    st = mock.stats()
+    print(f"mock trendyol: {mock.base_url}  ({st['book_orders']} sipariş / {st['book_lines']} satır, {a.days} gün)")
+    print(f"  TRENDYOL_BASE_URL={mock.base_url} uvicorn main:app")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()